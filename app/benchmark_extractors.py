@@ -0,0 +1,94 @@
+"""
+Compares the lot extractor backends on stored crops.
+
+    python -m app.benchmark_extractors                  # every data/*_debug/lots
+    python -m app.benchmark_extractors data/X_debug/lots --live --limit 40
+
+The LLM results are the reference: taken from the LLM cache by default
+(no cost), or requested live with --live (which also measures LLM throughput).
+Reports throughput per backend, and the OCR agreement with the reference on
+lot numbers and dimensions, overall and for the crops it would accept.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.extractor import ocr_extractor, extract_single_lot_data, get_cached_lot
+
+def _dims(result):
+    return sorted(str(d).replace(",", ".") for d in (result.get("dimensions") or []))
+
+def _same_number(a, b):
+    return a is not None and b is not None and str(a).strip() == str(b).strip()
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dirs", nargs="*", help="Lot crop directories (default: data/*_debug/lots)")
+    parser.add_argument("--live", action="store_true", help="Ask the LLM for the reference instead of the cache")
+    parser.add_argument("--limit", type=int, default=0, help="Max crops")
+    args = parser.parse_args()
+
+    dirs = args.dirs or sorted(glob.glob(os.path.join("data", "*_debug", "lots")))
+    crops = []
+    for lots_dir in dirs:
+        for path in sorted(glob.glob(os.path.join(lots_dir, "lote_*.png"))):
+            with open(path, "rb") as f:
+                crops.append((f.read(), os.path.basename(path)))
+    if args.limit:
+        crops = crops[:args.limit]
+    if not crops:
+        print("No crops found.")
+        return
+    print(f"{len(crops)} crops from {len(dirs)} directories")
+
+    # Reference (LLM)
+    reference = []
+    start = time.perf_counter()
+    for lot_bytes, lot_file in crops:
+        if args.live:
+            reference.append(await extract_single_lot_data(lot_bytes, lot_file))
+        else:
+            reference.append(await get_cached_lot(lot_bytes, lot_file))
+    llm_time = time.perf_counter() - start
+    if args.live:
+        print(f"LLM: {len(crops) / llm_time:.2f} crops/s ({llm_time:.1f}s, sequential)")
+
+    # OCR
+    if not ocr_extractor.available():
+        print("OCR backend unavailable (pytesseract / tesseract binary missing).")
+        return
+    start = time.perf_counter()
+    ocr_results = await ocr_extractor.extract(crops)
+    ocr_time = time.perf_counter() - start
+    ocr_extractor.shutdown()
+    print(f"OCR: {len(crops) / ocr_time:.2f} crops/s ({ocr_time:.2f}s, {ocr_extractor.workers} workers)")
+
+    compared = numbers_ok = dims_ok = accepted = accepted_ok = 0
+    for ref, ocr in zip(reference, ocr_results):
+        if not ref or "error" in ref:
+            continue
+        compared += 1
+        number_match = _same_number(ocr.get("lot_number"), ref.get("lot_number"))
+        numbers_ok += number_match
+        dims_ok += _dims(ocr) == _dims(ref)
+        if ocr.get("confidence", 0) >= settings.LOT_MIN_CONFIDENCE:
+            accepted += 1
+            accepted_ok += number_match and _dims(ocr) == _dims(ref)
+
+    if not compared:
+        print("No reference results (run with --live or extract these blocks first).")
+        return
+    print(f"Compared with the LLM on {compared} crops:")
+    print(f"  lot number agreement: {numbers_ok / compared:.1%}")
+    print(f"  dimensions agreement: {dims_ok / compared:.1%}")
+    print(f"  accepted at confidence >= {settings.LOT_MIN_CONFIDENCE}: {accepted / compared:.1%} of crops, "
+          f"{(accepted_ok / accepted if accepted else 0):.1%} fully correct")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""
+Measures page rendering for segmentation: time and peak memory per page.
+
+    python -m app.benchmark_render                    # every data/*.pdf
+    python -m app.benchmark_render plan.pdf --repeat 5
+
+Compares the previous path (pixmap -> JPEG bytes -> decode -> write
+full_map.jpg) with render_page (pixmap samples as the array, grayscale per
+RENDER_GRAYSCALE, full_map.jpg encoded once). Each variant runs in its own
+process so the peak RSS of one doesn't hide the other's.
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import fitz  # PyMuPDF
+from app.image_utils import load_image_from_bytes, render_page
+
+def jpeg_roundtrip(page, full_map_path):
+    pix = page.get_pixmap(matrix=fitz.Matrix(3, 3))
+    image_bytes = pix.tobytes("jpeg")
+    cv_image = load_image_from_bytes(image_bytes)
+    cv2.imwrite(full_map_path, cv_image)
+    return cv_image
+
+def zero_copy(page, full_map_path):
+    cv_image = render_page(page, zoom=3)
+    cv2.imwrite(full_map_path, cv_image)
+    return cv_image
+
+VARIANTS = {"jpeg_roundtrip": jpeg_roundtrip, "zero_copy": zero_copy}
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_variant(variant: str, pdf_path: str, repeat: int):
+    """Child process: prints {"ms", "peak_mb"} for one variant."""
+    doc = fitz.open(pdf_path)
+    page = doc[0]
+    baseline = peak_rss_mb()
+    times = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            image = VARIANTS[variant](page, os.path.join(tmp, "full_map.jpg"))
+            times.append((time.perf_counter() - start) * 1000)
+            del image
+    doc.close()
+    times.sort()
+    print(json.dumps({"ms": times[len(times) // 2], "peak_mb": peak_rss_mb() - baseline}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="PDFs to render (default: data/*.pdf)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.pdfs[0], args.repeat)
+        return
+
+    pdfs = args.pdfs or sorted(glob.glob(os.path.join("data", "*.pdf")))
+    if not pdfs:
+        print("No PDFs found.")
+        return
+    for pdf_path in pdfs:
+        results = {}
+        for variant in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, "-m", "app.benchmark_render", os.path.abspath(pdf_path), "--variant", variant, "--repeat", str(args.repeat)],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            results[variant] = json.loads(out.stdout.strip().splitlines()[-1])
+        before, after = results["jpeg_roundtrip"], results["zero_copy"]
+        print(f"{pdf_path}: {before['ms']:.1f} ms -> {after['ms']:.1f} ms, "
+              f"peak {before['peak_mb']:.1f} MB -> {after['peak_mb']:.1f} MB")
+
+if __name__ == "__main__":
+    main()
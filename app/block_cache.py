@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Any, Optional, List
+from app.core.config import settings
+
+class BlockCache:
+    """
+    Content-addressed cache of block extractions.
+
+    The Registro Gráfico PDF covers a whole manzana, so every address on the
+    block downloads the same plan. Entries are keyed by the SHA-256 of the PDF
+    bytes plus a version of whatever produced the lot results (prompts, models,
+    engine), and hold the rendered full map, the lot crops, `global_info` and
+    the per-lot results:
+
+        <root>/<key>/full_map.jpg
+        <root>/<key>/lots/lote_XXX.png
+        <root>/<key>/entry.json   {"global_info", "lot_files", "lots": {filename: result},
+                                   "lots_meta": [segmentation records with polygons]}
+
+    `lots` may be partial (target-first runs only extract some lots).
+    Least recently used entries (entry.json mtime, touched on every hit) are
+    evicted once the cache grows past `max_bytes`. Blocking: call it from a
+    thread (asyncio.to_thread).
+    """
+
+    def __init__(self, root: str = None, max_bytes: int = None):
+        self.root = root or settings.BLOCK_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else settings.BLOCK_CACHE_MAX_MB * 1024 * 1024
+        # key -> (size in bytes, last used), scanned from disk on first use
+        self._entries: Optional[Dict[str, list]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(pdf_bytes: bytes, version: str = None) -> str:
+        key = hashlib.sha256(pdf_bytes).hexdigest()
+        return f"{key}-{version}" if version else key
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _scan(self) -> Dict[str, list]:
+        if self._entries is None:
+            entries = {}
+            if os.path.isdir(self.root):
+                for key in os.listdir(self.root):
+                    entry_path = os.path.join(self._dir(key), "entry.json")
+                    if os.path.exists(entry_path):
+                        entries[key] = [_dir_size(self._dir(key)), os.path.getmtime(entry_path)]
+            self._entries = entries
+        return self._entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry_path = os.path.join(self._dir(key), "entry.json")
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        with self._lock:
+            if key in self._scan():
+                self._entries[key][1] = time.time()
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, global_info: Dict[str, Any], lot_files: List[str], lots: Dict[str, Any],
+            lots_meta: List[Dict[str, Any]] = None, debug_dir: str = None):
+        """Stores an entry; artifacts are copied from `debug_dir` when given."""
+        entry_dir = self._dir(key)
+        os.makedirs(os.path.join(entry_dir, "lots"), exist_ok=True)
+        if debug_dir:
+            _copy(os.path.join(debug_dir, "full_map.jpg"), os.path.join(entry_dir, "full_map.jpg"))
+            for lot_file in lot_files:
+                _copy(os.path.join(debug_dir, "lots", lot_file), os.path.join(entry_dir, "lots", lot_file))
+
+        entry = {"global_info": global_info, "lot_files": lot_files, "lots": lots, "lots_meta": lots_meta}
+        # Write-then-rename so a concurrent reader never sees half an entry
+        tmp_path = os.path.join(entry_dir, "entry.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(entry_dir, "entry.json"))
+
+        with self._lock:
+            self._scan()[key] = [_dir_size(entry_dir), time.time()]
+            self._evict(keep=key)
+
+    def _evict(self, keep: str):
+        total = sum(size for size, _ in self._entries.values())
+        for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._dir(key), ignore_errors=True)
+            del self._entries[key]
+            total -= size
+            self.evictions += 1
+
+    def restore(self, key: str, debug_dir: str, lot_files: List[str]):
+        """Materializes the cached artifacts into a session's debug directory."""
+        entry_dir = self._dir(key)
+        os.makedirs(os.path.join(debug_dir, "lots"), exist_ok=True)
+        _copy(os.path.join(entry_dir, "full_map.jpg"), os.path.join(debug_dir, "full_map.jpg"))
+        for lot_file in lot_files:
+            _copy(os.path.join(entry_dir, "lots", lot_file), os.path.join(debug_dir, "lots", lot_file))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries or {}
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "size_bytes": sum(size for size, _ in entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+def _dir_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(dirpath, name))
+        for dirpath, _, names in os.walk(path) for name in names
+    )
+
+def _copy(src: str, dst: str):
+    """Copies src to dst, skipping missing sources.
+
+    Copies rather than hard links: later runs rewrite files in the session's
+    debug directory in place, which would corrupt a linked cache entry.
+    """
+    if not os.path.exists(src):
+        return
+    shutil.copyfile(src, dst)
+
+block_cache = BlockCache()
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Set, List, Tuple, Callable, Awaitable
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page
+from app.core.config import settings
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium shared by every scrape.
+
+    Each caller gets its own isolated context/page through `page()`, at most
+    `size` at a time. The browser is recycled after `max_uses` pages or when it
+    crashes; a browser that is being recycled stays alive until the pages still
+    using it are released.
+
+    In warm mode (`reset` passed to `page()` and WARM_PAGES enabled) pages are
+    not closed after use: they are reset and parked, already navigated, for the
+    next caller.
+    """
+
+    def __init__(self, size: int = None, max_uses: int = None, headless: bool = None):
+        self.size = size or settings.BROWSER_POOL_SIZE
+        self.max_uses = max_uses or settings.BROWSER_MAX_USES
+        self.headless = settings.BROWSER_HEADLESS if headless is None else headless
+
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._browser_uses = 0
+        # Open contexts per browser, so retired browsers are closed only once idle
+        self._active: Dict[Browser, int] = {}
+        self._retired: Set[Browser] = set()
+        # Parked warm pages: (browser, context, page)
+        self._idle: List[Tuple[Browser, BrowserContext, Page]] = []
+
+        self._semaphore = asyncio.Semaphore(self.size)
+        self._start_lock = asyncio.Lock()
+        self._launch_lock = asyncio.Lock()
+        self._started = False
+
+        # Metrics
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._launched = 0
+        self._recycled = 0
+        self._crashes = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+        self._warm_hits = 0
+        self._warm_misses = 0
+
+    async def start(self):
+        """Starts Playwright and launches the first browser."""
+        async with self._start_lock:
+            if self._started:
+                return
+            self._playwright = await async_playwright().start()
+            self._started = True
+            print(f"Browser pool started (size={self.size}, max_uses={self.max_uses})", flush=True)
+        async with self._launch_lock:
+            await self._ensure_browser()
+
+    async def stop(self):
+        """Closes every browser and stops Playwright."""
+        async with self._start_lock:
+            if not self._started:
+                return
+            browsers = list(self._active.keys())
+            self._browser = None
+            self._active.clear()
+            self._retired.clear()
+            self._idle.clear()
+            for browser in browsers:
+                await self._close_browser(browser)
+            await self._playwright.stop()
+            self._playwright = None
+            self._started = False
+            print("Browser pool stopped.", flush=True)
+
+    async def _close_browser(self, browser: Browser):
+        try:
+            await browser.close()
+        except Exception as e:
+            print(f"Error closing pooled browser: {e}", flush=True)
+
+    async def _ensure_browser(self) -> Browser:
+        """Returns the current browser, launching or recycling it if needed. Caller holds _launch_lock."""
+        browser = self._browser
+        if browser is not None:
+            if not browser.is_connected():
+                print("Pooled browser disconnected, relaunching...", flush=True)
+                self._crashes += 1
+                await self._retire(browser)
+                browser = None
+            elif self._browser_uses >= self.max_uses:
+                print(f"Pooled browser reached {self._browser_uses} uses, recycling...", flush=True)
+                self._recycled += 1
+                await self._retire(browser)
+                browser = None
+
+        if browser is None:
+            browser = await self._playwright.chromium.launch(headless=self.headless)
+            self._browser = browser
+            self._browser_uses = 0
+            self._active[browser] = 0
+            self._launched += 1
+        return browser
+
+    async def _retire(self, browser: Browser):
+        if self._browser is browser:
+            self._browser = None
+        # Parked pages die with their browser
+        self._idle = [entry for entry in self._idle if entry[0] is not browser]
+        if self._active.get(browser, 0) == 0:
+            self._active.pop(browser, None)
+            await self._close_browser(browser)
+        else:
+            self._retired.add(browser)
+
+    async def _checkout_browser(self) -> Browser:
+        async with self._launch_lock:
+            browser = await self._ensure_browser()
+            self._browser_uses += 1
+            self._active[browser] += 1
+            return browser
+
+    async def _checkin_browser(self, browser: Browser, crashed: bool):
+        self._active[browser] = self._active.get(browser, 1) - 1
+        if crashed and browser is self._browser:
+            self._crashes += 1
+            self._browser = None
+            self._retired.add(browser)
+        if browser in self._retired and self._active[browser] <= 0:
+            self._retired.discard(browser)
+            self._active.pop(browser, None)
+            self._idle = [entry for entry in self._idle if entry[0] is not browser]
+            await self._close_browser(browser)
+
+    async def _take_idle(self, browser: Browser) -> Optional[Tuple[BrowserContext, Page]]:
+        """Pops a parked page that belongs to `browser`, discarding stale ones."""
+        while self._idle:
+            idle_browser, context, page = self._idle.pop()
+            if idle_browser is browser and browser.is_connected() and not page.is_closed():
+                return context, page
+            try:
+                await context.close()
+            except Exception:
+                pass
+        return None
+
+    @asynccontextmanager
+    async def page(
+        self,
+        prepare: Callable[[Page], Awaitable[None]] = None,
+        reset: Callable[[Page], Awaitable[None]] = None,
+        **context_options
+    ):
+        """
+        Yields a page in its own browser context.
+        Waits for a free slot when the pool is fully occupied.
+
+        `prepare(page)` runs on every newly created page (e.g. navigation).
+        When `reset` is given and WARM_PAGES is enabled, a parked page is reused
+        if available, and on a clean exit `reset(page)` runs and the page is
+        parked again instead of being closed.
+        """
+        warm = reset is not None and settings.WARM_PAGES
+        if not self._started:
+            await self.start()
+
+        wait_start = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        wait = time.perf_counter() - wait_start
+        self._acquired += 1
+        self._total_wait += wait
+        self._last_wait = wait
+        self._max_wait = max(self._max_wait, wait)
+        if wait > 0.1:
+            print(f"Browser pool: waited {wait * 1000:.0f} ms for a free page", flush=True)
+
+        self._in_use += 1
+        browser = None
+        context = None
+        crashed = False
+        park = False
+        try:
+            browser = await self._checkout_browser()
+            idle = await self._take_idle(browser) if warm else None
+            if idle:
+                context, page = idle
+                self._warm_hits += 1
+            else:
+                context_options.setdefault("accept_downloads", True)
+                context = await browser.new_context(**context_options)
+                page: Page = await context.new_page()
+                if prepare:
+                    await prepare(page)
+                if warm:
+                    self._warm_misses += 1
+            yield page
+            if warm:
+                try:
+                    await reset(page)
+                    park = True
+                except Exception as e:
+                    print(f"Could not reset warm page, discarding it: {e}", flush=True)
+        except Exception:
+            crashed = browser is not None and not browser.is_connected()
+            raise
+        finally:
+            if context is not None:
+                if (park and browser is self._browser and browser.is_connected()
+                        and len(self._idle) < self.size):
+                    self._idle.append((browser, context, page))
+                else:
+                    try:
+                        await context.close()
+                    except Exception:
+                        crashed = crashed or (browser is not None and not browser.is_connected())
+            if browser is not None:
+                await self._checkin_browser(browser, crashed)
+            self._in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy and wait time."""
+        return {
+            "started": self._started,
+            "size": self.size,
+            "in_use": self._in_use,
+            "warm_idle": len(self._idle),
+            "warm_hits": self._warm_hits,
+            "warm_misses": self._warm_misses,
+            "waiting": self._waiting,
+            "acquired": self._acquired,
+            "browser_uses": self._browser_uses,
+            "max_uses": self.max_uses,
+            "browsers_launched": self._launched,
+            "browsers_recycled": self._recycled,
+            "browser_crashes": self._crashes,
+            "avg_wait_ms": round(self._total_wait / self._acquired * 1000, 1) if self._acquired else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 1),
+            "last_wait_ms": round(self._last_wait * 1000, 1),
+        }
+
+
+# Shared pool used by the WebSocket handler and the graph
+browser_pool = BrowserPool()
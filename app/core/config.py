@@ -2,7 +2,92 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     OPENAI_API_KEY: str = "sk-..."
-    
+
+    # Browser pool used by the scraper
+    BROWSER_POOL_SIZE: int = 2
+    BROWSER_MAX_USES: int = 50
+    BROWSER_HEADLESS: bool = True
+    # Keep InfoMapa pages loaded between scrapes
+    WARM_PAGES: bool = True
+    WARM_PAGES_PREWARM: int = 1
+    # Scraper backend: "auto" (HTTP first, browser fallback), "http" or "browser"
+    SCRAPER_BACKEND: str = "auto"
+    HTTP_TIMEOUT: float = 10.0
+    # Location autocomplete proxy: cached results (a result smaller than the largest
+    # seen is complete, longer queries filter it; see app/locations.py)
+    LOCATIONS_TIMEOUT: float = 5.0
+    LOCATIONS_CACHE_SIZE: int = 2000
+    LOCATIONS_CACHE_TTL: float = 3600.0
+    # Local index of the ubicaciones dataset (python -m app.location_index build <dump>),
+    # answered before the remote API if built with --complete (else only when the API fails);
+    # checked for rebuilds every LOCATIONS_INDEX_CHECK_INTERVAL s
+    LOCATIONS_INDEX_PATH: str = "data/_cache/locations_index.tsv"
+    LOCATIONS_INDEX_LIMIT: int = 20
+    LOCATIONS_INDEX_CHECK_INTERVAL: float = 30.0
+    # WMS tile proxy (/proxy/wms/{service}): disk cache with TTL and LRU size bound
+    WMS_TIMEOUT: float = 20.0
+    WMS_CACHE_PATH: str = "data/_cache/wms_tiles.sqlite3"
+    WMS_CACHE_MAX_MB: int = 512
+    WMS_CACHE_TTL: float = 7 * 24 * 3600
+    # Block tiles/assets while the browser scraper only needs the DOM
+    SCRAPER_BLOCK_RESOURCES: bool = True
+    SCRAPER_BLOCKED_TYPES: list[str] = ["tile", "image", "font", "media"]
+    # Scrape scheduler: adaptive concurrency and per-host request rate
+    SCRAPE_MIN_CONCURRENCY: int = 1
+    SCRAPE_MAX_CONCURRENCY: int = 4
+    SCRAPE_INITIAL_CONCURRENCY: int = 2
+    SCRAPE_TARGET_LATENCY: float = 30.0
+    UPSTREAM_RATE_PER_SEC: float = 2.0
+    UPSTREAM_BURST: int = 4
+    # Block-level extraction cache, keyed by the Registro Gráfico PDF hash (and the
+    # prompt/engine version), least recently used blocks evicted past BLOCK_CACHE_MAX_MB
+    BLOCK_CACHE_ENABLED: bool = True
+    BLOCK_CACHE_DIR: str = "data/_cache/blocks"
+    BLOCK_CACHE_MAX_MB: int = 512
+    # Index of the saved searches listed by /history (rebuilt from data/*_data.json if missing)
+    HISTORY_INDEX_PATH: str = "data/_cache/history_index.sqlite3"
+    # Extraction engine: "auto" (PDF vector layers, LLM for what they can't resolve,
+    # raster + LLM for scanned plans), "vector" (no LLM for lots) or "raster"
+    EXTRACTION_ENGINE: str = "auto"
+    # Page rendering: grayscale is all segmentation and the LLM need (plans are
+    # black on white); debug_detected_lots.jpg is only written when asked for
+    RENDER_GRAYSCALE: bool = True
+    SAVE_DEBUG_IMAGES: bool = False
+    # Lot extractor chain (see app/extractor.py::LotExtractor): local OCR first,
+    # LLM for crops below LOT_MIN_CONFIDENCE
+    LOT_EXTRACTORS: list[str] = ["ocr", "llm"]
+    LOT_MIN_CONFIDENCE: float = 0.85
+    OCR_WORKERS: int = 2
+    # Per-crop LLM result cache (perceptual hash + prompt version)
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_PATH: str = "data/_cache/llm_cache.sqlite3"
+    LLM_CACHE_MAX_MB: int = 64
+    LLM_CACHE_MAX_DISTANCE: int = 4  # dHash bits (at most 7)
+    LLM_CACHE_MAX_DIFF: float = 0.0002  # fraction of differing thumbnail pixels
+    # Model cascade, cheapest first: a lot whose JSON fails validation is asked
+    # again to the next model
+    LLM_MODELS: list[str] = ["gpt-5-nano", "gpt-5-mini"]
+    LLM_MAX_DIMENSIONS: int = 16
+    # Lot crops per vision request (1 = one request per lot)
+    LLM_BATCH_SIZE: int = 6
+    # Shared LLM dispatcher: concurrency cap, request rate, deadlines and retries
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_RATE_PER_SEC: float = 5.0
+    LLM_BURST: int = 8
+    LLM_TIMEOUT: float = 60.0  # per attempt
+    LLM_CALL_DEADLINE: float = 120.0  # whole call, retries and backoff included
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_BASE: float = 1.0
+    LLM_BACKOFF_MAX: float = 30.0
+    # Images sent to the LLM: downsampled to a text height, lowest quality keeping LLM_MIN_PSNR
+    LLM_TARGET_TEXT_PX: float = 14.0
+    LLM_MIN_SCALE: float = 0.25
+    LLM_IMAGE_FORMAT: str = "jpeg"  # "jpeg" or "webp"
+    LLM_IMAGE_QUALITIES: list[int] = [90, 80, 70, 60, 50]
+    LLM_MIN_PSNR: float = 36.0
+    # Global-info call only gets the margins around the block
+    LLM_GLOBAL_MARGINS_ONLY: bool = True
+
     class Config:
         env_file = ".env"
 
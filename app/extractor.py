@@ -1,29 +1,44 @@
 import base64
+import hashlib
 import io
 import json
 import os
 import cv2
 import fitz  # PyMuPDF
 import asyncio
-from typing import Dict, Any, List, Callable, Awaitable
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from typing import Dict, Any, List, Callable, Awaitable, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from app.core.config import settings
-from app.image_utils import load_image_from_bytes, encode_image_to_bytes
+from app.image_utils import (
+    render_page, prepare_crop, prepare_global_image, start_image_report, summarize_image_report
+)
+from app.block_cache import block_cache
+from app.llm_cache import llm_cache
+from app.llm_dispatcher import llm_dispatcher, start_llm_report, record_escalation, summarize_llm_report
+from app.ocr_backend import ocr_lots, tesseract_available
 # Import external segmentation script
-from segmentacion.extractor_lotes import process_cadastral_map
+from segmentacion.extractor_lotes import segmentar_lotes, guardar_lotes
+from segmentacion.extractor_vectorial import extraer_lotes_vectoriales, guardar_recortes
 
-# Initialize LLM
-llm = ChatOpenAI(model="gpt-5-nano", api_key=settings.OPENAI_API_KEY)
+# Initialize LLMs: settings.LLM_MODELS is the cascade, cheapest first.
+# Retries are handled by llm_dispatcher.
+_llms: Dict[str, ChatOpenAI] = {}
+
+def get_llm(model: str = None) -> ChatOpenAI:
+    model = model or settings.LLM_MODELS[0]
+    if model not in _llms:
+        _llms[model] = ChatOpenAI(model=model, api_key=settings.OPENAI_API_KEY, max_retries=0)
+    return _llms[model]
 
 def encode_image(image_bytes):
     return base64.b64encode(image_bytes).decode('utf-8')
 
-async def extract_single_lot_data(image_bytes: bytes, lot_filename: str) -> Dict[str, Any]:
-    """Extracts data from a single lot crop using LLM."""
-    base64_image = encode_image(image_bytes)
-    
-    prompt_text = f"""
+LOT_PROMPT = """
     Analyze this single lot crop from a cadastral map. 
     Filename reference: {lot_filename}
     
@@ -51,22 +66,125 @@ async def extract_single_lot_data(image_bytes: bytes, lot_filename: str) -> Dict
         "other_text": "string or null"
     }}
     """
+
+BATCH_PROMPT = """
+    Analyze these {count} lot crops from a cadastral map. Each image is preceded
+    by its filename: {filenames}
     
-    message = HumanMessage(
-        content=[
-            {"type": "text", "text": prompt_text},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-        ]
-    )
+    For EACH crop, extract all visible text inside that lot boundary:
+
+    1. Lot Number:
+    - Identify the main lot number (usually a large number like 1, 2, 3, 14, etc.).
+    - If there is a smaller number immediately adjacent to or visually attached to the main lot number, include it
+    as a superscript (e.g., 17 with a small 1 should be shown as 17¹).
+
+    2. Dimensions:
+   - Extract all numeric measurements along the lot edges (e.g., 8.66, 10.00, 25.98).
+
+    3. PH information:
+   - Extract any PH reference if present (e.g., PH 1234, PH 4596).
+
+    4. Any other visible text inside the lot boundary.
+
+    Never mix text from different crops.
     
+    Return a JSON array with one object per crop:
+    [
+        {{
+            "filename": "string",
+            "lot_number": "string or null",
+            "dimensions": ["string"],
+            "ph_info": "string or null",
+            "other_text": "string or null"
+        }}
+    ]
+    """
+
+# Cached lot results are only valid for the prompts and models that produced them
+LOT_PROMPT_VERSION = hashlib.sha1(
+    f"{','.join(settings.LLM_MODELS)}\n{LOT_PROMPT}\n{BATCH_PROMPT}".encode("utf-8")
+).hexdigest()[:12]
+
+# Block cache entries hold lot results too: also tied to the engine and extractor chain
+BLOCK_CACHE_VERSION = hashlib.sha1(
+    f"{LOT_PROMPT_VERSION}\n{settings.EXTRACTION_ENGINE}\n{','.join(settings.LOT_EXTRACTORS)}".encode("utf-8")
+).hexdigest()[:12]
+
+def parse_json_response(content: str) -> Any:
+    """JSON from an LLM reply, with or without a markdown code fence."""
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+    return json.loads(content.strip())
+
+async def get_cached_lot(image_bytes: bytes, lot_filename: str) -> Optional[Dict[str, Any]]:
+    if not settings.LLM_CACHE_ENABLED:
+        return None
     try:
-        response = await llm.ainvoke([message])
-        content = response.content
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        result = json.loads(content.strip())
+        cached = await asyncio.to_thread(llm_cache.get, image_bytes, LOT_PROMPT_VERSION)
+    except Exception as e:
+        print(f"LLM cache lookup failed for {lot_filename}: {e}")
+        return None
+    if cached is not None:
+        cached["filename"] = lot_filename
+    return cached
+
+async def cache_lot(image_bytes: bytes, result: Dict[str, Any]):
+    if not settings.LLM_CACHE_ENABLED:
+        return
+    try:
+        await asyncio.to_thread(llm_cache.put, image_bytes, LOT_PROMPT_VERSION,
+                                {k: v for k, v in result.items() if k != "filename"})
+    except Exception as cache_err:
+        print(f"Could not cache LLM result for {result.get('filename')}: {cache_err}")
+
+def validate_lot_result(result: Dict[str, Any]) -> Optional[str]:
+    """Why a lot result can't be trusted (the cascade asks a stronger model), or None if it looks right."""
+    if "error" in result:
+        return "error"
+    if not str(result.get("lot_number") or "").strip():
+        return "no lot number"
+    dimensions = result.get("dimensions") or []
+    if not isinstance(dimensions, list):
+        return "dimensions not a list"
+    if len(dimensions) > settings.LLM_MAX_DIMENSIONS:
+        return "too many dimensions"
+    for dim in dimensions:
+        try:
+            value = float(str(dim).replace(",", "."))
+        except ValueError:
+            return f"dimension '{dim}' is not a number"
+        if not 0 < value < 10000:
+            return f"dimension '{dim}' out of range"
+    return None
+
+async def extract_single_lot_data(
+    image_bytes: bytes,
+    lot_filename: str,
+    use_cache: bool = True,
+    model: str = None
+) -> Dict[str, Any]:
+    """Extracts data from a single lot crop using LLM (served from llm_cache when already seen)."""
+    if use_cache:
+        cached = await get_cached_lot(image_bytes, lot_filename)
+        if cached is not None:
+            return cached
+
+    prompt_text = LOT_PROMPT.format(lot_filename=lot_filename)
+    
+    try:
+        prepared = await asyncio.to_thread(prepare_crop, image_bytes)
+        message = HumanMessage(
+            content=[
+                {"type": "text", "text": prompt_text},
+                {"type": "image_url", "image_url": {"url": f"data:{prepared.mime};base64,{encode_image(prepared.data)}"}}
+            ]
+        )
+        response = await llm_dispatcher.invoke(get_llm(model), [message])
+        result = parse_json_response(response.content)
+        if use_cache and validate_lot_result(result) is None:
+            await cache_lot(image_bytes, result)
         # Inject filename into the result
         result["filename"] = lot_filename
         return result
@@ -74,8 +192,41 @@ async def extract_single_lot_data(image_bytes: bytes, lot_filename: str) -> Dict
         print(f"Error extracting lot {lot_filename}: {e}")
         return {"error": str(e), "filename": lot_filename}
 
-async def extract_global_info(image_bytes: bytes) -> Dict[str, Any]:
-    """Extracts street names and block info from the full map."""
+async def extract_lot_batch(crops: List[Tuple[bytes, str]], model: str = None) -> List[Dict[str, Any]]:
+    """
+    Extracts several lot crops in one request (one labeled image part per crop).
+    Crops missing from the reply, or all of them if it doesn't parse, fall
+    back to per-lot calls.
+    """
+    filenames = [lot_file for _, lot_file in crops]
+    content = [{"type": "text", "text": BATCH_PROMPT.format(count=len(crops), filenames=", ".join(filenames))}]
+
+    by_file = {}
+    try:
+        for lot_bytes, lot_file in crops:
+            prepared = await asyncio.to_thread(prepare_crop, lot_bytes)
+            content.append({"type": "text", "text": f"Crop {lot_file}:"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:{prepared.mime};base64,{encode_image(prepared.data)}"}})
+        response = await llm_dispatcher.invoke(get_llm(model), [HumanMessage(content=content)])
+        parsed = parse_json_response(response.content)
+        if isinstance(parsed, dict):
+            parsed = parsed.get("lots", [parsed])
+        for item in parsed:
+            if isinstance(item, dict) and item.get("filename") in filenames:
+                by_file[item["filename"]] = item
+    except Exception as e:
+        print(f"Batched extraction of {len(crops)} lots failed, falling back to per-lot calls: {e}")
+
+    async def resolve(lot_bytes, lot_file):
+        result = by_file.get(lot_file)
+        if result is None:
+            return await extract_single_lot_data(lot_bytes, lot_file, use_cache=False, model=model)
+        return result
+
+    return list(await asyncio.gather(*(resolve(b, f) for b, f in crops)))
+
+async def extract_global_info(image_bytes: bytes, mime: str = "image/jpeg", model: str = None) -> Dict[str, Any]:
+    """Extracts street names and block info from the full map (or its margins, see prepare_global_image)."""
     base64_image = encode_image(image_bytes)
     
     prompt_text = """
@@ -97,32 +248,510 @@ async def extract_global_info(image_bytes: bytes) -> Dict[str, Any]:
     message = HumanMessage(
         content=[
             {"type": "text", "text": prompt_text},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+            {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{base64_image}"}}
         ]
     )
     
     try:
-        response = await llm.ainvoke([message])
-        content = response.content
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0]
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0]
-        return json.loads(content.strip())
+        response = await llm_dispatcher.invoke(get_llm(model), [message])
+        return parse_json_response(response.content)
     except Exception as e:
         return {"error": str(e)}
 
+async def extract_global_info_from_map(cv_image: np.ndarray, original_bytes: int = None) -> Dict[str, Any]:
+    """
+    extract_global_info on the prepared full map (margin bands, downsampled),
+    escalating through the model cascade when no street names come back.
+    """
+    try:
+        global_image = await asyncio.to_thread(prepare_global_image, cv_image, original_bytes)
+    except Exception as e:
+        return {"error": str(e)}
+    models = settings.LLM_MODELS
+    for tier, model in enumerate(models):
+        global_info = await extract_global_info(global_image.data, global_image.mime, model=model)
+        if tier == len(models) - 1 or ("error" not in global_info and global_info.get("streets")):
+            return global_info
+        record_escalation(model, 1)
+        print(f"Global info from {model} incomplete, asking {models[tier + 1]}...")
+
+def filter_target_lot(lots_data: List[Dict[str, Any]], target_lot: str) -> List[Dict[str, Any]]:
+    """Keeps the lots whose number matches target_lot (all of them if none match)."""
+    if not target_lot:
+        return lots_data
+    print(f"Filtering for target lot: {target_lot}")
+    # Try to match exact string or simple variations
+    matches = []
+    for data in lots_data:
+        extracted_num = data.get("lot_number")
+        if extracted_num and str(extracted_num).strip() == str(target_lot).strip():
+            matches.append(data)
+
+    if matches:
+        return matches
+    print(f"Target lot {target_lot} not found in extracted data.")
+    # We keep all data if not found, or maybe just return empty?
+    # Usually better to return everything and let user see.
+    return lots_data
+
+class LotExtractor(ABC):
+    """
+    A backend that reads lot crops into the lots_data schema.
+
+    extract_lots chains the backends in settings.LOT_EXTRACTORS: a result whose
+    `confidence` reaches LOT_MIN_CONFIDENCE is kept, the other crops go on to
+    the next backend; the last backend's results are always kept.
+    """
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def extract(
+        self,
+        crops: List[Tuple[bytes, str]],
+        on_result: Callable[[Dict[str, Any]], Awaitable[None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Results in `crops` order; `on_result` is awaited for each one as it's ready."""
+
+class OCRLotExtractor(LotExtractor):
+    """
+    Local Tesseract pass in a process pool (see app/ocr_backend.py). No cost, no network.
+
+    The server starts the pool at startup (start_lot_extractors). Workers come
+    from a forkserver (spawn where there's none), never from forking the
+    server itself: its event loop, to_thread workers, SQLite and Playwright
+    threads make a plain fork prone to deadlocks.
+    """
+    name = "ocr"
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or settings.OCR_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def available(self) -> bool:
+        return tesseract_available()
+
+    def start(self):
+        if self._pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+
+    async def extract(self, crops, on_result=None):
+        # Scripts (benchmarks, the graph) get the pool on first use
+        self.start()
+        loop = asyncio.get_running_loop()
+        results: List[Dict[str, Any]] = [None] * len(crops)
+
+        async def run_chunk(offset):
+            chunk_results = await loop.run_in_executor(self._pool, ocr_lots, crops[offset::self.workers])
+            for i, res in enumerate(chunk_results):
+                results[offset + i * self.workers] = res
+                if on_result:
+                    await on_result(res)
+
+        await asyncio.gather(*(run_chunk(offset) for offset in range(min(self.workers, len(crops)))))
+        return results
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+class LLMLotExtractor(LotExtractor):
+    """
+    The vision model, LLM_BATCH_SIZE crops per request, as a cascade over
+    settings.LLM_MODELS: crops whose result fails validate_lot_result are
+    asked again to the next (stronger) model.
+    """
+    name = "llm"
+
+    async def extract(self, crops, on_result=None):
+        models = settings.LLM_MODELS
+        images = {lot_file: lot_bytes for lot_bytes, lot_file in crops}
+        final: Dict[str, Dict[str, Any]] = {}
+        remaining = crops
+        for tier, model in enumerate(models):
+            last = tier == len(models) - 1
+
+            async def handle(res, last=last):
+                problem = validate_lot_result(res)
+                if problem is not None and not last:
+                    return
+                final[res["filename"]] = res
+                # Last tier keeps (and emits) what it got, but only valid results are cached
+                if problem is None:
+                    await cache_lot(images[res["filename"]], res)
+                if on_result:
+                    await on_result(res)
+
+            async def run_batch(batch, model=model):
+                if len(batch) == 1:
+                    batch_results = [await extract_single_lot_data(*batch[0], use_cache=False, model=model)]
+                else:
+                    batch_results = await extract_lot_batch(batch, model=model)
+                for res in batch_results:
+                    await handle(res)
+
+            batch_size = max(1, settings.LLM_BATCH_SIZE)
+            await asyncio.gather(*(run_batch(remaining[i:i + batch_size]) for i in range(0, len(remaining), batch_size)))
+            remaining = [crop for crop in remaining if crop[1] not in final]
+            if not remaining:
+                break
+            record_escalation(model, len(remaining))
+            print(f"Escalating {len(remaining)} lots from {model} to {models[tier + 1]}")
+        return [final[lot_file] for _, lot_file in crops]
+
+ocr_extractor = OCRLotExtractor()
+llm_extractor = LLMLotExtractor()
+LOT_EXTRACTORS: Dict[str, LotExtractor] = {e.name: e for e in (ocr_extractor, llm_extractor)}
+
+async def extract_lots(
+    lots_output_dir: str,
+    lot_files: List[str],
+    progress_callback: Callable[[str, Any], Awaitable[None]] = None,
+    crops: Dict[str, bytes] = None
+) -> List[Dict[str, Any]]:
+    """
+    Reads the lot crops, notifying each result as it arrives.
+    Cached LLM results are answered first; the rest go through the
+    LotExtractor chain (local OCR, then the LLM for low-confidence crops).
+    `crops` holds encoded crops already in memory (by filename); only the
+    others are read from lots_output_dir.
+    """
+    results = {}
+    pending = []
+    for lot_file in lot_files:
+        lot_bytes = crops.get(lot_file) if crops else None
+        if lot_bytes is None:
+            lot_path = os.path.join(lots_output_dir, lot_file)
+            with open(lot_path, "rb") as f:
+                lot_bytes = f.read()
+        cached = await get_cached_lot(lot_bytes, lot_file)
+        if cached is not None:
+            results[lot_file] = cached
+            if progress_callback:
+                await progress_callback("lot_data", cached)
+        else:
+            pending.append((lot_bytes, lot_file))
+
+    chain = [LOT_EXTRACTORS[name] for name in settings.LOT_EXTRACTORS if name in LOT_EXTRACTORS]
+    chain = [extractor for extractor in chain if extractor.available()] or [llm_extractor]
+    for i, extractor in enumerate(chain):
+        if not pending:
+            break
+        last = i == len(chain) - 1
+
+        # Helper wrapper to notify on completion
+        async def keep(res, last=last):
+            if last or res.get("confidence", 0) >= settings.LOT_MIN_CONFIDENCE:
+                results[res["filename"]] = res
+                if progress_callback:
+                    await progress_callback("lot_data", res)
+
+        try:
+            await extractor.extract(pending, keep)
+        except Exception as e:
+            if last:
+                raise
+            print(f"Lot extractor '{extractor.name}' failed, passing crops on: {e}")
+        remaining = [crop for crop in pending if crop[1] not in results]
+        if not last:
+            print(f"{extractor.name}: {len(pending) - len(remaining)} of {len(pending)} lots accepted")
+        pending = remaining
+    return [results[lot_file] for lot_file in lot_files]
+
+# --- Write-behind for the _debug artifacts ---
+
+def write_behind(fn: Callable, *args) -> asyncio.Task:
+    """Runs a _debug write in a thread, off the extraction's critical path."""
+    return asyncio.create_task(asyncio.to_thread(fn, *args))
+
+def notify_after(
+    writes: List[asyncio.Task],
+    progress_callback: Callable[[str, Any], Awaitable[None]],
+    event_type: str,
+    data: Any
+) -> asyncio.Task:
+    """Sends an event once the files it points the UI at are written, without holding up the caller."""
+    async def send():
+        await asyncio.gather(*writes)
+        if progress_callback:
+            await progress_callback(event_type, data)
+    return asyncio.create_task(send())
+
+def events_after(
+    sent: asyncio.Task,
+    progress_callback: Callable[[str, Any], Awaitable[None]]
+) -> Optional[Callable[[str, Any], Awaitable[None]]]:
+    """progress_callback that holds events back until `sent` is out, so the UI sees them in order."""
+    if not progress_callback:
+        return None
+    async def callback(event_type: str, data: Any):
+        await sent
+        await progress_callback(event_type, data)
+    return callback
+
+def start_lot_extractors():
+    """Starts the OCR worker pool, if OCR is one of the configured backends and Tesseract is installed."""
+    if "ocr" in settings.LOT_EXTRACTORS and ocr_extractor.available():
+        ocr_extractor.start()
+
+def shutdown_lot_extractors():
+    ocr_extractor.shutdown()
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def locate_target_lot(pdf_path: str, lots: List[Dict[str, Any]], target_lot: str, zoom: float = 3) -> Optional[str]:
+    """
+    Finds which lot crop holds the target lot number using the PDF text layer,
+    before any LLM call. Returns the crop filename, or None if it can't be told.
+    `lots` are the segmentation records (polygons in rendered-image pixels).
+    """
+    if not target_lot or not lots:
+        return None
+    target = str(target_lot).strip()
+
+    doc = fitz.open(pdf_path)
+    try:
+        text = doc[0].get_text("dict")
+    finally:
+        doc.close()
+
+    # Spans whose text is exactly the lot number; bigger type wins (lot numbers
+    # are printed larger than dimensions)
+    candidates = []
+    for block in text.get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                if span.get("text", "").strip() == target:
+                    x0, y0, x1, y1 = span["bbox"]
+                    candidates.append((span.get("size", 0), ((x0 + x1) / 2 * zoom, (y0 + y1) / 2 * zoom)))
+    candidates.sort(key=lambda c: -c[0])
+
+    polygons = [(lot["filename"], np.array(lot["polygon"], dtype=np.int32)) for lot in lots if lot.get("polygon")]
+    for _, point in candidates:
+        for filename, polygon in polygons:
+            if cv2.pointPolygonTest(polygon, point, False) >= 0:
+                return filename
+    return None
+
+def plan_lot_extraction(
+    pdf_path: str,
+    lots: List[Dict[str, Any]],
+    target_lot: str = None,
+    full_block: bool = False
+) -> Tuple[List[str], str]:
+    """
+    Decides which crops go to the LLM now (reads the PDF: run it in a thread).
+    Returns (filenames, strategy):
+    - "text_layer": target located in the PDF text layer, only that lot
+    - "full_block": every lot was requested
+    - "all_lots": no target, or it couldn't be located up front
+    """
+    lot_files = [lot["filename"] for lot in lots]
+    if full_block:
+        return lot_files, "full_block"
+    try:
+        target_file = locate_target_lot(pdf_path, lots, target_lot)
+    except Exception as e:
+        print(f"Could not locate target lot in text layer: {e}")
+        target_file = None
+    if target_file:
+        print(f"Target lot {target_lot} located in {target_file} (text layer)")
+        return [target_file], "text_layer"
+    return lot_files, "all_lots"
+
+async def extract_pending_lots(
+    lots_output_dir: str,
+    lot_files: List[str],
+    cache_key: str = None,
+    progress_callback: Callable[[str, Any], Awaitable[None]] = None
+) -> List[Dict[str, Any]]:
+    """Extracts lots left pending by a target-first run, updating the block cache."""
+    results = await extract_lots(lots_output_dir, lot_files, progress_callback)
+    if cache_key:
+        entry = await asyncio.to_thread(block_cache.get, cache_key)
+        if entry:
+            for res in results:
+                entry["lots"][res["filename"]] = res
+            await asyncio.to_thread(
+                block_cache.put, cache_key, entry["global_info"], entry["lot_files"], entry["lots"], entry.get("lots_meta")
+            )
+    return results
+
+async def extract_from_block_cache(
+    cache_key: str,
+    entry: Dict[str, Any],
+    pdf_path: str,
+    debug_dir: str,
+    target_lot: str = None,
+    full_block: bool = False,
+    progress_callback: Callable[[str, Any], Awaitable[None]] = None
+) -> Dict[str, Any]:
+    """Replays a cached block extraction; only needed lots without a result go to the LLM."""
+    print(f"Block cache hit ({cache_key[:12]}), reusing extraction...")
+    lot_files = entry["lot_files"]
+    cached_lots = entry.get("lots", {})
+    lots_meta = entry.get("lots_meta") or [{"filename": f} for f in lot_files]
+    await asyncio.to_thread(block_cache.restore, cache_key, debug_dir, lot_files)
+    lots_output_dir = os.path.join(debug_dir, "lots")
+
+    raw_image_path = os.path.join(debug_dir, "full_map.jpg")
+    if progress_callback:
+        await progress_callback("full_map", {"path": raw_image_path})
+        await progress_callback("lots_found", {"files": lot_files, "debug_dir": debug_dir})
+
+    global_info = entry.get("global_info") or {}
+    if progress_callback:
+        await progress_callback("global_info", global_info)
+
+    wanted, strategy = await asyncio.to_thread(plan_lot_extraction, pdf_path, lots_meta, target_lot, full_block)
+    # Every cached result is free to serve (vector entries hold the whole block)
+    results = {}
+    for lot_file in lot_files:
+        cached = cached_lots.get(lot_file)
+        if cached and "error" not in cached:
+            results[lot_file] = cached
+            if progress_callback:
+                await progress_callback("lot_data", cached)
+    missing = [f for f in wanted if f not in results]
+
+    if missing:
+        print(f"Extracting {len(missing)} lots missing from the cache...")
+        for res in await extract_lots(lots_output_dir, missing, progress_callback):
+            results[res["filename"]] = res
+            cached_lots[res["filename"]] = res
+        await asyncio.to_thread(block_cache.put, cache_key, global_info, lot_files, cached_lots, lots_meta)
+
+    lots_data = [results[f] for f in lot_files if f in results]
+    return {
+        "global_info": global_info,
+        "lots_data": filter_target_lot(lots_data, target_lot),
+        "total_lots_found": len(lot_files),
+        "pending_lots": [f for f in lot_files if f not in results],
+        "strategy": strategy,
+        "image_path": raw_image_path,
+        "debug_dir": debug_dir,
+        "cache": "hit",
+        "cache_key": cache_key
+    }
+
+async def extract_vector_block(
+    vector: Dict[str, Any],
+    cv_image: np.ndarray,
+    debug_dir: str,
+    target_lot: str = None,
+    full_block: bool = False,
+    cache_key: str = None,
+    progress_callback: Callable[[str, Any], Awaitable[None]] = None
+) -> Dict[str, Any]:
+    """
+    Builds the block result from the PDF vector layers (see segmentacion/extractor_vectorial.py).
+    Lots the text layer couldn't number go to the LLM (engine "auto"), or stay pending
+    when the target lot was already found and the full block wasn't asked for.
+    """
+    raw_image_path = os.path.join(debug_dir, "full_map.jpg")
+    lots_output_dir = os.path.join(debug_dir, "lots")
+    await asyncio.to_thread(guardar_recortes, cv_image, vector["lots"], lots_output_dir)
+    lots_meta = [{"filename": lot["filename"], "bbox": lot["bbox"], "polygon": lot["polygon"]} for lot in vector["lots"]]
+    lot_files = [lot["filename"] for lot in lots_meta]
+    if progress_callback:
+        await progress_callback("lots_found", {"files": lot_files, "debug_dir": debug_dir})
+
+    use_llm = settings.EXTRACTION_ENGINE == "auto"
+    global_info = vector["global_info"]
+    if use_llm and not global_info.get("streets"):
+        # Street names drawn as paths rather than text: ask the LLM
+        print("No street names in the text layer, extracting global info with LLM...")
+        llm_global = await extract_global_info_from_map(cv_image)
+        if "error" not in llm_global:
+            global_info = llm_global
+    if progress_callback:
+        await progress_callback("global_info", global_info)
+
+    results = {}
+    unresolved = []
+    for lot in vector["lots"]:
+        if lot["data"].get("lot_number"):
+            results[lot["filename"]] = lot["data"]
+            if progress_callback:
+                await progress_callback("lot_data", lot["data"])
+        else:
+            unresolved.append(lot["filename"])
+
+    target = str(target_lot).strip() if target_lot else None
+    target_found = target and any(str(d.get("lot_number")).strip() == target for d in results.values())
+    to_llm = unresolved if use_llm and (full_block or not target_found) else []
+    if to_llm:
+        print(f"Processing {len(to_llm)} lots without a lot number in the text layer with LLM...")
+        for res in await extract_lots(lots_output_dir, to_llm, progress_callback):
+            results[res["filename"]] = res
+
+    if cache_key:
+        try:
+            await asyncio.to_thread(block_cache.put, cache_key, global_info, lot_files, results, lots_meta, debug_dir)
+        except Exception as cache_err:
+            print(f"Could not store block cache entry: {cache_err}")
+
+    lots_data = [results[f] for f in lot_files if f in results]
+    return {
+        "global_info": global_info,
+        "lots_data": filter_target_lot(lots_data, target_lot),
+        "total_lots_found": len(lot_files),
+        "pending_lots": [f for f in lot_files if f not in results],
+        "strategy": "vector",
+        "image_path": raw_image_path,
+        "debug_dir": debug_dir,
+        "cache": "miss" if cache_key else None,
+        "cache_key": cache_key
+    }
+
 async def extract_data_from_pdf(
     pdf_path: str, 
     target_lot: str = None, 
     screenshot_path: str = None,
-    progress_callback: Callable[[str, Any], Awaitable[None]] = None
+    progress_callback: Callable[[str, Any], Awaitable[None]] = None,
+    full_block: bool = False
 ) -> Dict[str, Any]:
     """
     Converts PDF to image, uses external script for segmentation, and LLM for extraction.
+    Vector plans are read straight from the PDF drawing/text layers instead
+    (settings.EXTRACTION_ENGINE); scanned plans take the raster + LLM path.
     Supports streaming progress via progress_callback(event_type, data).
+    Blocks already extracted (same PDF bytes) are served from the block cache.
+
+    Target-first: when the target lot can be located in the PDF text layer only
+    that crop goes to the LLM; the others are returned in `pending_lots` (see
+    extract_pending_lots) unless `full_block` is set.
     """
+    # Bytes/tokens sent to the LLM for this job vs. the unprepared images
+    image_report = start_image_report()
+    # Calls and latency per model tier
+    llm_report = start_llm_report()
     try:
+        # Create debug directory
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        debug_dir = os.path.join(os.path.dirname(pdf_path), f"{base_name}_debug")
+        if not os.path.exists(debug_dir):
+            os.makedirs(debug_dir)
+
+        # The plan covers the whole block: look it up by content
+        cache_key = None
+        if settings.BLOCK_CACHE_ENABLED:
+            cache_key = block_cache.key_for(await asyncio.to_thread(_read_bytes, pdf_path), BLOCK_CACHE_VERSION)
+            entry = await asyncio.to_thread(block_cache.get, cache_key)
+            if entry:
+                result = await extract_from_block_cache(
+                    cache_key, entry, pdf_path, debug_dir, target_lot, full_block, progress_callback
+                )
+                result["image_report"] = summarize_image_report(image_report)
+                result["llm_report"] = summarize_llm_report(llm_report)
+                return result
+
         # Open PDF
         doc = fitz.open(pdf_path)
         if doc.page_count < 1:
@@ -131,104 +760,106 @@ async def extract_data_from_pdf(
         # Get first page
         page = doc[0]
         
-        # Render page to image (pixmap) - High quality
-        pix = page.get_pixmap(matrix=fitz.Matrix(3, 3)) 
-        image_bytes = pix.tobytes("jpeg")
+        # Render page to image (pixmap) - High quality, no codec round trip
+        cv_image = render_page(page, zoom=3)
         doc.close()
         
-        # 1. Load and Preprocess
-        cv_image = load_image_from_bytes(image_bytes)
-        
-        # Create debug directory
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        debug_dir = os.path.join(os.path.dirname(pdf_path), f"{base_name}_debug")
-        if not os.path.exists(debug_dir):
-            os.makedirs(debug_dir)
+        # 1. Load and Preprocess (nothing to decode: cv_image is already the pixels)
             
-        # Save raw full map
+        # Save raw full map, the only JPEG the client asks for (write-behind: nothing below reads it back)
         raw_image_path = os.path.join(debug_dir, "full_map.jpg")
-        cv2.imwrite(raw_image_path, cv_image)
+        full_map_written = write_behind(cv2.imwrite, raw_image_path, cv_image)
         
-        image_bytes_encoded = encode_image_to_bytes(cv_image)
-        
-        # Notify full map ready
-        if progress_callback:
-            await progress_callback("full_map", {"path": raw_image_path})
+        # Notify full map ready (once it's on disk)
+        full_map_sent = notify_after([full_map_written], progress_callback, "full_map", {"path": raw_image_path})
+
+        # Vector plans: lots and text straight from the PDF layers
+        if settings.EXTRACTION_ENGINE in ("auto", "vector"):
+            try:
+                vector = await asyncio.to_thread(extraer_lotes_vectoriales, pdf_path)
+            except Exception as vector_err:
+                print(f"Vector extraction failed, using raster segmentation: {vector_err}")
+                vector = None
+            if vector:
+                print(f"Vector extraction found {len(vector['lots'])} lots")
+                await full_map_sent
+                result = await extract_vector_block(
+                    vector, cv_image, debug_dir, target_lot, full_block, cache_key, progress_callback
+                )
+                result["image_report"] = summarize_image_report(image_report)
+                result["llm_report"] = summarize_llm_report(llm_report)
+                return result
         
         # 2. Start Global Info Extraction (Background)
         print("Extracting global info (streets, headers)...")
         # We start it, but don't await immediately if we want to proceed to segmentation
-        global_info_task = asyncio.create_task(extract_global_info(image_bytes_encoded))
+        global_info_task = asyncio.create_task(extract_global_info_from_map(cv_image))
         
-        # 3. External Segmentation
+        # 3. External Segmentation, in memory (the crops go to the extractors as encoded buffers)
         print("Running external segmentation...")
         lots_output_dir = os.path.join(debug_dir, "lots")
-        if not os.path.exists(lots_output_dir):
-            os.makedirs(lots_output_dir)
             
         # Run segmentation in a thread to avoid blocking the event loop
-        # process_cadastral_map(raw_image_path, lots_output_dir)
-        await asyncio.to_thread(process_cadastral_map, raw_image_path, lots_output_dir)
-        
-        # 4. Process Extracted Lots
-        print("Processing extracted lots with LLM...")
-        # Filter out debug images like 'debug_detected_lots.jpg'
-        lot_files = sorted([f for f in os.listdir(lots_output_dir) if f.endswith(('.png', '.jpg')) and not f.startswith('debug_')])
-        
-        # Notify lots found (images ready)
-        if progress_callback:
-            await progress_callback("lots_found", {"files": lot_files, "debug_dir": debug_dir})
-            
-        # Helper wrapper to notify on completion
-        async def extract_and_notify(l_bytes, l_file):
-            res = await extract_single_lot_data(l_bytes, l_file)
-            if progress_callback:
-                await progress_callback("lot_data", res)
-            return res
+        lots = await asyncio.to_thread(segmentar_lotes, cv_image, ".png")
+        lots_meta = [{"filename": lot["filename"], "bbox": lot["bbox"], "polygon": lot["polygon"]} for lot in lots]
+        lot_files = [lot["filename"] for lot in lots_meta]
+        crops = {lot["filename"]: lot["data"] for lot in lots}
 
-        tasks = []
-        for lot_file in lot_files:
-            lot_path = os.path.join(lots_output_dir, lot_file)
-            with open(lot_path, "rb") as f:
-                lot_bytes = f.read()
-            # Use wrapper if callback exists, else direct call
-            if progress_callback:
-                tasks.append(extract_and_notify(lot_bytes, lot_file))
-            else:
-                tasks.append(extract_single_lot_data(lot_bytes, lot_file))
+        # Crops and debug image go to disk in the background; lots_found waits for them
+        lots_written = write_behind(
+            guardar_lotes, lots_output_dir, lots, cv_image if settings.SAVE_DEBUG_IMAGES else None
+        )
+        lots_found_sent = notify_after(
+            [full_map_sent, lots_written], progress_callback,
+            "lots_found", {"files": lot_files, "debug_dir": debug_dir}
+        )
+        events = events_after(lots_found_sent, progress_callback)
+
+        # 4. Process Extracted Lots (target first when it can be located)
+        to_extract, strategy = await asyncio.to_thread(plan_lot_extraction, pdf_path, lots_meta, target_lot, full_block)
+        print(f"Processing {len(to_extract)} of {len(lot_files)} lots with LLM (strategy: {strategy})...")
+        lots_task = asyncio.create_task(extract_lots(lots_output_dir, to_extract, events, crops=crops))
             
         # Wait for global info and notify
         global_info = await global_info_task
-        if progress_callback:
-            await progress_callback("global_info", global_info)
+        if events:
+            await events("global_info", global_info)
+
+        # Wait for the lots
+        lots_data = await lots_task
+        # Files on disk before the block cache copies them (and pending lots read them)
+        await lots_found_sent
 
-        # Wait for all lots
-        lots_data = await asyncio.gather(*tasks)
+        # Cache the block for every other address on it (failed lots are retried on a hit)
+        if cache_key and "error" not in global_info:
+            try:
+                await asyncio.to_thread(
+                    block_cache.put, cache_key, global_info, lot_files,
+                    {data["filename"]: data for data in lots_data},
+                    lots_meta, debug_dir
+                )
+            except Exception as cache_err:
+                print(f"Could not store block cache entry: {cache_err}")
         
         # 5. Filter for target lot if requested
-        filtered_data = lots_data
-        if target_lot:
-            print(f"Filtering for target lot: {target_lot}")
-            # Try to match exact string or simple variations
-            matches = []
-            for data in lots_data:
-                extracted_num = data.get("lot_number")
-                if extracted_num and str(extracted_num).strip() == str(target_lot).strip():
-                    matches.append(data)
-            
-            if matches:
-                filtered_data = matches
-            else:
-                print(f"Target lot {target_lot} not found in extracted data.")
-                # We keep all data if not found, or maybe just return empty?
-                # Usually better to return everything and let user see.
+        filtered_data = filter_target_lot(lots_data, target_lot)
+
+        image_report = summarize_image_report(image_report)
+        print(f"LLM images: {image_report['images']} sent, {image_report['bytes_saved']} bytes and "
+              f"~{image_report['tokens_saved']} tokens saved by preparation")
         
         return {
             "global_info": global_info,
             "lots_data": filtered_data,
-            "total_lots_found": len(lots_data),
+            "total_lots_found": len(lot_files),
+            "pending_lots": [f for f in lot_files if f not in to_extract],
+            "strategy": strategy,
             "image_path": raw_image_path,
-            "debug_dir": debug_dir
+            "debug_dir": debug_dir,
+            "cache": "miss" if cache_key else None,
+            "cache_key": cache_key,
+            "image_report": image_report,
+            "llm_report": summarize_llm_report(llm_report)
         }
             
     except Exception as e:
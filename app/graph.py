@@ -1,8 +1,7 @@
 import json
 from typing import TypedDict, Optional
 from langgraph.graph import StateGraph, END
-from app.scraper import scrape_infomapa
-from app.extractor import extract_data_from_pdf
+from app.pipeline import scrape_coalesced, extract_coalesced
 import os
 
 class AgentState(TypedDict):
@@ -10,6 +9,7 @@ class AgentState(TypedDict):
     pdf_path: Optional[str]
     screenshot_path: Optional[str]
     metadata: Optional[dict]
+    full_block: Optional[bool]
     extracted_data: Optional[dict]
     error: Optional[str]
 
@@ -20,7 +20,7 @@ async def scrape_node(state: AgentState):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
             
-        result = await scrape_infomapa(state['address'], output_dir)
+        result = await scrape_coalesced(state['address'], output_dir)
         return {
             "pdf_path": result["pdf_path"],
             "metadata": result["metadata"],
@@ -38,12 +38,10 @@ async def extract_node(state: AgentState):
     try:
         # Pass metadata (specifically Lot number) if available, 
         # though segmentation is handled externally now.
-        target_lot = state.get("metadata", {}).get("lote")
-        
-        data = await extract_data_from_pdf(
-            state['pdf_path'], 
-            target_lot=target_lot
-        )
+        data = await extract_coalesced({
+            "pdf_path": state['pdf_path'],
+            "metadata": state.get("metadata") or {}
+        }, full_block=bool(state.get("full_block")))
         return {"extracted_data": data}
     except Exception as e:
         return {"error": f"Extraction failed: {str(e)}"}
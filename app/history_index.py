@@ -0,0 +1,143 @@
+import base64
+import glob
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+
+class HistoryIndex:
+    """
+    Index of the saved searches (data/*_data.json) in SQLite.
+
+    Holds only what the history list shows (filename, address, date,
+    timestamp), so listing never opens the session files. It's updated when a
+    search is saved or deleted; the first use indexes the existing files once.
+    Pages are keyset-paginated on (timestamp, filename), newest first: the
+    cursor is the last row of the previous page.
+    """
+
+    def __init__(self, path: str = None, data_dir: str = "data"):
+        self.path = path or settings.HISTORY_INDEX_PATH
+        self.data_dir = data_dir
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history (
+                    filename TEXT PRIMARY KEY,
+                    address TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    timestamp REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS history_recent ON history(timestamp DESC, filename DESC);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS legacy_dirs (name TEXT PRIMARY KEY, watermark REAL NOT NULL);
+            """)
+            self._conn = conn
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'indexed'").fetchone() is None:
+                self._index_existing()
+        return self._conn
+
+    def _index_existing(self):
+        """One-time import of the session files saved before the index existed."""
+        count = 0
+        for path in glob.glob(os.path.join(self.data_dir, "*_data.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading history file {path}: {e}")
+                continue
+            self._upsert(os.path.basename(path), data, os.path.getmtime(path))
+            count += 1
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed', ?)", (str(count),))
+        self._conn.commit()
+        print(f"History index built: {count} searches")
+
+    def _upsert(self, filename: str, session_data: Dict[str, Any], mtime: float = None):
+        mtime = mtime if mtime is not None else datetime.now().timestamp()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO history (filename, address, date, timestamp) VALUES (?, ?, ?, ?)",
+            (
+                filename,
+                session_data.get("address") or filename.replace("_data.json", "").replace("_", " "),
+                session_data.get("date") or datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M"),
+                float(session_data.get("timestamp") or mtime),
+            )
+        )
+
+    def upsert(self, filename: str, session_data: Dict[str, Any]):
+        """Records a saved search (same filename: replaces it)."""
+        with self._lock:
+            self._db()
+            self._upsert(filename, session_data)
+            self._conn.commit()
+
+    def delete(self, filename: str):
+        with self._lock:
+            self._db().execute("DELETE FROM history WHERE filename = ?", (filename,))
+            self._conn.commit()
+
+    def legacy_watermarks(self) -> Dict[str, float]:
+        """_debug folder -> mtime it had when legacy recovery last checked it."""
+        with self._lock:
+            return dict(self._db().execute("SELECT name, watermark FROM legacy_dirs").fetchall())
+
+    def set_legacy_watermark(self, name: str, watermark: float):
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO legacy_dirs (name, watermark) VALUES (?, ?)", (name, watermark))
+            self._conn.commit()
+
+    @staticmethod
+    def encode_cursor(timestamp: float, filename: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([timestamp, filename]).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[float, str]:
+        """Raises ValueError on a malformed cursor."""
+        try:
+            timestamp, filename = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return float(timestamp), str(filename)
+        except Exception as e:
+            raise ValueError(f"Invalid cursor: {cursor}") from e
+
+    def page(self, limit: int = None, cursor: str = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Searches newest first, starting after `cursor`; all of them without `limit`.
+        Returns (items, next_cursor), next_cursor None on the last page.
+        """
+        query = "SELECT filename, address, date, timestamp FROM history"
+        params: list = []
+        if cursor:
+            timestamp, filename = self.decode_cursor(cursor)
+            query += " WHERE timestamp < ? OR (timestamp = ? AND filename < ?)"
+            params += [timestamp, timestamp, filename]
+        query += " ORDER BY timestamp DESC, filename DESC"
+        if limit:
+            # One extra row tells whether there's a next page
+            query += " LIMIT ?"
+            params.append(limit + 1)
+        with self._lock:
+            rows = self._db().execute(query, params).fetchall()
+
+        items = [{"filename": r[0], "address": r[1], "date": r[2], "timestamp": r[3]} for r in rows]
+        next_cursor = None
+        if limit and len(items) > limit:
+            items = items[:limit]
+            next_cursor = self.encode_cursor(items[-1]["timestamp"], items[-1]["filename"])
+        return items, next_cursor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._db().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        return {"entries": count}
+
+history_index = HistoryIndex()
@@ -0,0 +1,22 @@
+import httpx
+from app.core.config import settings
+
+# One pooled client per process (keep-alive connections to the municipal hosts)
+_client: httpx.AsyncClient = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared async HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.HTTP_TIMEOUT,
+            follow_redirects=True,
+            headers={"User-Agent": "Mozilla/5.0 (kadasprop)"},
+        )
+    return _client
+
+async def close_http_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -1,7 +1,12 @@
 import cv2
+import fitz  # PyMuPDF
+import math
 import numpy as np
 import io
-from typing import List, Tuple, Optional
+import contextvars
+from dataclasses import dataclass
+from typing import List, Tuple, Optional, Dict, Any
+from app.core.config import settings
 
 def load_image_from_bytes(image_bytes: bytes) -> np.ndarray:
     """Load image from bytes into OpenCV format."""
@@ -13,3 +18,201 @@ def encode_image_to_bytes(image: np.ndarray) -> bytes:
     """Encodes OpenCV image to bytes (JPEG)."""
     success, encoded_image = cv2.imencode('.jpg', image)
     return encoded_image.tobytes()
+
+# --- Rendering PDF pages ---
+
+class _PixmapSamples(np.ndarray):
+    """Array over a pixmap's samples that keeps the pixmap (and so the memory) alive."""
+    _pixmap = None
+
+def render_page(page, zoom: float = 3, grayscale: bool = None) -> np.ndarray:
+    """
+    Renders `page` straight to an OpenCV-ready array, without the JPEG
+    round trip: grayscale (H, W) when RENDER_GRAYSCALE, a view over the
+    pixmap samples with no copy; else BGR (H, W, 3), which costs one
+    conversion copy from MuPDF's RGB.
+    """
+    grayscale = settings.RENDER_GRAYSCALE if grayscale is None else grayscale
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom),
+                          colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+    samples = np.frombuffer(pix.samples_mv, np.uint8).view(_PixmapSamples)
+    # The samples are freed with the pixmap: every view of `samples` holds it through .base
+    samples._pixmap = pix
+    rows = samples.reshape(pix.height, pix.stride)[:, :pix.width * pix.n]
+    image = rows.reshape(pix.height, pix.width, pix.n).view(np.ndarray)
+    if grayscale:
+        return image[:, :, 0]
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+# --- Preparing images for the LLM ---
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    original_bytes: int
+    original_tokens: int
+
+    @property
+    def tokens(self) -> int:
+        return estimate_image_tokens(self.width, self.height)
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Vision token estimate (high detail): fit in 2048², shortest side to 768, 170 per 512px tile + 85."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+def estimate_text_height(gray: np.ndarray) -> Optional[float]:
+    """Median height (px) of glyph-like dark components, or None if there's too little text."""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    w, h, area = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    # Glyphs: small, not much wider than tall, not a speck (lines are long and thin)
+    glyphs = (h >= 6) & (h <= 150) & (w <= h * 2) & (area >= 12)
+    if np.count_nonzero(glyphs) < 3:
+        return None
+    return float(np.median(h[glyphs]))
+
+def _psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def _encode_adaptive(image: np.ndarray) -> Tuple[bytes, str]:
+    """Lowest quality whose decoded image keeps LLM_MIN_PSNR against the input."""
+    fmt = settings.LLM_IMAGE_FORMAT.lower()
+    ext, flag, mime = (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp") if fmt == "webp" \
+        else (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg")
+    best = None
+    for quality in sorted(settings.LLM_IMAGE_QUALITIES, reverse=True):
+        ok, encoded = cv2.imencode(ext, image, [flag, quality])
+        if not ok:
+            continue
+        if best is not None and _psnr(image, cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)) < settings.LLM_MIN_PSNR:
+            break
+        best = encoded
+    if best is None:
+        raise ValueError(f"Could not encode a {image.shape} image as {fmt} at qualities {settings.LLM_IMAGE_QUALITIES}")
+    return best.tobytes(), mime
+
+def prepare_image(image: np.ndarray, original_bytes: int = None, original_tokens: int = None,
+                  target_text_height: float = None) -> PreparedImage:
+    """
+    Downsamples `image` so its text is about `target_text_height` px tall
+    (never upsamples) and encodes it at the lowest quality that keeps
+    LLM_MIN_PSNR. Images are converted to grayscale: the plans are black on white.
+    """
+    target_text_height = target_text_height or settings.LLM_TARGET_TEXT_PX
+    if original_tokens is None:
+        original_tokens = estimate_image_tokens(image.shape[1], image.shape[0])
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    scale = 1.0
+    text_height = estimate_text_height(gray)
+    if text_height:
+        scale = min(1.0, target_text_height / text_height)
+    # The API downsizes past 2048 px anyway
+    scale = max(settings.LLM_MIN_SCALE, min(scale, 2048 / max(gray.shape)))
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    data, mime = _encode_adaptive(gray)
+    prepared = PreparedImage(
+        data=data, mime=mime, width=gray.shape[1], height=gray.shape[0],
+        original_bytes=original_bytes if original_bytes is not None else image.nbytes,
+        original_tokens=original_tokens
+    )
+    record_prepared(prepared)
+    return prepared
+
+def prepare_crop(image_bytes: bytes) -> PreparedImage:
+    """prepare_image for an encoded lot crop."""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return prepare_image(image, original_bytes=len(image_bytes))
+
+def find_block_bbox(gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """Bounding box (x, y, w, h) of the block drawing: the largest connected line structure."""
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    binary = cv2.dilate(binary, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    img_h, img_w = gray.shape[:2]
+    # Nothing found, or the "block" is the whole sheet (a frame): no margins to keep
+    if w * h < 0.05 * img_w * img_h or w * h > 0.95 * img_w * img_h:
+        return None
+    return x, y, w, h
+
+def margin_bands(image: np.ndarray, block_bbox: Tuple[int, int, int, int] = None, overlap: float = 0.03) -> Optional[np.ndarray]:
+    """
+    The margins around the block (where street names and headers are printed)
+    as one sheet: top and bottom bands as is, left and right bands rotated
+    upright, stacked vertically. `overlap` keeps a strip of the block edge so
+    labels touching the outline aren't cut. None if no margins can be told.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    bbox = block_bbox or find_block_bbox(gray)
+    if bbox is None:
+        return None
+    img_h, img_w = gray.shape[:2]
+    x, y, w, h = bbox
+    pad = int(max(img_w, img_h) * overlap)
+    bands = [
+        gray[:min(img_h, y + pad), :],
+        gray[max(0, y + h - pad):, :],
+        cv2.rotate(gray[:, :min(img_w, x + pad)], cv2.ROTATE_90_CLOCKWISE),
+        cv2.rotate(gray[:, max(0, x + w - pad):], cv2.ROTATE_90_CLOCKWISE),
+    ]
+    bands = [band for band in bands if band.shape[0] > pad and band.shape[1] > 0]
+    if not bands:
+        return None
+    width = max(band.shape[1] for band in bands)
+    separator = np.zeros((4, width), np.uint8)
+    rows = []
+    for band in bands:
+        if band.shape[1] < width:
+            band = cv2.copyMakeBorder(band, 0, 0, 0, width - band.shape[1], cv2.BORDER_CONSTANT, value=255)
+        rows.extend([band, separator])
+    return np.vstack(rows[:-1])
+
+def prepare_global_image(image: np.ndarray, original_bytes: int = None) -> PreparedImage:
+    """Image for the global-info call: the margin bands if LLM_GLOBAL_MARGINS_ONLY, else the whole map."""
+    original_tokens = estimate_image_tokens(image.shape[1], image.shape[0])
+    source = image
+    if settings.LLM_GLOBAL_MARGINS_ONLY:
+        bands = margin_bands(image)
+        if bands is not None:
+            source = bands
+    return prepare_image(source, original_bytes=original_bytes, original_tokens=original_tokens)
+
+# --- Per-job savings report ---
+
+_image_report: contextvars.ContextVar = contextvars.ContextVar("image_report", default=None)
+
+def start_image_report() -> Dict[str, Any]:
+    """Starts counting prepared images for the current job (tasks and threads it spawns included)."""
+    report = {"images": 0, "original_bytes": 0, "sent_bytes": 0, "original_tokens": 0, "sent_tokens": 0}
+    _image_report.set(report)
+    return report
+
+def record_prepared(prepared: PreparedImage):
+    report = _image_report.get()
+    if report is None:
+        return
+    report["images"] += 1
+    report["original_bytes"] += prepared.original_bytes
+    report["sent_bytes"] += len(prepared.data)
+    report["original_tokens"] += prepared.original_tokens
+    report["sent_tokens"] += prepared.tokens
+
+def summarize_image_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **report,
+        "bytes_saved": report["original_bytes"] - report["sent_bytes"],
+        "tokens_saved": report["original_tokens"] - report["sent_tokens"],
+    }
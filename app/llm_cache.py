@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+import cv2
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+from app.core.config import settings
+
+# Verification thumbnail: candidates found by perceptual hash are compared
+# pixel-wise at this size, so crops that only differ in the lot number digits
+# (same shape, same dimensions) don't share a cached result.
+THUMB_SIZE = 160
+THUMB_PIXEL_DIFF = 64
+
+class LLMCache:
+    """
+    Persistent cache of per-crop LLM results (SQLite).
+
+    Crops are keyed by a 64-bit difference hash (dHash) plus the prompt
+    version, so a re-rendered or re-encoded crop of the same lot hits the
+    cache. Lookups go through 8 one-byte bands of the hash (pigeonhole: any
+    hash within 7 bits shares a band), then the Hamming distance and a
+    thumbnail comparison confirm the match. Least recently used entries are
+    evicted once the database grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None, max_distance: int = None, max_diff: float = None):
+        self.path = path or settings.LLM_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else settings.LLM_CACHE_MAX_MB * 1024 * 1024
+        self.max_distance = min(7, max_distance if max_distance is not None else settings.LLM_CACHE_MAX_DISTANCE)
+        self.max_diff = max_diff if max_diff is not None else settings.LLM_CACHE_MAX_DIFF
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    id INTEGER PRIMARY KEY,
+                    phash TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    width INTEGER, height INTEGER,
+                    thumb BLOB,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_used);
+                CREATE TABLE IF NOT EXISTS bands (
+                    band INTEGER NOT NULL, value INTEGER NOT NULL, entry_id INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS bands_lookup ON bands(band, value);
+                CREATE INDEX IF NOT EXISTS bands_entry ON bands(entry_id);
+            """)
+            self._conn = conn
+        return self._conn
+
+    # --- Hashing ---
+
+    @staticmethod
+    def fingerprint(image_bytes: bytes) -> Optional[Tuple[int, Tuple[int, int], np.ndarray]]:
+        """(dHash, (width, height), thumbnail) of an encoded crop, or None if it doesn't decode."""
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return None
+        small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        phash = int.from_bytes(np.packbits(bits).tobytes(), "big")
+        thumb = cv2.resize(img, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA)
+        return phash, (img.shape[1], img.shape[0]), thumb
+
+    @staticmethod
+    def _bands(phash: int):
+        return [(band, (phash >> (band * 8)) & 0xFF) for band in range(8)]
+
+    def _same_crop(self, size, thumb, row) -> bool:
+        width, height, thumb_blob = row
+        # Different proportions: different lot, whatever the hash says
+        if abs(width / height - size[0] / size[1]) > 0.05 * (size[0] / size[1]):
+            return False
+        other = np.frombuffer(zlib.decompress(thumb_blob), np.uint8).reshape(THUMB_SIZE, THUMB_SIZE)
+        differing = np.count_nonzero(cv2.absdiff(thumb, other) > THUMB_PIXEL_DIFF)
+        return differing <= self.max_diff * THUMB_SIZE * THUMB_SIZE
+
+    # --- API ---
+
+    def get(self, image_bytes: bytes, version: str) -> Optional[Dict[str, Any]]:
+        fp = self.fingerprint(image_bytes)
+        if fp is None:
+            return None
+        phash, size, thumb = fp
+        with self._lock:
+            db = self._db()
+            clauses = " OR ".join("(band = ? AND value = ?)" for _ in range(8))
+            params = [v for pair in self._bands(phash) for v in pair]
+            rows = db.execute(
+                f"SELECT DISTINCT e.id, e.phash, e.width, e.height, e.thumb, e.result FROM bands b "
+                f"JOIN entries e ON e.id = b.entry_id WHERE e.version = ? AND ({clauses})",
+                [version] + params
+            ).fetchall()
+
+            best = None
+            for entry_id, other_hash, width, height, thumb_blob, result in rows:
+                distance = bin(phash ^ int(other_hash, 16)).count("1")
+                if distance > self.max_distance or (best and distance >= best[0]):
+                    continue
+                if self._same_crop(size, thumb, (width, height, thumb_blob)):
+                    best = (distance, entry_id, result)
+
+            if best is None:
+                self.misses += 1
+                return None
+            distance, entry_id, result = best
+            db.execute("UPDATE entries SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            db.commit()
+        if distance == 0:
+            self.hits += 1
+        else:
+            self.near_hits += 1
+        return json.loads(result)
+
+    def put(self, image_bytes: bytes, version: str, result: Dict[str, Any]):
+        fp = self.fingerprint(image_bytes)
+        if fp is None:
+            return
+        phash, size, thumb = fp
+        payload = json.dumps(result, ensure_ascii=False)
+        thumb_blob = zlib.compress(thumb.tobytes())
+        with self._lock:
+            db = self._db()
+            cur = db.execute(
+                "INSERT INTO entries (phash, version, width, height, thumb, result, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (f"{phash:016x}", version, size[0], size[1], thumb_blob, payload,
+                 len(payload) + len(thumb_blob), time.time())
+            )
+            db.executemany(
+                "INSERT INTO bands (band, value, entry_id) VALUES (?, ?, ?)",
+                [(band, value, cur.lastrowid) for band, value in self._bands(phash)]
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for entry_id, size in db.execute("SELECT id, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+            db.execute("DELETE FROM bands WHERE entry_id = ?", (entry_id,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": total,
+        }
+
+llm_cache = LLMCache()
@@ -0,0 +1,169 @@
+import asyncio
+import contextvars
+import random
+import time
+from typing import Dict, Any, Optional
+from app.core.config import settings
+from app.ratelimit import TokenBucket
+
+class LLMDispatcher:
+    """
+    Single gate for every LLM call in the process.
+
+    - Concurrency cap (semaphore) shared by all jobs, so several blocks being
+      extracted at once can't fan out past it together.
+    - Token bucket on request starts.
+    - Per-attempt timeout, and retries with jittered exponential backoff on
+      timeouts, connection errors, 429 and 5xx (honoring Retry-After).
+    - One deadline for the whole call (queueing, attempts and backoff), so a
+      lot never waits on retries longer than LLM_CALL_DEADLINE.
+    The client's own retries should be off (max_retries=0) so they don't stack.
+    """
+
+    def __init__(self, max_concurrency: int = None, rate: float = None, burst: int = None):
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._bucket = TokenBucket(rate or settings.LLM_RATE_PER_SEC, burst or settings.LLM_BURST)
+        self._in_flight = 0
+
+        # Metrics
+        self._calls = 0
+        self._retries = 0
+        self._timeouts = 0
+        self._deadlines = 0
+        self._failures = 0
+        self._total_latency = 0.0
+
+    async def invoke(self, llm, messages, timeout: float = None, max_retries: int = None, deadline: float = None):
+        """
+        llm.ainvoke(messages) under the shared limits; raises the last error once
+        retries run out, or TimeoutError once `deadline` seconds have gone by.
+        """
+        deadline_cm = asyncio.timeout(deadline or settings.LLM_CALL_DEADLINE)
+        try:
+            async with deadline_cm:
+                return await self._invoke(llm, messages, timeout, max_retries)
+        except TimeoutError:
+            if deadline_cm.expired():
+                self._deadlines += 1
+                self._failures += 1
+                _record_call(llm, None)
+                print(f"LLM call gave up after {deadline or settings.LLM_CALL_DEADLINE:.0f}s deadline", flush=True)
+            raise
+
+    async def _invoke(self, llm, messages, timeout: float = None, max_retries: int = None):
+        timeout = timeout or settings.LLM_TIMEOUT
+        max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    self._in_flight += 1
+                    try:
+                        response = await asyncio.wait_for(llm.ainvoke(messages), timeout)
+                    finally:
+                        self._in_flight -= 1
+                latency = time.perf_counter() - start
+                self._calls += 1
+                self._total_latency += latency
+                _record_call(llm, latency)
+                return response
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self._timeouts += 1
+                if attempt >= max_retries or not self._retryable(e):
+                    self._failures += 1
+                    _record_call(llm, None)
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self._retries += 1
+                print(f"LLM call failed ({type(e).__name__}), retry {attempt}/{max_retries} in {delay:.1f}s", flush=True)
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _status_code(e: Exception) -> Optional[int]:
+        status = getattr(e, "status_code", None)
+        if status is None and getattr(e, "response", None) is not None:
+            status = getattr(e.response, "status_code", None)
+        return status
+
+    def _retryable(self, e: Exception) -> bool:
+        if isinstance(e, (asyncio.TimeoutError, ConnectionError)):
+            return True
+        # openai.APIConnectionError / APITimeoutError carry no status code
+        if type(e).__name__ in ("APIConnectionError", "APITimeoutError"):
+            return True
+        status = self._status_code(e)
+        return status is not None and (status == 429 or status >= 500)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        response = getattr(e, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), settings.LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(settings.LLM_BACKOFF_MAX, settings.LLM_BACKOFF_BASE * 2 ** attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "calls": self._calls,
+            "retries": self._retries,
+            "timeouts": self._timeouts,
+            "deadlines_exceeded": self._deadlines,
+            "failures": self._failures,
+            "avg_latency_ms": round(self._total_latency / self._calls * 1000, 1) if self._calls else 0.0,
+            "rate": self._bucket.stats(),
+        }
+
+llm_dispatcher = LLMDispatcher()
+
+# --- Per-job report: calls and latency per model tier ---
+
+_llm_report: contextvars.ContextVar = contextvars.ContextVar("llm_report", default=None)
+
+def start_llm_report() -> Dict[str, Any]:
+    """Starts recording LLM calls for the current job (tasks and threads it spawns included)."""
+    report: Dict[str, Any] = {}
+    _llm_report.set(report)
+    return report
+
+def _tier(model: str) -> Optional[Dict[str, Any]]:
+    report = _llm_report.get()
+    if report is None:
+        return None
+    return report.setdefault(model, {"calls": 0, "failures": 0, "escalated": 0, "total_latency": 0.0})
+
+def _record_call(llm, latency: Optional[float]):
+    tier = _tier(getattr(llm, "model_name", None) or type(llm).__name__)
+    if tier is None:
+        return
+    if latency is None:
+        tier["failures"] += 1
+    else:
+        tier["calls"] += 1
+        tier["total_latency"] += latency
+
+def record_escalation(model: str, count: int):
+    """`count` items were passed on from `model` to the next tier of the cascade."""
+    tier = _tier(model)
+    if tier is not None:
+        tier["escalated"] += count
+
+def summarize_llm_report(report: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        model: {
+            "calls": tier["calls"],
+            "failures": tier["failures"],
+            "escalated": tier["escalated"],
+            "avg_latency_ms": round(tier["total_latency"] / tier["calls"] * 1000, 1) if tier["calls"] else 0.0,
+        }
+        for model, tier in report.items()
+    }
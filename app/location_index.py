@@ -0,0 +1,235 @@
+"""
+Local index of the ubicaciones dataset, for location autocomplete without
+a round trip to ws.rosario.gob.ar.
+
+    python -m app.location_index build dump.geojson [more.geojson ...] [--complete]
+    python -m app.location_index stats
+    python -m app.location_index search "CORDOBA 10"
+
+The dump is one or more GeoJSON FeatureCollections as the ubicaciones API
+returns them (or JSON Lines of features). The index file holds one line per
+feature, "<normalized label>\\t<feature JSON>" (a .tsv), sorted by label, after
+a header line "\\t<build info JSON>". It's loaded into parallel arrays plus a
+sorted word list, and searched with bisect. Features are kept as JSON text
+and only decoded for the matches.
+
+Only an index built with --complete (the dump is the whole dataset) answers
+searches ahead of the remote API; a partial one is a fallback for when the
+API fails.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.singleflight import normalize_address
+
+def feature_label(feature: Dict[str, Any]) -> str:
+    properties = feature.get("properties") or {}
+    return str(properties.get("descripcion") or properties.get("name") or "")
+
+def label_matches(label: str, tokens: List[str]) -> bool:
+    """
+    Match rule of location suggestions (`label` and `tokens` normalized):
+    every query token is a word of the label, except the last one, which may
+    still be half typed and only has to start a word. "CORDOBA 10" matches
+    CORDOBA 1050 and BV CORDOBA 10, not CORDOBA 1100 or BV CORDOBA 510.
+    """
+    if not tokens:
+        return False
+    words = label.split()
+    *whole, last = tokens
+    return all(token in words for token in whole) and any(word.startswith(last) for word in words)
+
+class LocationIndex:
+    """
+    Sorted array of normalized labels (case, accents and spacing ignored,
+    like the autocomplete cache keys) over the dataset features, plus a
+    sorted list of their words. Queries match like the remote API results
+    are filtered (`label_matches`): candidates come from the word list, by
+    the longest whole token or else the last token as a prefix.
+    Searches never touch the disk: the file is (re)loaded by `load()` in the
+    background (see `watch_location_index`), and until the first load
+    finishes every search is a miss.
+    """
+
+    def __init__(self, path: str = None, limit: int = None):
+        self.path = path or settings.LOCATIONS_INDEX_PATH
+        self.limit = limit or settings.LOCATIONS_INDEX_LIMIT
+        # (keys, features, words, word_entries) swapped in one assignment, so a search never mixes two loads
+        self._entries: Tuple[List[str], List[str], List[str], List[int]] = ([], [], [], [])
+        # Build info from the header line; "complete" means the dump was the whole dataset
+        self.info: Dict[str, Any] = {}
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.load_ms = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """Loads the index file if it changed since the last load (no file: empty index). Blocking."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            start = time.perf_counter()
+            keys, features, info = [], [], {}
+            if mtime is not None:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        key, _, feature = line.rstrip("\n").partition("\t")
+                        if not key:
+                            info = json.loads(feature)
+                        elif feature:
+                            keys.append(key)
+                            features.append(feature)
+                print(f"Location index loaded: {len(keys)} entries")
+            word_pairs = sorted((word, i) for i, key in enumerate(keys) for word in set(key.split()))
+            words = [word for word, _ in word_pairs]
+            word_entries = [i for _, i in word_pairs]
+            self._entries, self.info, self._mtime = (keys, features, words, word_entries), info, mtime
+            self.load_ms = (time.perf_counter() - start) * 1000
+
+    @property
+    def complete(self) -> bool:
+        """True if the index holds the whole dataset, so its results are the remote API's."""
+        return bool(self.info.get("complete"))
+
+    def search(self, query: str) -> Optional[Dict[str, Any]]:
+        """FeatureCollection of the labels matching `query` (by label order), or None on a miss (or no index)."""
+        tokens = normalize_address(query).split()
+        keys, features, words, word_entries = self._entries
+        if not tokens or not keys:
+            self.misses += 1
+            return None
+        *whole, last = tokens
+        if whole:
+            anchor = max(whole, key=len)
+            start, end = bisect.bisect_left(words, anchor), bisect.bisect_right(words, anchor)
+        else:
+            start, end = bisect.bisect_left(words, last), bisect.bisect_left(words, last + "\uffff")
+
+        matches = []
+        for i in sorted(set(word_entries[start:end])):
+            if label_matches(keys[i], tokens):
+                matches.append(i)
+                if len(matches) == self.limit:
+                    break
+        if not matches:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"type": "FeatureCollection", "features": [json.loads(features[i]) for i in matches]}
+
+    def stats(self) -> Dict[str, Any]:
+        keys, features, words, word_entries = self._entries
+        key_bytes = sum(sys.getsizeof(k) for k in keys)
+        feature_bytes = sum(sys.getsizeof(f) for f in features)
+        list_bytes = sum(sys.getsizeof(l) for l in (keys, features, words, word_entries))
+        return {
+            "entries": len(keys),
+            "complete": self.complete,
+            "memory_mb": round((key_bytes + feature_bytes + list_bytes) / (1024 * 1024), 2),
+            "load_ms": round(self.load_ms, 1),
+            "loading": self._lock.locked(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+location_index = LocationIndex()
+
+async def watch_location_index(interval: float = None):
+    """Loads the index, then picks up rebuilds every `interval` seconds. Runs until cancelled."""
+    interval = interval or settings.LOCATIONS_INDEX_CHECK_INTERVAL
+    while True:
+        try:
+            await asyncio.to_thread(location_index.load)
+        except Exception as e:
+            print(f"Location index load failed: {e}")
+        await asyncio.sleep(interval)
+
+def _read_dump(path: str) -> List[Dict[str, Any]]:
+    """Features of a FeatureCollection file, or of a JSON Lines file of features/collections."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        documents = [json.loads(text)]
+    except ValueError:
+        documents = [json.loads(line) for line in text.splitlines() if line.strip()]
+    features = []
+    for document in documents:
+        if isinstance(document, dict) and "features" in document:
+            features.extend(document["features"] or [])
+        elif isinstance(document, dict):
+            features.append(document)
+    return features
+
+def build_index(dump_paths: List[str], out_path: str = None, complete: bool = False) -> int:
+    """
+    Writes the index file from the dump(s); duplicate labels keep the first
+    feature. `complete`: the dumps are the whole dataset (see LocationIndex.complete).
+    Returns the entry count.
+    """
+    out_path = out_path or settings.LOCATIONS_INDEX_PATH
+    entries = {}
+    for path in dump_paths:
+        for feature in _read_dump(path):
+            key = normalize_address(feature_label(feature))
+            if key and key not in entries:
+                entries[key] = json.dumps(feature, ensure_ascii=False, separators=(",", ":"))
+
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    # Write-then-rename so a running server never loads half an index
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\t" + json.dumps({"complete": complete, "built_at": time.time(), "dumps": dump_paths}) + "\n")
+        for key in sorted(entries):
+            f.write(f"{key}\t{entries[key]}\n")
+    os.replace(tmp_path, out_path)
+    return len(entries)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Rebuild the index from dump files")
+    build.add_argument("dumps", nargs="+")
+    build.add_argument("--out", default=None, help=f"Index file (default: {settings.LOCATIONS_INDEX_PATH})")
+    build.add_argument("--complete", action="store_true",
+                       help="The dumps are the whole dataset: answer searches without the remote API")
+    sub.add_parser("stats", help="Entries and memory footprint of the current index")
+    search = sub.add_parser("search", help="Query the index")
+    search.add_argument("query")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_index(args.dumps, args.out, args.complete)
+        print(f"Indexed {count} locations into {args.out or settings.LOCATIONS_INDEX_PATH} "
+              f"in {time.perf_counter() - start:.1f}s")
+    elif args.command == "stats":
+        location_index.load()
+        print(json.dumps(location_index.stats(), indent=2))
+    else:
+        location_index.load()
+        start = time.perf_counter()
+        result = location_index.search(args.query)
+        elapsed = (time.perf_counter() - start) * 1e6
+        for feature in (result or {}).get("features", []):
+            print(feature_label(feature))
+        print(f"{len((result or {}).get('features', []))} results in {elapsed:.0f} µs" if result else "Miss")
+
+if __name__ == "__main__":
+    main()
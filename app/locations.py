@@ -0,0 +1,133 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+from urllib.parse import quote
+from app.core.config import settings
+from app.http_client import get_http_client
+from app.location_index import location_index, feature_label, label_matches
+from app.singleflight import SingleFlight, normalize_address
+
+LOCATIONS_URL = "https://ws.rosario.gob.ar/ubicaciones/public/geojson/ubicaciones/all/all/{query}"
+
+class LocationCache:
+    """
+    In-memory TTL + LRU cache of location search results (GeoJSON FeatureCollections).
+
+    Keys are normalized queries (case, accents and spacing ignored). The
+    upstream API doesn't document how many features it returns, so the cap is
+    learned: a result smaller than the largest one seen can't have been cut
+    short and is taken as the complete set for its query. A longer query that
+    adds words to it ("CORDOBA" -> "CORDOBA 10") is then answered by filtering
+    that set instead of asking upstream. Prefixes ending mid-word ("CORDOBA 1"
+    for "CORDOBA 10") aren't reused: how upstream matches a partial word isn't
+    known, so their results may not hold every extension.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries or settings.LOCATIONS_CACHE_SIZE
+        self.ttl = ttl or settings.LOCATIONS_CACHE_TTL
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Most features any result had (derived results are never larger than their source)
+        self.largest_result = 0
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+    def _get_fresh(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        result = self._get_fresh(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        # Longest cached whole-word prefix whose result set is complete
+        for end in range(len(key) - 1, 2, -1):
+            if key[end] != " ":
+                continue
+            prefix_result = self._get_fresh(key[:end])
+            if prefix_result is None:
+                continue
+            features = prefix_result.get("features") or []
+            if len(features) >= self.largest_result:
+                continue
+            tokens = key.split()
+            result = {
+                **prefix_result,
+                "features": [f for f in features if _matches(f, tokens)],
+            }
+            self.prefix_hits += 1
+            self.put(key, result)
+            return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        self.largest_result = max(self.largest_result, len(result.get("features") or []))
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "largest_result": self.largest_result,
+        }
+
+def _matches(feature: Dict[str, Any], tokens: list) -> bool:
+    """Same rule as the local index (`label_matches`), on the feature's normalized label."""
+    return label_matches(normalize_address(feature_label(feature)), tokens)
+
+location_cache = LocationCache()
+# Identical searches in flight (several tabs, or keystrokes racing) share one upstream call
+location_flights = SingleFlight("locations")
+
+async def _fetch_locations(query: str) -> Dict[str, Any]:
+    url = LOCATIONS_URL.format(query=quote(query))
+    response = await get_http_client().get(url, timeout=settings.LOCATIONS_TIMEOUT)
+    if response.status_code != 200:
+        return {"features": [], "error": f"Upstream API error: {response.status_code}"}
+    return response.json()
+
+async def search_locations(query: str) -> Dict[str, Any]:
+    """
+    Location suggestions for `query`: the local dataset index when it holds
+    the whole dataset, then the cache, then one coalesced upstream call.
+    Errors aren't cached; a partial index answers when the upstream call fails.
+    """
+    if location_index.complete:
+        local = location_index.search(query)
+        if local is not None:
+            return local
+
+    key = normalize_address(query)
+    cached = location_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch(emit):
+        try:
+            result = await _fetch_locations(query)
+        except Exception as e:
+            result = {"features": [], "error": str(e)}
+        if "error" not in result:
+            location_cache.put(key, result)
+        elif not location_index.complete:
+            return location_index.search(query) or result
+        return result
+
+    return await location_flights.do(key, fetch)
@@ -5,26 +5,70 @@ import aiofiles
 # Add project root to sys.path to allow running as script
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from app.graph import app_graph
 from app.core.config import settings
 import asyncio
-from app.scraper import scrape_infomapa
-from app.extractor import extract_data_from_pdf
+from app.scraper import prewarm_infomapa
+from app.browser_pool import browser_pool
+from app.scheduler import scrape_scheduler
+from app.http_client import close_http_client
+from app.pipeline import scrape_coalesced, extract_coalesced
+from app.extractor import extract_pending_lots, start_lot_extractors, shutdown_lot_extractors
+from app.singleflight import scrape_flights, extract_flights
+from app.block_cache import block_cache
+from app.llm_cache import llm_cache
+from app.llm_dispatcher import llm_dispatcher
+from app.history_index import history_index
+from app.locations import search_locations, location_cache, location_flights
+from app.location_index import location_index, watch_location_index
+from app.tile_cache import WMS_SERVICES, get_tile, tile_cache, tile_flights
 import json
-import requests
-from urllib.parse import quote
 import re
 import shutil
+from contextlib import asynccontextmanager
 
 # Fix for Windows asyncio loop policy to support subprocesses (needed for Playwright)
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-app = FastAPI(title="InfoMapa Scraper API")
+# Fire-and-forget tasks started by the app: referenced here until they finish
+# (the loop only keeps weak references), cancelled on shutdown
+_background_tasks: set = set()
+
+def spawn_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up the shared browser so the first scrape doesn't pay the launch
+    try:
+        await browser_pool.start()
+        # Park a map page so the first lookup skips navigation
+        spawn_background(prewarm_infomapa())
+    except Exception as e:
+        print(f"Browser pool failed to start, will retry on first scrape: {e}")
+    # OCR workers come up now, before any request threads exist
+    start_lot_extractors()
+    # Recover searches saved before the history index, off the request path
+    start_legacy_sync()
+    # Load the local location index (if built) and reload it when it's rebuilt,
+    # off the event loop; searches only read what's already loaded
+    spawn_background(watch_location_index())
+    yield
+    for task in list(_background_tasks):
+        task.cancel()
+    await browser_pool.stop()
+    await close_http_client()
+    shutdown_lot_extractors()
+
+app = FastAPI(title="InfoMapa Scraper API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -33,6 +77,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount data directory to serve images
@@ -46,6 +91,7 @@ from datetime import datetime
 
 class ScrapeRequest(BaseModel):
     address: str
+    full_block: bool = False
 
 class HistoryItem(BaseModel):
     filename: str
@@ -53,141 +99,194 @@ class HistoryItem(BaseModel):
     date: str
     timestamp: float
 
-async def sync_legacy_history(data_dir: str):
+# Legacy history recovery runs in the background (startup, POST /history/sync),
+# never on reads. Folders whose mtime matches the recorded watermark are skipped.
+legacy_sync_status = {
+    "state": "idle", "total": 0, "scanned": 0, "unchanged": 0, "recovered": 0, "errors": 0,
+    "started_at": None, "finished_at": None
+}
+_legacy_sync_task: asyncio.Task = None
+
+def _list_debug_dirs(data_dir: str) -> list:
+    """(folder name, watermark) of every _debug folder; the watermark also covers lots/."""
+    debug_dirs = []
+    for debug_path in glob.glob(os.path.join(data_dir, "*_debug")):
+        if not os.path.isdir(debug_path):
+            continue
+        watermark = os.path.getmtime(debug_path)
+        lots_dir = os.path.join(debug_path, "lots")
+        if os.path.isdir(lots_dir):
+            watermark = max(watermark, os.path.getmtime(lots_dir))
+        debug_dirs.append((os.path.basename(debug_path), watermark))
+    return debug_dirs
+
+async def recover_legacy_search(data_dir: str, debug_path: str) -> bool:
     """
-    Scans for existing _debug folders and creates corresponding _data.json files
-    if they don't exist, to populate history with previous searches.
+    Creates the _data.json of a _debug folder if it doesn't exist (or is
+    broken/incomplete), to populate history with previous searches.
+    Returns True if it was (re)generated.
     """
-    try:
-        # Find all debug directories
-        debug_dirs = glob.glob(os.path.join(data_dir, "*_debug"))
+    dir_name = os.path.basename(debug_path)
+    # base_name is dir_name without _debug
+    base_name = dir_name.replace("_debug", "")
+    json_filename = f"{base_name}_data.json"
+    json_path = os.path.join(data_dir, json_filename)
+    
+    # Check if JSON exists
+    should_regenerate = False
+    if not os.path.exists(json_path):
+        should_regenerate = True
+    else:
+        # Check if it's empty/broken
+        try:
+            async with aiofiles.open(json_path, mode='r', encoding='utf-8') as f:
+                content = await f.read()
+                existing_data = json.loads(content)
+                # If lots_data is empty but lots exist in folder, regenerate
+                if not existing_data.get("lots_data") and os.path.exists(os.path.join(debug_path, "lots")):
+                     files = glob.glob(os.path.join(debug_path, "lots", "*.png"))
+                     if files:
+                         print(f"Detected incomplete history for {base_name}, regenerating...")
+                         should_regenerate = True
+        except:
+            should_regenerate = True
+
+    # If JSON doesn't exist or is broken, create it from artifacts
+    if should_regenerate:
+        print(f"Recovering legacy search: {base_name}")
         
-        for debug_path in debug_dirs:
-            if not os.path.isdir(debug_path):
-                continue
-                
-            dir_name = os.path.basename(debug_path)
-            # base_name is dir_name without _debug
-            base_name = dir_name.replace("_debug", "")
-            json_filename = f"{base_name}_data.json"
-            json_path = os.path.join(data_dir, json_filename)
-            
-            # Check if JSON exists
-            should_regenerate = False
-            if not os.path.exists(json_path):
-                should_regenerate = True
-            else:
-                # Check if it's empty/broken
-                try:
-                    async with aiofiles.open(json_path, mode='r', encoding='utf-8') as f:
-                        content = await f.read()
-                        existing_data = json.loads(content)
-                        # If lots_data is empty but lots exist in folder, regenerate
-                        if not existing_data.get("lots_data") and os.path.exists(os.path.join(debug_path, "lots")):
-                             files = glob.glob(os.path.join(debug_path, "lots", "*.png"))
-                             if files:
-                                 print(f"Detected incomplete history for {base_name}, regenerating...")
-                                 should_regenerate = True
-                except:
-                    should_regenerate = True
-
-            # If JSON doesn't exist or is broken, create it from artifacts
-            if should_regenerate:
-                print(f"Recovering legacy search: {base_name}")
-                
-                # Infer address
-                address = base_name.replace("_", " ").strip()
-                
-                # Timestamp from folder
-                timestamp = os.path.getmtime(debug_path)
-                date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
-                
-                # Images
-                map_screenshot_path = os.path.join(data_dir, f"{base_name}_map.png")
-                full_map_path = os.path.join(debug_path, "full_map.jpg")
-                
-                map_screenshot_url = transform_path_to_url(map_screenshot_path) if os.path.exists(map_screenshot_path) else None
-                image_url = transform_path_to_url(full_map_path) if os.path.exists(full_map_path) else None
+        # Infer address
+        address = base_name.replace("_", " ").strip()
+        
+        # Timestamp from folder
+        timestamp = os.path.getmtime(debug_path)
+        date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        
+        # Images
+        map_screenshot_path = os.path.join(data_dir, f"{base_name}_map.png")
+        full_map_path = os.path.join(debug_path, "full_map.jpg")
+        
+        map_screenshot_url = transform_path_to_url(map_screenshot_path) if os.path.exists(map_screenshot_path) else None
+        image_url = transform_path_to_url(full_map_path) if os.path.exists(full_map_path) else None
+        
+        # Lots
+        lots_data = []
+        lots_dir = os.path.join(debug_path, "lots")
+        if os.path.exists(lots_dir):
+            lot_files = sorted(glob.glob(os.path.join(lots_dir, "*.png")))
+            lots_dir_url = transform_path_to_url(lots_dir)
+            for lf in lot_files:
+                fname = os.path.basename(lf)
                 
-                # Lots
-                lots_data = []
-                lots_dir = os.path.join(debug_path, "lots")
-                if os.path.exists(lots_dir):
-                    lot_files = sorted(glob.glob(os.path.join(lots_dir, "*.png")))
-                    lots_dir_url = transform_path_to_url(lots_dir)
-                    for lf in lot_files:
-                        fname = os.path.basename(lf)
+                # Extract lot number from filename (e.g. lote_005.png -> 5)
+                lot_num = "?"
+                match = re.search(r"lote_(\d+)", fname)
+                if match:
+                    try:
+                        lot_num = str(int(match.group(1)))
+                    except:
+                        pass
                         
-                        # Extract lot number from filename (e.g. lote_005.png -> 5)
-                        lot_num = "?"
-                        match = re.search(r"lote_(\d+)", fname)
-                        if match:
-                            try:
-                                lot_num = str(int(match.group(1)))
-                            except:
-                                pass
-                                
-                        lots_data.append({
-                            "filename": fname,
-                            "image_url": f"{lots_dir_url}/{fname}",
-                            "lot_number": lot_num,
-                            "dimensions": [],
-                            "other_text": "Datos recuperados"
-                        })
-                
-                session_data = {
-                    "address": address,
-                    "timestamp": timestamp,
-                    "date": date_str,
-                    "metadata": {"Note": "Legacy import"}, # Metadata lost unless re-parsed
-                    "map_screenshot_url": map_screenshot_url,
-                    "image_url": image_url,
-                    "global_info": {},
-                    "lots_data": lots_data
-                }
-                
-                async with aiofiles.open(json_path, mode='w', encoding='utf-8') as f:
-                    await f.write(json.dumps(session_data, indent=2, ensure_ascii=False))
-                    
+                lots_data.append({
+                    "filename": fname,
+                    "image_url": f"{lots_dir_url}/{fname}",
+                    "lot_number": lot_num,
+                    "dimensions": [],
+                    "other_text": "Datos recuperados"
+                })
+        
+        session_data = {
+            "address": address,
+            "timestamp": timestamp,
+            "date": date_str,
+            "metadata": {"Note": "Legacy import"}, # Metadata lost unless re-parsed
+            "map_screenshot_url": map_screenshot_url,
+            "image_url": image_url,
+            "global_info": {},
+            "lots_data": lots_data
+        }
+        
+        async with aiofiles.open(json_path, mode='w', encoding='utf-8') as f:
+            await f.write(json.dumps(session_data, indent=2, ensure_ascii=False))
+        await asyncio.to_thread(history_index.upsert, json_filename, session_data)
+    return should_regenerate
+
+async def sync_legacy_history(data_dir: str):
+    """Checks the _debug folders that are new or changed since the last run."""
+    status = legacy_sync_status
+    status.update(state="running", total=0, scanned=0, unchanged=0, recovered=0, errors=0,
+                  started_at=datetime.now().timestamp(), finished_at=None)
+    status.pop("error", None)
+    try:
+        debug_dirs = await asyncio.to_thread(_list_debug_dirs, data_dir)
+        seen = await asyncio.to_thread(history_index.legacy_watermarks)
+        status["total"] = len(debug_dirs)
+
+        for dir_name, watermark in debug_dirs:
+            status["scanned"] += 1
+            if seen.get(dir_name) == watermark:
+                status["unchanged"] += 1
+                continue
+            try:
+                if await recover_legacy_search(data_dir, os.path.join(data_dir, dir_name)):
+                    status["recovered"] += 1
+            except Exception as e:
+                # No watermark: retried on the next run
+                status["errors"] += 1
+                print(f"Error recovering legacy search {dir_name}: {e}")
+                continue
+            await asyncio.to_thread(history_index.set_legacy_watermark, dir_name, watermark)
+        status["state"] = "done"
+        if status["recovered"]:
+            print(f"Legacy history: {status['recovered']} searches recovered, {status['unchanged']} folders unchanged")
     except Exception as e:
+        status["state"] = "error"
+        status["error"] = str(e)
         print(f"Error syncing legacy history: {e}")
+    finally:
+        status["finished_at"] = datetime.now().timestamp()
+
+def start_legacy_sync(data_dir: str = "data") -> asyncio.Task:
+    """Starts a background sync unless one is already running."""
+    global _legacy_sync_task
+    if _legacy_sync_task is None or _legacy_sync_task.done():
+        _legacy_sync_task = asyncio.create_task(sync_legacy_history(data_dir))
+    return _legacy_sync_task
 
 @app.get("/history", response_model=list[HistoryItem])
-async def get_history():
-    """List all saved searches."""
-    history = []
+async def get_history(
+    response: Response,
+    limit: int = Query(None, ge=1, le=500),
+    cursor: str = None
+):
+    """
+    List saved searches, newest first, from the history index.
+    With `limit`, one page at a time: the next page's cursor comes in the
+    X-Next-Cursor header (absent on the last page).
+    """
     data_dir = "data"
     if not os.path.exists(data_dir):
         return []
-    
-    # Sync legacy folders first
-    await sync_legacy_history(data_dir)
-        
-    # Find all *_data.json files
-    files = glob.glob(os.path.join(data_dir, "*_data.json"))
-    
-    for f in files:
-        try:
-            filename = os.path.basename(f)
-            # Read minimal info or just use filename/mtime
-            # Let's read the file to get the real address and timestamp
-            async with aiofiles.open(f, mode='r', encoding='utf-8') as file:
-                content = await file.read()
-                data = json.loads(content)
-                
-            history.append({
-                "filename": filename,
-                "address": data.get("address", filename.replace("_data.json", "").replace("_", " ")),
-                "date": data.get("date", datetime.fromtimestamp(os.path.getmtime(f)).strftime("%Y-%m-%d %H:%M")),
-                "timestamp": data.get("timestamp", os.path.getmtime(f))
-            })
-        except Exception as e:
-            print(f"Error reading history file {f}: {e}")
-            
-    # Sort by timestamp desc
-    history.sort(key=lambda x: x["timestamp"], reverse=True)
+
+    try:
+        history, next_cursor = await asyncio.to_thread(history_index.page, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return history
 
+@app.get("/history/sync")
+async def get_history_sync():
+    """Progress and counts of the legacy history recovery."""
+    return legacy_sync_status
+
+@app.post("/history/sync")
+async def run_history_sync():
+    """Rescans the _debug folders (only new or changed ones are recovered)."""
+    start_legacy_sync()
+    return legacy_sync_status
+
 @app.get("/history/{filename}")
 async def get_history_item(filename: str):
     """Get details of a specific saved search."""
@@ -202,68 +301,201 @@ async def get_history_item(filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _session_artifacts(session_data: dict) -> set:
+    """
+    Names of the data/ entries (_debug folders, _map.png screenshots) a saved
+    search shows images from. A search that joined another one's scrape or
+    extraction points at that one's files, not at its own.
+    """
+    paths = [session_data.get("debug_dir"), session_data.get("image_url"), session_data.get("map_screenshot_url")]
+    paths += [lot.get("image_url") for lot in session_data.get("lots_data") or []]
+    names = set()
+    for path in paths:
+        if not path:
+            continue
+        path = path.replace("\\", "/")
+        relative = path.split("/data/")[-1] if "/data/" in path else path.split("data/", 1)[-1]
+        name = relative.split("/")[0]
+        if name.endswith("_debug") or name.endswith("_map.png"):
+            names.add(name)
+    return names
+
+def _artifacts_in_use(data_dir: str, exclude: str) -> set:
+    """Artifacts referenced by every saved search except `exclude`."""
+    in_use = set()
+    for path in glob.glob(os.path.join(data_dir, "*_data.json")):
+        if os.path.basename(path) == exclude:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                in_use |= _session_artifacts(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error reading history file {path}: {e}")
+    return in_use
+
 @app.delete("/history/{filename}")
 async def delete_history_item(filename: str):
-    """Delete a saved search."""
+    """Delete a saved search (and the images no other saved search uses)."""
     filepath = os.path.join("data", filename)
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="History item not found")
         
     try:
-        # 1. Delete JSON
-        os.remove(filepath)
-        
-        # 2. Determine base name
         # filename is like "ADDRESS_data.json"
         base_name = filename.replace("_data.json", "")
+        owned = {f"{base_name}_debug", f"{base_name}_map.png"}
+        try:
+            async with aiofiles.open(filepath, mode='r', encoding='utf-8') as f:
+                owned |= _session_artifacts(json.loads(await f.read()))
+        except ValueError:
+            pass
+
+        # 1. Delete JSON (and its history entry)
+        os.remove(filepath)
+        await asyncio.to_thread(history_index.delete, filename)
         
-        # 3. Delete debug directory
-        debug_dir = os.path.join("data", f"{base_name}_debug")
-        if os.path.exists(debug_dir):
-            shutil.rmtree(debug_dir)
-            
-        # 4. Delete map screenshot if exists (legacy or new structure)
-        map_img = os.path.join("data", f"{base_name}_map.png")
-        if os.path.exists(map_img):
-            os.remove(map_img)
+        # 2. Delete debug directories and map screenshots (legacy or new structure),
+        # unless another search shares them (coalesced lookups reuse the first one's files)
+        in_use = await asyncio.to_thread(_artifacts_in_use, "data", filename)
+        for name in owned - in_use:
+            path = os.path.join("data", name)
+            if os.path.isdir(path):
+                await asyncio.to_thread(shutil.rmtree, path)
+            elif os.path.exists(path):
+                os.remove(path)
             
         return {"status": "success", "message": "Deleted"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+async def get_stats():
+    """Runtime stats (browser pool, scrape scheduler, coalesced jobs, caches)."""
+    return {
+        "browser_pool": browser_pool.stats(),
+        "scrape_scheduler": scrape_scheduler.stats(),
+        "scrape_flights": scrape_flights.stats(),
+        "extract_flights": extract_flights.stats(),
+        "block_cache": block_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_dispatcher": llm_dispatcher.stats(),
+        "history_index": history_index.stats(),
+        "location_cache": location_cache.stats(),
+        "location_flights": location_flights.stats(),
+        "location_index": location_index.stats(),
+        "wms_tiles": tile_cache.stats(),
+        "wms_flights": tile_flights.stats()
+    }
+
 @app.get("/proxy/locations/{query}")
 async def proxy_locations(query: str):
     """
     Proxy request to Rosario API to avoid CORS issues and improve stability.
+    Non-blocking (shared async client), cached and coalesced: see app/locations.py.
     """
     if len(query) < 3:
         return {"features": []}
         
     try:
-        # Construct the official API URL
-        encoded_query = quote(query)
-        url = f"https://ws.rosario.gob.ar/ubicaciones/public/geojson/ubicaciones/all/all/{encoded_query}"
-        
-        # Make the request from the server side
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"features": [], "error": f"Upstream API error: {response.status_code}"}
-            
+        return await search_locations(query)
     except Exception as e:
         print(f"Error proxying location request: {e}")
         return {"features": [], "error": str(e)}
 
+@app.get("/proxy/wms/{service}")
+async def proxy_wms(service: str, request: Request):
+    """
+    Caching proxy for the InfoMapa WMS layers (GetMap only): tiles come from
+    the disk cache when fresh, with strong ETags for conditional requests.
+    See app/tile_cache.py.
+    """
+    if service not in WMS_SERVICES:
+        raise HTTPException(status_code=404, detail=f"Unknown WMS service: {service}")
+    try:
+        status, tile = await get_tile(service, dict(request.query_params))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error proxying WMS tile: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+    if status != 200:
+        return Response(content=tile["content"], status_code=status, media_type=tile["content_type"])
+
+    max_age = max(0, int(tile_cache.ttl - (datetime.now().timestamp() - tile["created_at"])))
+    headers = {"ETag": tile["etag"], "Cache-Control": f"public, max-age={max_age}"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if tile["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        tile_cache.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=tile["content"], media_type=tile["content_type"], headers=headers)
+
+async def extract_rest_of_block(websocket: WebSocket, filename: str):
+    """Extracts the lots a target-first search left pending and updates the saved session."""
+    filepath = os.path.join("data", os.path.basename(filename or ""))
+    if not os.path.exists(filepath):
+        await websocket.send_json({"status": "error", "message": "Búsqueda no encontrada."})
+        return
+
+    async with aiofiles.open(filepath, mode='r', encoding='utf-8') as f:
+        session_data = json.loads(await f.read())
+
+    pending = session_data.get("pending_lots") or []
+    debug_dir = session_data.get("debug_dir")
+    if not pending or not debug_dir:
+        await websocket.send_json({"status": "complete", "message": "No hay lotes pendientes."})
+        return
+
+    await websocket.send_json({"status": "progress", "message": f"Extrayendo {len(pending)} lotes restantes..."})
+
+    async def progress_callback(event_type: str, event_data: any):
+        if event_type == "lot_data":
+            for i, lot in enumerate(session_data["lots_data"]):
+                if lot["filename"] == event_data["filename"]:
+                    session_data["lots_data"][i].update(event_data)
+                    break
+            await websocket.send_json({"status": "lot_update", "data": event_data})
+
+    results = await extract_pending_lots(
+        os.path.join(debug_dir, "lots"), pending,
+        cache_key=session_data.get("cache_key"),
+        progress_callback=progress_callback
+    )
+    session_data["pending_lots"] = [r["filename"] for r in results if "error" in r]
+
+    async with aiofiles.open(filepath, mode='w', encoding='utf-8') as f:
+        await f.write(json.dumps(session_data, indent=2, ensure_ascii=False))
+    await websocket.send_json({"status": "complete", "message": "Manzana completa."})
+
 @app.websocket("/ws/scrape")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Messages: a plain address (every lot up front, which is what the
+    frontend sends), or JSON {"address": ..., "full_block": false} for the
+    target lot first, or {"action": "extract_rest", "filename": "<X>_data.json"}
+    to fill in the lots a previous search left pending.
+    """
     await websocket.accept()
     try:
         while True:
             # Receive address from client
             data = await websocket.receive_text()
             address = data
+            # The frontend sends plain addresses and has no "extract rest" action yet
+            full_block = True
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if isinstance(message, dict):
+                if message.get("action") == "extract_rest":
+                    try:
+                        await extract_rest_of_block(websocket, message.get("filename"))
+                    except Exception as e:
+                        await websocket.send_json({"status": "error", "message": str(e)})
+                    continue
+                address = str(message.get("address", "")).strip()
+                full_block = bool(message.get("full_block", True))
             
             await websocket.send_json({"status": "started", "message": f"Iniciando búsqueda para {address}..."})
             
@@ -288,7 +520,19 @@ async def websocket_endpoint(websocket: WebSocket):
                 if not os.path.exists(output_dir):
                     os.makedirs(output_dir)
                     
-                scrape_result = await scrape_infomapa(address, output_dir)
+                async def scrape_callback(event_type: str, event_data: any):
+                    if event_type == "queued":
+                        position = event_data["position"]
+                        total = event_data["queue_length"]
+                        await websocket.send_json({
+                            "status": "queued",
+                            "position": position,
+                            "queue_length": total,
+                            "message": f"En cola: posición {position} de {total}..."
+                        })
+
+                # Identical lookups already running are joined, not repeated
+                scrape_result = await scrape_coalesced(address, output_dir, on_event=scrape_callback)
                 
                 if not scrape_result.get("pdf_path"):
                      await websocket.send_json({"status": "error", "message": "No se pudo descargar el plano."})
@@ -364,16 +608,18 @@ async def websocket_endpoint(websocket: WebSocket):
                             "image_url": full_map_url
                         })
 
-                # Call extractor with callback
-                extract_result = await extract_data_from_pdf(
-                    scrape_result["pdf_path"], 
-                    target_lot=scrape_result.get("metadata", {}).get("lote"),
-                    progress_callback=progress_callback
-                )
+                # Call extractor with callback (joins a running extraction of the same parcel)
+                extract_result = await extract_coalesced(scrape_result, on_event=progress_callback, full_block=full_block)
                 
                 if extract_result.get("error"):
                      await websocket.send_json({"status": "error", "message": extract_result["error"]})
                 else:
+                     # Remember what a later "extract_rest" needs
+                     session_data["pending_lots"] = extract_result.get("pending_lots", [])
+                     session_data["strategy"] = extract_result.get("strategy")
+                     session_data["debug_dir"] = extract_result.get("debug_dir")
+                     session_data["cache_key"] = extract_result.get("cache_key")
+
                      # Save session data to JSON
                      try:
                          # Sanitize address for filename
@@ -383,12 +629,18 @@ async def websocket_endpoint(websocket: WebSocket):
                          
                          async with aiofiles.open(filepath, mode='w', encoding='utf-8') as f:
                              await f.write(json.dumps(session_data, indent=2, ensure_ascii=False))
+                         await asyncio.to_thread(history_index.upsert, filename, session_data)
                              
                          print(f"Saved session data to {filepath}")
                      except Exception as save_err:
                          print(f"Error saving session data: {save_err}")
 
-                     await websocket.send_json({"status": "complete", "message": "Proceso finalizado con éxito."})
+                     await websocket.send_json({
+                         "status": "complete",
+                         "message": "Proceso finalizado con éxito.",
+                         "strategy": extract_result.get("strategy"),
+                         "pending_lots": len(session_data["pending_lots"])
+                     })
 
             except Exception as e:
                 await websocket.send_json({"status": "error", "message": str(e)})
@@ -425,6 +677,7 @@ async def scrape_address(request: ScrapeRequest):
     """
     initial_state = {
         "address": request.address,
+        "full_block": request.full_block,
         "pdf_path": None,
         "extracted_data": None,
         "error": None
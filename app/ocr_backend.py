@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+from typing import Dict, Any, List, Optional
+from segmentacion.extractor_vectorial import clasificar_textos, RE_MEDIDA
+
+# Tesseract is optional: without pytesseract or the binary, the OCR pass is skipped
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# Lot crops only hold digits, dimensions and PH references
+TESSERACT_CONFIG = "--psm 11 -c tessedit_char_whitelist=0123456789.,PHph"
+
+_available: Optional[bool] = None
+
+def tesseract_available() -> bool:
+    global _available
+    if _available is None:
+        try:
+            _available = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+        except Exception:
+            _available = False
+    return _available
+
+def ocr_lot(image_bytes: bytes, lot_filename: str) -> Dict[str, Any]:
+    """
+    Reads one lot crop with Tesseract. Runs in a worker process.
+
+    Returns the lots_data schema plus `confidence` (0-1): the lot number's word
+    confidence, lowered by the weakest dimension; 0 when no lot number was read.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return {"error": "Unreadable crop", "filename": lot_filename, "confidence": 0.0}
+    data = pytesseract.image_to_data(img, config=TESSERACT_CONFIG, output_type=pytesseract.Output.DICT)
+
+    words = []
+    for text, conf, left, top, width, height in zip(
+        data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]
+    ):
+        text = (text or "").strip()
+        conf = float(conf)
+        if not text or conf < 0:
+            continue
+        words.append({
+            "text": text,
+            "conf": conf / 100,
+            # Same shape as the vector extractor's spans; glyph height stands in for font size
+            "size": height,
+            "bbox": [left, top, left + width, top + height],
+            "center": (left + width / 2, top + height / 2),
+        })
+
+    result = clasificar_textos(words)
+    result["filename"] = lot_filename
+    result["source"] = "ocr"
+
+    by_text = {}
+    for word in words:
+        by_text[word["text"]] = max(word["conf"], by_text.get(word["text"], 0.0))
+    if not result["lot_number"]:
+        result["confidence"] = 0.0
+        return result
+    main_number = "".join(c for c in result["lot_number"] if c.isdigit() and c.isascii())
+    confidence = by_text.get(main_number, 0.0)
+    dims = [w["conf"] for w in words if RE_MEDIDA.match(w["text"])]
+    if dims:
+        confidence = min(confidence, min(dims))
+    result["confidence"] = round(confidence, 3)
+    return result
+
+def ocr_lots(crops: List[tuple]) -> List[Dict[str, Any]]:
+    """ocr_lot over a chunk of (image_bytes, filename); one task per chunk keeps IPC low."""
+    return [ocr_lot(image_bytes, lot_filename) for image_bytes, lot_filename in crops]
@@ -0,0 +1,39 @@
+from typing import Dict, Any
+from app.scraper import scrape_infomapa
+from app.extractor import extract_data_from_pdf
+from app.singleflight import (
+    scrape_flights, extract_flights, normalize_address, catastral_key, EventListener
+)
+
+# Coalesced entry points shared by the WebSocket handler and the graph, so two
+# callers asking for the same address/parcel at once share one run.
+
+async def scrape_coalesced(address: str, output_dir: str, on_event: EventListener = None) -> Dict[str, Any]:
+    """scrape_infomapa, coalesced on the normalized address. Emits 'queued' events."""
+    async def run(emit):
+        async def on_queue_position(position: int, total: int):
+            await emit("queued", {"position": position, "queue_length": total})
+        return await scrape_infomapa(address, output_dir, on_queue_position=on_queue_position)
+
+    return await scrape_flights.do(normalize_address(address), run, on_event)
+
+async def extract_coalesced(
+    scrape_result: Dict[str, Any],
+    on_event: EventListener = None,
+    full_block: bool = False
+) -> Dict[str, Any]:
+    """extract_data_from_pdf, coalesced on the catastral ID (falls back to the PDF path)."""
+    metadata = scrape_result.get("metadata") or {}
+    target_lot = metadata.get("lote")
+    key = catastral_key(metadata) or scrape_result["pdf_path"]
+    key = f"{key}|lote:{target_lot}|full:{bool(full_block)}"
+
+    async def run(emit):
+        return await extract_data_from_pdf(
+            scrape_result["pdf_path"],
+            target_lot=target_lot,
+            progress_callback=emit,
+            full_block=full_block
+        )
+
+    return await extract_flights.do(key, run, on_event)
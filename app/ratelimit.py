@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, up to `burst` stored.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.total_wait = 0.0
+        self.acquired = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        if self.rate <= 0:
+            return
+        start = time.monotonic()
+        # The lock keeps waiters FIFO: only the head of the line sleeps for tokens
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+        self.acquired += 1
+        self.total_wait += time.monotonic() - start
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_sec": self.rate,
+            "burst": self.burst,
+            "acquired": self.acquired,
+            "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 1) if self.acquired else 0.0,
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, Awaitable, Optional
+from urllib.parse import urlparse
+from app.core.config import settings
+from app.ratelimit import TokenBucket
+
+# on_position(position, queue_length), position is 1-based
+PositionCallback = Callable[[int, int], Awaitable[None]]
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, on_position: Optional[PositionCallback]):
+        self.future = future
+        self.on_position = on_position
+
+class ScrapeScheduler:
+    """
+    Central admission control for scrapes.
+
+    - Global concurrency limit, adjusted AIMD-style: +1 per window of fast,
+      successful scrapes; halved (at most once per cooldown) on an error or a
+      scrape slower than the target latency.
+    - Fair FIFO queue; queued callers get their position whenever it changes.
+    - Per-upstream-host token buckets for the requests we send ourselves.
+    """
+
+    def __init__(
+        self,
+        min_concurrency: int = None,
+        max_concurrency: int = None,
+        target_latency: float = None,
+    ):
+        self.min_concurrency = min_concurrency or settings.SCRAPE_MIN_CONCURRENCY
+        self.max_concurrency = max_concurrency or settings.SCRAPE_MAX_CONCURRENCY
+        self.target_latency = target_latency or settings.SCRAPE_TARGET_LATENCY
+        self.limit = float(max(self.min_concurrency, min(settings.SCRAPE_INITIAL_CONCURRENCY, self.max_concurrency)))
+
+        self._running = 0
+        self._queue: deque = deque()
+        self._last_decrease = 0.0
+        self._hosts: Dict[str, TokenBucket] = {}
+        # Position notifications in flight (the loop only keeps weak references to tasks)
+        self._notifications: set = set()
+
+        # Metrics
+        self._completed = 0
+        self._errors = 0
+        self._total_queue_wait = 0.0
+        self._total_latency = 0.0
+
+    # --- Concurrency ---
+
+    @asynccontextmanager
+    async def slot(self, on_position: PositionCallback = None):
+        """Holds one scrape slot for the duration of the block."""
+        enqueued = time.perf_counter()
+        if self._queue or self._running >= int(self.limit):
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+            self._queue.append(waiter)
+            if on_position:
+                self._notify(on_position, len(self._queue), len(self._queue))
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    self._notify_positions()
+                elif waiter.future.done() and not waiter.future.cancelled():
+                    # Slot was granted right as we got cancelled: hand it on
+                    self._running -= 1
+                    self._dispatch()
+                raise
+        else:
+            self._running += 1
+        self._total_queue_wait += time.perf_counter() - enqueued
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._record(time.perf_counter() - start, ok)
+            self._running -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        granted = False
+        while self._queue and self._running < int(self.limit):
+            waiter = self._queue.popleft()
+            if waiter.future.done():
+                continue
+            self._running += 1
+            waiter.future.set_result(None)
+            granted = True
+        if granted:
+            self._notify_positions()
+
+    def _notify_positions(self):
+        total = len(self._queue)
+        for position, waiter in enumerate(self._queue, start=1):
+            if waiter.on_position:
+                self._notify(waiter.on_position, position, total)
+
+    def _notify(self, callback: PositionCallback, position: int, total: int):
+        task = asyncio.create_task(self._safe_notify(callback, position, total))
+        self._notifications.add(task)
+        task.add_done_callback(self._notifications.discard)
+
+    @staticmethod
+    async def _safe_notify(callback: PositionCallback, position: int, total: int):
+        try:
+            await callback(position, total)
+        except Exception as e:
+            print(f"Queue position callback failed: {e}")
+
+    def _record(self, latency: float, ok: bool):
+        self._completed += 1
+        self._total_latency += latency
+        if not ok:
+            self._errors += 1
+
+        now = time.monotonic()
+        if not ok or latency > self.target_latency:
+            # Multiplicative decrease, once per cooldown so a burst of failures counts once
+            if now - self._last_decrease >= self.target_latency:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                self._last_decrease = now
+                print(f"Scrape scheduler: concurrency limit down to {int(self.limit)} "
+                      f"({'error' if not ok else f'{latency:.1f}s'})", flush=True)
+        else:
+            # Additive increase: about +1 after a full window of good scrapes
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+        # A higher limit may admit queued scrapes
+        self._dispatch()
+
+    # --- Upstream rate ---
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._hosts.get(host)
+        if bucket is None:
+            bucket = TokenBucket(settings.UPSTREAM_RATE_PER_SEC, settings.UPSTREAM_BURST)
+            self._hosts[host] = bucket
+        return bucket
+
+    async def throttle(self, url_or_host: str):
+        """Waits for the per-host request budget before calling an upstream host."""
+        host = urlparse(url_or_host).hostname if "://" in url_or_host else url_or_host
+        await self._bucket(host or url_or_host).acquire()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "running": self._running,
+            "queued": len(self._queue),
+            "completed": self._completed,
+            "errors": self._errors,
+            "avg_queue_wait_ms": round(self._total_queue_wait / self._completed * 1000, 1) if self._completed else 0.0,
+            "avg_latency_ms": round(self._total_latency / self._completed * 1000, 1) if self._completed else 0.0,
+            "hosts": {host: bucket.stats() for host, bucket in self._hosts.items()},
+        }
+
+scrape_scheduler = ScrapeScheduler()
@@ -1,22 +1,227 @@
 import asyncio
 import os
 import time
-from playwright.async_api import async_playwright, Page
-
-async def scrape_infomapa(address: str, output_dir: str) -> str:
-    async with async_playwright() as p:
-        # Launch browser
-        browser = await p.chromium.launch(headless=True) # Set to False for debugging
-        context = await browser.new_context(accept_downloads=True)
-        page = await context.new_page()
-        
+import weakref
+import base64
+from collections import defaultdict
+from urllib.parse import urlparse
+from playwright.async_api import Page, Route, Request
+from app.browser_pool import browser_pool
+from app.core.config import settings
+from app.scraper_http import scrape_infomapa_http
+from app.scheduler import scrape_scheduler, PositionCallback
+
+INFOMAPA_URL = "https://infomapa.rosario.gov.ar/emapa/mapa.htm"
+
+# Whether the info tool was left switched on, per page (warm pages outlive a scrape)
+_info_tool_active = weakref.WeakKeyDictionary()
+# Resource policy attached to each page
+_policies = weakref.WeakKeyDictionary()
+
+# 1x1 transparent PNG served in place of tiles and images
+TRANSPARENT_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+# Fallback size estimates (bytes) until real responses of that kind have been seen
+DEFAULT_RESOURCE_SIZES = {"tile": 20000, "image": 3000, "font": 40000, "media": 100000, "stylesheet": 10000}
+FIRST_PARTY_SUFFIXES = ("rosario.gov.ar", "rosario.gob.ar")
+
+# Running average of observed sizes per kind, shared across scrapes
+_observed_sizes = defaultdict(lambda: [0, 0])  # kind -> [total_bytes, count]
+
+# JS: force every OpenLayers layer to re-request its tiles
+REDRAW_LAYERS_JS = """() => {
+    let n = 0;
+    for (const k of Object.keys(window)) {
+        let v;
+        try { v = window[k]; } catch (e) { continue; }
+        if (v && v.CLASS_NAME === 'OpenLayers.Map') {
+            v.layers.forEach(l => { if (l.redraw) { l.redraw(true); n++; } });
+        }
+    }
+    return n;
+}"""
+
+class ResourcePolicy:
+    """
+    page.route policy for the InfoMapa page.
+
+    While `blocking` is on, WMS tiles and images are stubbed with a transparent
+    PNG (so the pin and popups still render/load), fonts and media are aborted,
+    and third-party assets are dropped. The screenshot step turns blocking off.
+    Counts what was blocked and what went through, per scrape.
+    """
+
+    def __init__(self, blocked_types=None):
+        self.blocked_types = set(blocked_types or settings.SCRAPER_BLOCKED_TYPES)
+        self.blocking = True
+        # Requests let through with route.continue_(); stubbed/aborted ones also fire
+        # requestfinished/requestfailed and must not count as traffic or pending work
+        self._continued = set()
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.blocked = defaultdict(int)
+        self.allowed_requests = 0
+        self.allowed_bytes = 0
+
+    async def attach(self, page: Page):
+        await page.route("**/*", self._handle)
+        page.on("requestfinished", self._on_finished)
+        page.on("requestfailed", self._on_failed)
+
+    @staticmethod
+    def classify(request: Request) -> str:
+        url = request.url
+        if request.resource_type == "image" and ("GetMap" in url or "/wms" in url.lower() or "/tile" in url.lower()):
+            return "tile"
+        return request.resource_type
+
+    @staticmethod
+    def is_third_party(request: Request) -> bool:
+        host = urlparse(request.url).hostname or ""
+        return not host.endswith(FIRST_PARTY_SUFFIXES)
+
+    async def _handle(self, route: Route):
+        request = route.request
+        kind = self.classify(request)
+        if self.blocking:
+            third_party_asset = self.is_third_party(request) and kind in ("image", "tile", "font", "media", "stylesheet")
+            if kind in ("tile", "image") and kind in self.blocked_types:
+                self.blocked[kind] += 1
+                await route.fulfill(status=200, content_type="image/png", body=TRANSPARENT_PNG)
+                return
+            if kind in self.blocked_types or third_party_asset:
+                self.blocked[kind] += 1
+                await route.abort()
+                return
+        self._continued.add(request)
+        await route.continue_()
+
+    @property
+    def pending(self) -> int:
+        return len(self._continued)
+
+    async def _on_finished(self, request: Request):
+        if request not in self._continued:
+            return
+        self._continued.discard(request)
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        size = sizes.get("responseBodySize", 0) + sizes.get("responseHeadersSize", 0)
+        self.allowed_requests += 1
+        self.allowed_bytes += size
+        observed = _observed_sizes[self.classify(request)]
+        observed[0] += size
+        observed[1] += 1
+
+    def _on_failed(self, request: Request):
+        self._continued.discard(request)
+
+    async def wait_idle(self, page: Page, timeout_ms: int = 5000):
+        """Waits until the requests let through have finished (or timeout)."""
+        waited = 0
+        # Give the page a moment to start issuing requests
+        await page.wait_for_timeout(200)
+        while self.pending > 0 and waited < timeout_ms:
+            await page.wait_for_timeout(100)
+            waited += 100
+
+    def report(self) -> dict:
+        estimated = 0
+        for kind, count in self.blocked.items():
+            total, n = _observed_sizes.get(kind, (0, 0))
+            avg = total / n if n else DEFAULT_RESOURCE_SIZES.get(kind, 5000)
+            estimated += int(avg * count)
+        return {
+            "blocked_requests": sum(self.blocked.values()),
+            "blocked_by_type": dict(self.blocked),
+            "estimated_bytes_saved": estimated,
+            "allowed_requests": self.allowed_requests,
+            "allowed_bytes": self.allowed_bytes,
+        }
+
+async def open_map(page: Page):
+    """Navigates to InfoMapa and waits until the search box is ready."""
+    if settings.SCRAPER_BLOCK_RESOURCES:
+        policy = ResourcePolicy()
+        await policy.attach(page)
+        _policies[page] = policy
+    print(f"Navigating to InfoMapa...")
+    await page.goto(INFOMAPA_URL, timeout=60000)
+    await page.locator("#txtDireccionesLugares").wait_for(state="visible")
+
+async def reset_map(page: Page):
+    """Puts a used map page back to its initial state so it can be reused."""
+    # Close every popup left by the previous lookup
+    close_btns = page.locator(".olPopupCloseBox")
+    for i in reversed(range(await close_btns.count())):
+        btn = close_btns.nth(i)
+        if await btn.is_visible():
+            await btn.click()
+
+    # Turn the info tool off again
+    if _info_tool_active.get(page):
+        await page.locator("#info-capa-icon").click()
+        _info_tool_active[page] = False
+
+    # Dismiss the info modal / autocomplete and clear the search box
+    await page.keyboard.press("Escape")
+    search_input = page.locator("#txtDireccionesLugares")
+    await search_input.fill("")
+    await search_input.wait_for(state="visible", timeout=5000)
+
+    policy = _policies.get(page)
+    if policy:
+        policy.blocking = True
+        policy.reset_counters()
+
+async def prewarm_infomapa(count: int = None):
+    """Parks `count` pages already sitting on the loaded map."""
+    count = settings.WARM_PAGES_PREWARM if count is None else count
+    if not settings.WARM_PAGES or count <= 0:
+        return
+
+    async def _park():
+        async with browser_pool.page(prepare=open_map, reset=reset_map):
+            pass
+
+    results = await asyncio.gather(*[_park() for _ in range(count)], return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        print(f"Could not prewarm {len(failed)} InfoMapa page(s): {failed[0]}", flush=True)
+
+async def scrape_infomapa(address: str, output_dir: str, on_queue_position: PositionCallback = None) -> dict:
+    """
+    Looks up an address and downloads its Registro Gráfico PDF.
+    SCRAPER_BACKEND selects the backend: "http" (browserless), "browser",
+    or "auto" (HTTP first, browser on failure).
+
+    Runs inside a scheduler slot; `on_queue_position(position, total)` is
+    called while the request waits in the queue.
+    """
+    async with scrape_scheduler.slot(on_position=on_queue_position):
+        backend = settings.SCRAPER_BACKEND
+        if backend in ("auto", "http"):
+            try:
+                return await scrape_infomapa_http(address, output_dir)
+            except Exception as e:
+                if backend == "http":
+                    raise
+                print(f"HTTP lookup failed ({e}), falling back to browser...", flush=True)
+        await scrape_scheduler.throttle(INFOMAPA_URL)
+        return await scrape_infomapa_browser(address, output_dir)
+
+async def scrape_infomapa_browser(address: str, output_dir: str) -> dict:
+    # Pages come from the shared pool; the browser outlives this call.
+    # Warm pages are already on the loaded map, so navigation is skipped.
+    async with browser_pool.page(prepare=open_map, reset=reset_map) as page:
         screenshot_path = None # Initialize variable
 
         try:
-            # 1. Navigate to the page
-            print(f"Navigating to InfoMapa...")
-            await page.goto("https://infomapa.rosario.gov.ar/emapa/mapa.htm", timeout=60000)
-            
+            # 1. Map is already loaded (see open_map)
             # 2. Type address in search bar
             print(f"Searching for address: {address} (Updated Version)")
             
@@ -72,6 +277,7 @@ async def scrape_infomapa(address: str, output_dir: str) -> str:
             info_icon = page.locator("#info-capa-icon")
             await info_icon.wait_for(state="visible")
             await info_icon.click()
+            _info_tool_active[page] = True
             await page.wait_for_timeout(500) # Small pause
             
             # 2. Close existing popup
@@ -89,11 +295,21 @@ async def scrape_infomapa(address: str, output_dir: str) -> str:
             abs_output_dir = os.path.abspath(output_dir)
             screenshot_filename = f"{address.replace(' ', '_')}_map.png"
             screenshot_path = os.path.join(abs_output_dir, screenshot_filename)
+            policy = _policies.get(page)
             try:
+                if policy:
+                    # Tiles were stubbed so far: let them through and reload them
+                    policy.blocking = False
+                    redrawn = await page.evaluate(REDRAW_LAYERS_JS)
+                    print(f"Reloading {redrawn} map layers for screenshot...", flush=True)
+                    await policy.wait_idle(page)
                 await page.screenshot(path=screenshot_path)
             except Exception as e:
                 print(f"Failed to take map screenshot: {e}", flush=True)
                 screenshot_path = None
+            finally:
+                if policy:
+                    policy.blocking = True
             # ---------------------------------------
 
             # 3. Click Pin
@@ -178,10 +394,16 @@ async def scrape_infomapa(address: str, output_dir: str) -> str:
                         # Screenshot logic removed from here as it's now done earlier (clean map)
                         # We just return the path we captured before
 
+                        network = policy.report() if policy else None
+                        if network:
+                            print(f"Blocked {network['blocked_requests']} requests "
+                                  f"(~{network['estimated_bytes_saved'] // 1024} KB saved)", flush=True)
+
                         return {
                             "pdf_path": file_path,
                             "metadata": metadata,
-                            "screenshot_path": screenshot_path
+                            "screenshot_path": screenshot_path,
+                            "network": network
                         }
                      else:
                         raise Exception(f"Download failed with status {response.status}")
@@ -198,8 +420,6 @@ async def scrape_infomapa(address: str, output_dir: str) -> str:
             with open(os.path.join(output_dir, "page_dump.html"), "w", encoding="utf-8") as f:
                 f.write(await page.content())
             raise e
-        finally:
-            await browser.close()
 
 if __name__ == "__main__":
     # Test run
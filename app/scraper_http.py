@@ -0,0 +1,266 @@
+import math
+import os
+import unicodedata
+from html.parser import HTMLParser
+from typing import Dict, Any, List, Tuple
+from urllib.parse import quote
+from app.http_client import get_http_client
+from app.scheduler import scrape_scheduler
+
+# Browserless backend: the same data the InfoMapa modal shows, fetched directly
+# from the services the map app itself calls.
+UBICACIONES_URL = "https://ws.rosario.gob.ar/ubicaciones/public/geojson/ubicaciones/all/all/"
+WMS_PLANOBASE_URL = "https://infomapa.rosario.gov.ar/wms/planobase"
+INFOMAPA_BASE_URL = "https://infomapa.rosario.gov.ar"
+
+# Parcel layer as published in the planobase capabilities (see info.md)
+PARCELS_LAYER = "planobase:parcelas"
+WMS_VERSION = "1.1.0"
+WMS_SRS = "EPSG:32723"  # WGS 84 / UTM zone 23S
+UTM_ZONE = 23
+
+# Half-size (metres) of the bbox used around the point for GetFeatureInfo/GetMap
+FEATURE_INFO_SPAN = 50
+MAP_SPAN = 200
+
+# GeoServer attribute names -> the labels of the InfoMapa modal (what the
+# browser scraper returns and catastral_key/the extractor expect)
+ATTRIBUTE_LABELS = {
+    "seccion": "Sección",
+    "manzana": "Manzana",
+    "grafico": "Gráfico",
+    "subdivision": "Subdivisión",
+}
+
+def lonlat_to_utm(lon: float, lat: float, zone: int = UTM_ZONE, south: bool = True) -> Tuple[float, float]:
+    """
+    WGS 84 lon/lat -> UTM (easting, northing) in metres, Krüger series to
+    third order (about a millimetre within 3000 km of the central meridian).
+    """
+    a, f, k0 = 6378137.0, 1 / 298.257223563, 0.9996
+    n = f / (2 - f)
+    A = a / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64)
+    alpha = (n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16, 13 * n ** 2 / 48 - 3 * n ** 3 / 5, 61 * n ** 3 / 240)
+    phi = math.radians(lat)
+    dlam = math.radians(lon - (zone * 6 - 183))
+    c = 2 * math.sqrt(n) / (1 + n)
+    t = math.sinh(math.atanh(math.sin(phi)) - c * math.atanh(c * math.sin(phi)))
+    xi = math.atan2(t, math.cos(dlam))
+    eta = math.atanh(math.sin(dlam) / math.sqrt(1 + t * t))
+    easting = 500000 + k0 * A * (eta + sum(
+        al * math.cos(2 * j * xi) * math.sinh(2 * j * eta) for j, al in enumerate(alpha, 1)))
+    northing = (10000000 if south else 0) + k0 * A * (xi + sum(
+        al * math.sin(2 * j * xi) * math.cosh(2 * j * eta) for j, al in enumerate(alpha, 1)))
+    return easting, northing
+
+def _attribute_label(name: str) -> str:
+    text = unicodedata.normalize("NFKD", name)
+    key = "".join(c for c in text if not unicodedata.combining(c)).strip().lower()
+    return ATTRIBUTE_LABELS.get(key, name)
+
+class FeatureInfoParser(HTMLParser):
+    """
+    Collects the rows of every `table.featureInfo` (cells as (is_header, text))
+    and every link. Handles both layouts: InfoMapa's key/value rows and
+    GeoServer's default header row + one row per feature.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.tables: List[List[List[Tuple[bool, str]]]] = []
+        self.links: List[Tuple[str, str]] = []
+        self._tables: List[bool] = []  # stack: is this table a featureInfo table?
+        self._row = None
+        self._cell = None
+        self._link = None
+
+    def _in_feature_info(self) -> bool:
+        return any(self._tables)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "table":
+            is_feature_info = "featureInfo" in (attrs.get("class") or "").split()
+            self._tables.append(is_feature_info)
+            if is_feature_info:
+                self.tables.append([])
+        elif tag == "tr" and self._in_feature_info():
+            self._row = []
+        elif tag in ("td", "th") and self._row is not None:
+            self._cell = (tag == "th", [])
+        elif tag == "a":
+            self._link = [attrs.get("href"), []]
+
+    def handle_endtag(self, tag):
+        if tag == "table" and self._tables:
+            self._tables.pop()
+        elif tag in ("td", "th") and self._cell is not None:
+            self._row.append((self._cell[0], "".join(self._cell[1]).strip()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            if self._row:
+                self.tables[-1].append(self._row)
+            self._row = None
+        elif tag == "a" and self._link is not None:
+            href, text = self._link
+            self.links.append((href, "".join(text).strip()))
+            self._link = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell[1].append(data)
+        if self._link is not None:
+            self._link[1].append(data)
+
+def parse_feature_info(html: str) -> Tuple[Dict[str, str], str]:
+    """Returns (metadata, registro_grafico_href) from a GetFeatureInfo HTML response."""
+    parser = FeatureInfoParser()
+    parser.feed(html)
+    parser.close()
+
+    metadata = {}
+    for rows in parser.tables:
+        header = None
+        for cells in rows:
+            texts = [text for _, text in cells]
+            if all(is_header for is_header, _ in cells):
+                header = texts
+            elif header and len(texts) == len(header):
+                # Header row + one row per feature: only the first feature (FEATURE_COUNT=1)
+                for key, val in zip(header, texts):
+                    if key and val:
+                        metadata.setdefault(_attribute_label(key), val)
+            elif len(texts) == 2:
+                # Key/value rows
+                key = texts[0].replace(":", "").strip()
+                if key and texts[1]:
+                    metadata[key] = texts[1]
+
+    # Normalize 'Gráfico' to 'lote' for compatibility with extractor
+    if "Gráfico" in metadata and "lote" not in metadata:
+        metadata["lote"] = metadata["Gráfico"]
+
+    href = None
+    for link_href, text in parser.links:
+        if link_href and "Registro Gráfico" in text:
+            href = link_href
+            break
+    if href is None:
+        # Default GeoServer output: the link is a plain attribute value
+        for key, val in metadata.items():
+            if "registro" in key.lower() and (val.startswith("/") or val.startswith("http")):
+                href = val
+                break
+    return metadata, href
+
+async def _get(url: str, **kwargs):
+    """GET through the shared client, within the upstream host's rate budget."""
+    await scrape_scheduler.throttle(url)
+    return await get_http_client().get(url, **kwargs)
+
+async def resolve_address(address: str) -> Tuple[float, float, Dict[str, Any]]:
+    """Geocodes an address with the ubicaciones API. Returns (lon, lat, feature)."""
+    response = await _get(UBICACIONES_URL + quote(address))
+    response.raise_for_status()
+    features = [f for f in response.json().get("features", [])
+                if (f.get("geometry") or {}).get("type") == "Point"]
+    if not features:
+        raise Exception(f"Address not found: {address}")
+
+    # Prefer exact addresses over streets/places
+    exact = [f for f in features if (f.get("properties") or {}).get("subtipo") == "DIRECCION_EXACTA"]
+    feature = (exact or features)[0]
+    lon, lat = feature["geometry"]["coordinates"][:2]
+    return float(lon), float(lat), feature
+
+def _point_params(lon: float, lat: float, span: float, size: int) -> Dict[str, str]:
+    """WMS parameters for a `size` px square of 2 * `span` metres centred on the point."""
+    x, y = lonlat_to_utm(lon, lat)
+    return {
+        "SERVICE": "WMS",
+        "VERSION": WMS_VERSION,
+        "SRS": WMS_SRS,
+        "BBOX": f"{x - span:.2f},{y - span:.2f},{x + span:.2f},{y + span:.2f}",
+        "WIDTH": str(size),
+        "HEIGHT": str(size),
+    }
+
+async def get_feature_info(lon: float, lat: float) -> str:
+    """WMS GetFeatureInfo on the parcel layer at the given point (HTML)."""
+    size = 101
+    params = _point_params(lon, lat, FEATURE_INFO_SPAN, size)
+    params.update({
+        "REQUEST": "GetFeatureInfo",
+        "LAYERS": PARCELS_LAYER,
+        "QUERY_LAYERS": PARCELS_LAYER,
+        "STYLES": "",
+        "X": str(size // 2),
+        "Y": str(size // 2),
+        "INFO_FORMAT": "text/html",
+        "FEATURE_COUNT": "1",
+    })
+    response = await _get(WMS_PLANOBASE_URL, params=params)
+    response.raise_for_status()
+    return response.text
+
+async def save_map_image(lon: float, lat: float, path: str) -> str:
+    """Saves a GetMap render around the point, standing in for the browser screenshot."""
+    params = _point_params(lon, lat, MAP_SPAN, 800)
+    params.update({
+        "REQUEST": "GetMap",
+        "LAYERS": "planobase:plano_base,manzanas,parcelas,nombres_de_calles",
+        "STYLES": "",
+        "FORMAT": "image/png",
+    })
+    response = await _get(WMS_PLANOBASE_URL, params=params)
+    response.raise_for_status()
+    if not response.headers.get("content-type", "").startswith("image/"):
+        raise Exception(f"GetMap returned {response.headers.get('content-type')}")
+    with open(path, "wb") as f:
+        f.write(response.content)
+    return path
+
+async def scrape_infomapa_http(address: str, output_dir: str) -> Dict[str, Any]:
+    """
+    Browserless lookup: ubicaciones API -> WMS GetFeatureInfo -> PDF download.
+    Returns the same dict as the browser scraper; raises on any failure so the
+    caller can fall back to the browser flow.
+    """
+    print(f"HTTP lookup for address: {address}", flush=True)
+    lon, lat, feature = await resolve_address(address)
+    print(f"Resolved to ({lon}, {lat}): {(feature.get('properties') or {}).get('descripcion')}", flush=True)
+
+    html = await get_feature_info(lon, lat)
+    metadata, href = parse_feature_info(html)
+    if not metadata:
+        raise Exception("GetFeatureInfo returned no parcel data")
+    if not href:
+        raise Exception("Registro Gráfico link not found in feature info")
+    print(f"Extracted Metadata: {metadata}", flush=True)
+
+    pdf_url = f"{INFOMAPA_BASE_URL}{href}" if href.startswith("/") else href
+    print(f"Downloading PDF from: {pdf_url}", flush=True)
+    response = await _get(pdf_url)
+    if response.status_code != 200:
+        raise Exception(f"Download failed with status {response.status_code}")
+    if not response.content.startswith(b"%PDF"):
+        raise Exception("Registro Gráfico response is not a PDF")
+
+    filename = f"{address.replace(' ', '_')}.pdf"
+    file_path = os.path.join(output_dir, filename)
+    with open(file_path, "wb") as f:
+        f.write(response.content)
+    print(f"PDF downloaded to: {file_path}", flush=True)
+
+    screenshot_path = os.path.join(os.path.abspath(output_dir), f"{address.replace(' ', '_')}_map.png")
+    try:
+        await save_map_image(lon, lat, screenshot_path)
+    except Exception as e:
+        print(f"Failed to render map image: {e}", flush=True)
+        screenshot_path = None
+
+    return {
+        "pdf_path": file_path,
+        "metadata": metadata,
+        "screenshot_path": screenshot_path
+    }
@@ -0,0 +1,114 @@
+import asyncio
+import re
+import unicodedata
+from typing import Dict, Any, List, Tuple, Callable, Awaitable, Optional
+
+# listener(event_type, data), same signature as extract_data_from_pdf's progress_callback
+EventListener = Callable[[str, Any], Awaitable[None]]
+
+class Flight:
+    """One running job: its events so far, its live listeners and its task."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.events: List[Tuple[str, Any]] = []
+        self.listeners: List[EventListener] = []
+        self.task: asyncio.Task = None
+
+    async def emit(self, event_type: str, data: Any):
+        self.events.append((event_type, data))
+        for listener in list(self.listeners):
+            try:
+                await listener(event_type, data)
+            except Exception as e:
+                print(f"Flight listener failed on '{event_type}': {e}")
+
+    async def subscribe(self, listener: EventListener):
+        """Replays every event emitted so far, then follows live ones."""
+        replayed = 0
+        while replayed < len(self.events):
+            event_type, data = self.events[replayed]
+            replayed += 1
+            try:
+                await listener(event_type, data)
+            except Exception as e:
+                print(f"Flight listener failed on replayed '{event_type}': {e}")
+        # No await between the last replay check and registering: nothing is missed
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: EventListener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one job.
+
+    The first caller starts `fn(emit)`; later callers with the same key attach
+    to it, get its events replayed and receive the same result (or exception).
+    A caller going away (e.g. WebSocket disconnect) doesn't cancel the job.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, Flight] = {}
+        self._started = 0
+        self._coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[EventListener], Awaitable[Any]], on_event: EventListener = None):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = Flight(key)
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(flight, fn))
+            self._started += 1
+        else:
+            self._coalesced += 1
+            print(f"[{self.name}] Joining in-flight job for '{key}'", flush=True)
+
+        if on_event:
+            await flight.subscribe(on_event)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            if on_event:
+                flight.unsubscribe(on_event)
+
+    async def _run(self, flight: Flight, fn):
+        try:
+            return await fn(flight.emit)
+        finally:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "started": self._started,
+            "coalesced": self._coalesced,
+        }
+
+def normalize_address(address: str) -> str:
+    """Case/accent/whitespace-insensitive key for an address."""
+    text = unicodedata.normalize("NFKD", address or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip().upper()
+
+# Metadata fields that together identify a parcel when there is no explicit ID
+CATASTRAL_FIELDS = ("Sección", "Manzana", "Gráfico", "Subdivisión")
+
+def catastral_key(metadata: Dict[str, Any]) -> Optional[str]:
+    """Catastral ID from the scraper metadata, or None if it can't be told."""
+    metadata = metadata or {}
+    for key, value in metadata.items():
+        if "catastr" in key.lower() and value:
+            return f"cat:{normalize_address(str(value))}"
+    parts = [normalize_address(str(metadata[f])) for f in CATASTRAL_FIELDS if metadata.get(f)]
+    if len(parts) >= 2:
+        return "cat:" + "-".join(parts)
+    return None
+
+# Address lookups (keyed on the normalized address)
+scrape_flights = SingleFlight("scrape")
+# Plan extraction (keyed on the catastral ID once the scrape has returned it)
+extract_flights = SingleFlight("extract")
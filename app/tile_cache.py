@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlencode
+from app.core.config import settings
+from app.http_client import get_http_client
+from app.singleflight import SingleFlight
+
+# Only these upstream services are proxied (the map layers in InteractiveMap.vue)
+WMS_SERVICES = {
+    "planobase": "https://infomapa.rosario.gov.ar/wms/planobase",
+    "codigourbano": "https://infomapa.rosario.gov.ar/wms/codigourbano",
+    "infraestructura": "https://infomapa.rosario.gov.ar/wms/infraestructura",
+}
+
+# GetMap parameters that change the image; anything else (cache busters, etc.) is dropped
+GETMAP_PARAMS = ("service", "request", "version", "layers", "styles", "format", "transparent",
+                 "srs", "crs", "bbox", "width", "height", "bgcolor")
+
+def normalize_getmap(params: Dict[str, str]) -> Dict[str, str]:
+    """
+    Canonical GetMap parameters: lower-case names, only the ones that matter,
+    BBOX rounded (Leaflet computes it in floating point) and case-insensitive
+    values upper-cased. Raises ValueError if it isn't a GetMap request.
+    """
+    params = {k.lower(): v for k, v in params.items()}
+    if params.get("request", "").lower() != "getmap":
+        raise ValueError("Only GetMap requests are proxied")
+    normalized = {}
+    for name in GETMAP_PARAMS:
+        value = params.get(name)
+        if value is None:
+            continue
+        if name == "bbox":
+            try:
+                value = ",".join(f"{float(v):.9f}" for v in value.split(","))
+            except ValueError:
+                raise ValueError(f"Invalid BBOX: {value}")
+        elif name in ("service", "request", "srs", "crs", "transparent"):
+            value = value.upper()
+        normalized[name] = value
+    return normalized
+
+class TileCache:
+    """
+    Disk cache of WMS GetMap responses (SQLite, one row per tile).
+
+    Keyed by the service and the normalized GetMap parameters. Tiles expire
+    after `ttl` seconds; least recently used ones are evicted once the
+    database grows past `max_bytes`. Each tile keeps a strong ETag (hash of
+    its bytes) for conditional requests.
+    """
+
+    def __init__(self, path: str = None, max_bytes: int = None, ttl: float = None):
+        self.path = path or settings.WMS_CACHE_PATH
+        self.max_bytes = max_bytes if max_bytes is not None else settings.WMS_CACHE_MAX_MB * 1024 * 1024
+        self.ttl = ttl or settings.WMS_CACHE_TTL
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tiles (
+                    key TEXT PRIMARY KEY,
+                    content BLOB NOT NULL,
+                    content_type TEXT NOT NULL,
+                    etag TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tiles_lru ON tiles(last_used);
+            """)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key_for(service: str, params: Dict[str, str]) -> str:
+        return hashlib.sha256(f"{service}?{urlencode(sorted(params.items()))}".encode()).hexdigest()
+
+    @staticmethod
+    def etag_for(content: bytes) -> str:
+        return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """{"content", "content_type", "etag", "created_at"} or None (missing or expired)."""
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT content, content_type, etag, created_at FROM tiles WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            content, content_type, etag, created_at = row
+            if time.time() - created_at > self.ttl:
+                db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+                db.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            db.execute("UPDATE tiles SET last_used = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+        self.hits += 1
+        return {"content": content, "content_type": content_type, "etag": etag, "created_at": created_at}
+
+    def put(self, key: str, content: bytes, content_type: str) -> Dict[str, Any]:
+        now = time.time()
+        tile = {"content": content, "content_type": content_type, "etag": self.etag_for(content), "created_at": now}
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO tiles (key, content, content_type, etag, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, content, content_type, tile["etag"], len(content), now, now)
+            )
+            self._evict(db)
+            db.commit()
+        return tile
+
+    def _evict(self, db: sqlite3.Connection):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM tiles ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM tiles WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._db().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tiles").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+tile_cache = TileCache()
+# Several users (or layers redrawn at once) missing the same tile share one upstream call
+tile_flights = SingleFlight("wms")
+
+async def get_tile(service: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+    """
+    (status, tile) for a GetMap request: from the cache, else one coalesced
+    upstream call. Only image responses are cached; WMS service exceptions
+    (XML, often with status 200) are passed back as 502 and not stored.
+    Raises ValueError for a non-GetMap request.
+    """
+    upstream = WMS_SERVICES[service]
+    normalized = normalize_getmap(params)
+    key = tile_cache.key_for(service, normalized)
+
+    tile = await asyncio.to_thread(tile_cache.get, key)
+    if tile is not None:
+        return 200, tile
+
+    async def fetch(emit):
+        response = await get_http_client().get(
+            upstream, params={k.upper(): v for k, v in normalized.items()}, timeout=settings.WMS_TIMEOUT
+        )
+        content_type = response.headers.get("content-type", "application/octet-stream")
+        if response.status_code != 200 or not content_type.startswith("image/"):
+            return 502, {"content": response.content, "content_type": content_type,
+                         "etag": None, "created_at": time.time()}
+        return 200, await asyncio.to_thread(tile_cache.put, key, response.content, content_type)
+
+    return await tile_flights.do(key, fetch)
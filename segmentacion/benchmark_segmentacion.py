@@ -0,0 +1,164 @@
+"""
+Benchmark de la segmentación de lotes sobre planos reales.
+
+    python segmentacion/benchmark_segmentacion.py data/*_debug/full_map.jpg
+    python segmentacion/benchmark_segmentacion.py plano.jpg --repeticiones 10
+
+Compara cada etapa optimizada con la implementación anterior (que se conserva
+aquí como referencia) y verifica que den el mismo resultado.
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from segmentacion.extractor_lotes import (
+    filtrar_componentes, profundidades, detectar_lotes, recortar_lotes, process_cadastral_map
+)
+
+
+# --- Implementaciones anteriores (referencia) ---
+
+def filtrar_componentes_bucle(thresh, min_line_area):
+    """Versión original: una máscara booleana de toda la imagen por componente."""
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+    thresh_clean = np.zeros_like(thresh)
+    for i in range(1, num_labels):
+        if stats[i, cv2.CC_STAT_AREA] >= min_line_area:
+            thresh_clean[labels == i] = 255
+    return thresh_clean
+
+
+def profundidades_por_contorno(hierarchy):
+    """Versión original: sube por la cadena de padres de cada contorno."""
+    def get_depth(idx, hier):
+        depth = 0
+        current = idx
+        while hier[0][current][3] != -1:
+            current = hier[0][current][3]
+            depth += 1
+        return depth
+    return np.array([get_depth(i, hierarchy) for i in range(len(hierarchy[0]))], dtype=np.int32)
+
+
+def recortes_por_lote(original, lotes, closing_kernel_size=40, dilation_iter=6):
+    """Versión original: máscara, cierre y `dilation_iter` dilataciones 3x3 por lote, copia booleana."""
+    h_img, w_img = original.shape[:2]
+    crops = []
+    for lote in lotes:
+        x, y, w_rect, h_rect = lote["bbox_approx"]
+        margin = 10 + (dilation_iter * 2)
+        x_start, y_start = max(0, x - margin), max(0, y - margin)
+        x_end, y_end = min(w_img, x + w_rect + margin), min(h_img, y + h_rect + margin)
+        roi = original[y_start:y_end, x_start:x_end]
+        mask = np.zeros((y_end - y_start, x_end - x_start), dtype=np.uint8)
+        cv2.drawContours(mask, [lote["contorno"] - [x_start, y_start]], -1, (255), thickness=cv2.FILLED)
+        if closing_kernel_size > 0:
+            kernel_close = cv2.getStructuringElement(cv2.MORPH_RECT, (closing_kernel_size, closing_kernel_size))
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel_close)
+        if dilation_iter > 0:
+            mask = cv2.dilate(mask, np.ones((3, 3), np.uint8), iterations=dilation_iter)
+        result = np.ones_like(roi) * 255
+        result[mask == 255] = roi[mask == 255]
+        crops.append(result)
+    return crops
+
+
+# --- Utilidades ---
+
+def cronometrar(fn, repeticiones):
+    """Mediana en ms de `repeticiones` ejecuciones, y el último resultado."""
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return float(np.median(tiempos)), resultado
+
+
+def umbral_de(imagen_path):
+    """Binarización igual a la de process_cadastral_map (valores por defecto)."""
+    gray = cv2.cvtColor(cv2.imread(imagen_path), cv2.COLOR_BGR2GRAY)
+    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 11, 2)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
+    return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+
+def bench_filtro(imagen_path, repeticiones):
+    thresh = umbral_de(imagen_path)
+    componentes = cv2.connectedComponents(thresh, connectivity=8)[0] - 1
+    t_antes, antes = cronometrar(lambda: filtrar_componentes_bucle(thresh, 100), max(1, repeticiones // 5))
+    t_despues, despues = cronometrar(lambda: filtrar_componentes(thresh, 100), repeticiones)
+    iguales = np.array_equal(antes, despues)
+    print(f"  filtro de componentes ({componentes} componentes): "
+          f"{t_antes:.1f} ms -> {t_despues:.1f} ms (x{t_antes / t_despues:.0f}), idénticos: {iguales}")
+    return iguales
+
+
+def bench_profundidades(imagen_path, repeticiones):
+    lots_binary = cv2.bitwise_not(filtrar_componentes(umbral_de(imagen_path), 100))
+    contours, hierarchy = cv2.findContours(lots_binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return True
+    t_antes, antes = cronometrar(lambda: profundidades_por_contorno(hierarchy), repeticiones)
+    t_despues, despues = cronometrar(lambda: profundidades(hierarchy), repeticiones)
+    iguales = np.array_equal(antes, despues)
+    print(f"  profundidades ({len(contours)} contornos, máx. {int(despues.max())}): "
+          f"{t_antes:.1f} ms -> {t_despues:.1f} ms, idénticas: {iguales}")
+    return iguales
+
+
+def bench_mascaras(imagen_path, repeticiones, tolerancia):
+    original = cv2.imread(imagen_path)
+    lotes = detectar_lotes(original)
+    if not lotes:
+        return True
+    t_ref, ref = cronometrar(lambda: recortes_por_lote(original, lotes), repeticiones)
+    ok = True
+    for nombre, batch in (("por lote", False), ("por capas", True)):
+        t, crops = cronometrar(lambda: recortar_lotes(original, lotes, batch_masks=batch), repeticiones)
+        distintos = sum(int(np.count_nonzero(np.any(a != b, axis=-1))) for a, b in zip(ref, crops))
+        total = sum(a.shape[0] * a.shape[1] for a in ref)
+        dentro = distintos <= tolerancia * total
+        ok &= dentro
+        print(f"  recortes {nombre} ({len(lotes)} lotes): {t_ref:.1f} ms -> {t:.1f} ms, "
+              f"píxeles distintos: {distintos} de {total} ({'ok' if dentro else 'FUERA DE TOLERANCIA'})")
+    return ok
+
+
+def bench_total(imagen_path, repeticiones):
+    with tempfile.TemporaryDirectory() as salida:
+        t, lotes = cronometrar(lambda: process_cadastral_map(imagen_path, salida), repeticiones)
+    print(f"  process_cadastral_map completo: {t:.1f} ms ({len(lotes)} lotes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("imagenes", nargs="*", help="Planos renderizados (por defecto data/*_debug/full_map.jpg)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--tolerancia", type=float, default=0.0,
+                        help="Fracción máxima de píxeles de los recortes que puede diferir de la versión original")
+    args = parser.parse_args()
+
+    imagenes = args.imagenes or sorted(glob.glob(os.path.join("data", "*_debug", "full_map.jpg")))
+    if not imagenes:
+        print("No hay planos para medir.")
+        sys.exit(1)
+
+    ok = True
+    for imagen in imagenes:
+        h, w = cv2.imread(imagen).shape[:2]
+        print(f"{imagen} ({w}x{h})")
+        ok &= bench_filtro(imagen, args.repeticiones)
+        ok &= bench_profundidades(imagen, args.repeticiones)
+        ok &= bench_mascaras(imagen, args.repeticiones, args.tolerancia)
+        bench_total(imagen, args.repeticiones)
+    sys.exit(0 if ok else 1)
@@ -4,40 +4,154 @@ import os
 import argparse
 
 
-def process_cadastral_map(image_path, output_dir, min_area=1000, max_area_percent=0.5, dilation_iter=6, epsilon_factor=0.001, min_line_area=100, closing_kernel_size=40, reconnect_lines_iter=2, reconnect_kernel_size=1):
+def filtrar_componentes(thresh, min_line_area):
     """
-    Procesa un plano catastral para extraer lotes individuales.
-    
-    Args:
-        image_path (str): Ruta a la imagen del plano.
-        output_dir (str): Directorio donde guardar los recortes.
-        min_area (int): Área mínima en píxeles para considerar un contorno como lote.
-        max_area_percent (float): Porcentaje máximo del área total de la imagen para un lote.
-        dilation_iter (int): Cantidad de dilatación de la máscara para incluir bordes/números.
-        epsilon_factor (float): Factor de aproximación poligonal (menor = más fiel al contorno original).
-        min_line_area (int): Área mínima para considerar un objeto blanco (línea) como pared. 
-        closing_kernel_size (int): Tamaño del kernel para la operación de cierre morfológico (rellenar huecos de texto).
-        reconnect_lines_iter (int): Iteraciones para reconectar líneas rotas al inicio.
-        reconnect_kernel_size (int): Tamaño del kernel para reconectar líneas.
+    Conserva solo los componentes blancos de al menos `min_line_area` píxeles
+    (líneas/paredes) y borra los chicos (texto, ruido).
+
+    Una sola pasada: tabla de consulta por etiqueta (255 = se conserva)
+    indexada con la imagen de etiquetas.
     """
-    
-    # 1. Cargar imagen
-    if not os.path.exists(image_path):
-        print(f"Error: No se encontró la imagen en {image_path}")
-        return
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
+    # stats: [x, y, width, height, area]
+    keep = np.where(stats[:, cv2.CC_STAT_AREA] >= min_line_area, 255, 0).astype(np.uint8)
+    keep[0] = 0  # Fondo
+    return keep[labels]
 
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"Error: No se pudo leer la imagen. Verifique el formato.")
-        return
 
-    original = img.copy()
+def profundidades(hierarchy):
+    """
+    Profundidad de cada contorno en el árbol de RETR_TREE, en una sola pasada:
+    recorrido en anchura desde las raíces por primer hijo / siguiente hermano.
+    """
+    h = hierarchy[0]
+    depth = np.zeros(len(h), dtype=np.int32)
+    # hierarchy: [siguiente, anterior, primer_hijo, padre]
+    nivel = [i for i in range(len(h)) if h[i][3] == -1]
+    d = 0
+    while nivel:
+        siguiente_nivel = []
+        for i in nivel:
+            depth[i] = d
+            hijo = h[i][2]
+            while hijo != -1:
+                siguiente_nivel.append(hijo)
+                hijo = h[hijo][0]
+        nivel = siguiente_nivel
+        d += 1
+    return depth
+
+
+def _roi_de(lote, margin, w_img, h_img):
+    x, y, w_rect, h_rect = lote["bbox_approx"]
+    return max(0, x - margin), max(0, y - margin), min(w_img, x + w_rect + margin), min(h_img, y + h_rect + margin)
+
+
+def _capas_sin_conflicto(rois, separacion):
+    """
+    Reparte los lotes en capas: dentro de una capa ningún par de ROIs queda a
+    menos de `separacion` píxeles, así el cierre/dilatación de uno no alcanza
+    al otro y procesarlos juntos da lo mismo que por separado.
+    """
+    capas = []  # [(indices, [rois expandidos])]
+    for i, (x0, y0, x1, y1) in enumerate(rois):
+        caja = (x0 - separacion, y0 - separacion, x1 + separacion, y1 + separacion)
+        for indices, cajas in capas:
+            if all(caja[2] <= c[0] or c[2] <= caja[0] or caja[3] <= c[1] or c[3] <= caja[1] for c in cajas):
+                indices.append(i)
+                cajas.append((x0, y0, x1, y1))
+                break
+        else:
+            capas.append(([i], [(x0, y0, x1, y1)]))
+    return [indices for indices, _ in capas]
+
+
+def recortar_lotes(original, lotes, closing_kernel_size=40, dilation_iter=6, batch_masks=False):
+    """
+    Recorta cada lote sobre fondo blanco: máscara del contorno, cierre
+    morfológico (recupera el texto pegado a las paredes) y dilatación de
+    seguridad. Devuelve un recorte (ndarray) por lote, en el mismo orden.
+
+    Las `dilation_iter` dilataciones 3x3 se hacen como una sola de (2n+1)x(2n+1).
+    Con `batch_masks`, los lotes se agrupan en capas de lotes lejanos entre sí
+    y cada capa se procesa con un solo cierre y una sola dilatación. Da los
+    mismos píxeles, pero en los planos medidos es más lento que por lote (cada
+    capa cubre casi toda la manzana), por eso no es el valor por defecto; ver
+    segmentacion/benchmark_segmentacion.py.
+    """
+    h_img, w_img = original.shape[:2]
+    # Margen de seguridad para el recorte rectangular (ROI)
+    # Aumentamos el margen en base a la dilatación para no cortar lo que expandimos
+    margin = 10 + (dilation_iter * 2)
+    rois = [_roi_de(lote, margin, w_img, h_img) for lote in lotes]
+
+    kernel_close = None
+    if closing_kernel_size > 0:
+        kernel_close = cv2.getStructuringElement(cv2.MORPH_RECT, (closing_kernel_size, closing_kernel_size))
+    # dilation_iter pasadas de 3x3 equivalen a una sola de (2n+1)x(2n+1)
+    kernel_dilate = None
+    if dilation_iter > 0:
+        kernel_dilate = np.ones((2 * dilation_iter + 1, 2 * dilation_iter + 1), np.uint8)
+
+    def morfologia(mask):
+        # CIERRE MORFOLÓGICO (IMPORTANTE):
+        # Si el texto estaba pegado a la pared, creó una "bahía" o hueco en la máscara blanca.
+        # Aplicamos Morphological Closing para cerrar esos huecos y recuperar el área del texto.
+        if kernel_close is not None:
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel_close)
+        # DILATACIÓN DE SEGURIDAD:
+        # Dilatamos ligeramente la máscara blanca para asegurar que incluimos los bordes internos
+        # y cualquier texto que pudiera estar tocando el borde.
+        if kernel_dilate is not None:
+            mask = cv2.dilate(mask, kernel_dilate)
+        return mask
+
+    mascaras = [None] * len(lotes)
+    if batch_masks:
+        separacion = max(closing_kernel_size, 0) + dilation_iter + 1
+        for capa in _capas_sin_conflicto(rois, separacion):
+            # Una máscara por capa, del tamaño de la zona que cubren sus lotes
+            cx0 = min(rois[i][0] for i in capa)
+            cy0 = min(rois[i][1] for i in capa)
+            cx1 = max(rois[i][2] for i in capa)
+            cy1 = max(rois[i][3] for i in capa)
+            mask = np.zeros((cy1 - cy0, cx1 - cx0), dtype=np.uint8)
+            cv2.drawContours(mask, [lotes[i]["contorno"] - [cx0, cy0] for i in capa], -1, 255, thickness=cv2.FILLED)
+            mask = morfologia(mask)
+            for i in capa:
+                x0, y0, x1, y1 = rois[i]
+                mascaras[i] = mask[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+    else:
+        for i, lote in enumerate(lotes):
+            x0, y0, x1, y1 = rois[i]
+            mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.drawContours(mask, [lote["contorno"] - [x0, y0]], -1, 255, thickness=cv2.FILLED)
+            mascaras[i] = morfologia(mask)
+
+    crops = []
+    for (x0, y0, x1, y1), mask in zip(rois, mascaras):
+        roi = original[y0:y1, x0:x1]
+        # Fondo blanco y solo el contenido dentro de la máscara
+        result = np.full_like(roi, 255)
+        cv2.copyTo(roi, mask, result)
+        crops.append(result)
+    return crops
+
+
+def detectar_lotes(img, min_area=1000, max_area_percent=0.5, epsilon_factor=0.001, min_line_area=100, reconnect_lines_iter=2, reconnect_kernel_size=1):
+    """
+    Detecta los lotes de un plano (pasos 2 y 3 de process_cadastral_map).
+
+    Returns:
+        list[dict]: Un registro por lote, ordenado por fila y luego X, con la geometría
+            calculada una sola vez: "contorno", "area", "bbox", "approx", "bbox_approx", "momentos".
+    """
     h, w = img.shape[:2]
     total_area = h * w
     max_area = total_area * max_area_percent
 
     # 2. Preprocesamiento
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
     # Binarización invertida (líneas blancas sobre fondo negro para encontrar contornos externos)
     # Usamos threshold adaptativo para manejar iluminación variable o manchas
@@ -58,17 +172,7 @@ def process_cadastral_map(image_path, output_dir, min_area=1000, max_area_percen
     # El texto también aparece como blobs blancos pequeños.
     # Si eliminamos los blobs pequeños, el texto desaparece de la "pared", 
     # por lo que el "Lote" (espacio vacío) podrá ocupar ese espacio.
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(thresh, connectivity=8)
-    
-    # stats: [x, y, width, height, area]
-    thresh_clean = np.zeros_like(thresh)
-    
-    # Filtrar componentes
-    for i in range(1, num_labels): # Empezamos en 1 para saltar el fondo (0)
-        area = stats[i, cv2.CC_STAT_AREA]
-        if area >= min_line_area:
-            # Mantener componente (es una línea o estructura grande)
-            thresh_clean[labels == i] = 255
+    thresh_clean = filtrar_componentes(thresh, min_line_area)
             
     # ESTRATEGIA ACTUALIZADA:
     # Trabajamos con los "Lotes" como objetos blancos.
@@ -86,33 +190,21 @@ def process_cadastral_map(image_path, output_dir, min_area=1000, max_area_percen
 
     if not contours:
         print("No se encontraron contornos.")
-        return
+        return []
 
     print(f"Se encontraron {len(contours)} contornos iniciales.")
 
-    # Crear directorio de salida
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
     # Filtrar y ordenar contornos
     valid_lots = []
     h_img, w_img = img.shape[:2]
     
-    # Helper para calcular profundidad
-    def get_depth(idx, hier):
-        depth = 0
-        current = idx
-        while hier[0][current][3] != -1:
-            current = hier[0][current][3]
-            depth += 1
-        return depth
+    # Profundidad de todos los contornos de una vez
+    # Si la profundidad es impar (1, 3...), es un contorno interior (agujero), que encierra negro.
+    # Si la profundidad es par (0, 2...), es un contorno exterior, que encierra blanco (Lote).
+    depths = profundidades(hierarchy)
 
     for i, cnt in enumerate(contours):
-        # Calcular profundidad
-        # Si la profundidad es impar (1, 3...), es un contorno interior (agujero), que encierra negro.
-        # Si la profundidad es par (0, 2...), es un contorno exterior, que encierra blanco (Lote).
-        depth = get_depth(i, hierarchy)
-        if depth % 2 != 0:
+        if depths[i] % 2 != 0:
             continue
 
         # Calcular área
@@ -133,90 +225,150 @@ def process_cadastral_map(image_path, output_dir, min_area=1000, max_area_percen
         # Sin embargo, el "marco" de la página podría ser detectado como un lote gigante si es blanco.
         # El filtro max_area ayuda aquí.
         
-        # Adicionalmente, podemos verificar la solidez o la relación de aspecto si es necesario.
-        
-        valid_lots.append(cnt)
+        # Registro por lote: la geometría se calcula una vez y se reutiliza
+        # para ordenar, recortar y dibujar el debug
+        valid_lots.append({"contorno": cnt, "area": area, "bbox": (bx, by, bw, bh)})
     
     print(f"Se detectaron {len(valid_lots)} lotes válidos después de filtrar.")
     
     # Ordenar lotes (opcional, por posición Y luego X para tener orden lógico)
     # bounding box: x, y, w, h
-    valid_lots.sort(key=lambda c: (cv2.boundingRect(c)[1] // 100, cv2.boundingRect(c)[0])) 
+    valid_lots.sort(key=lambda lote: (lote["bbox"][1] // 100, lote["bbox"][0]))
 
-    count = 0
-    debug_img = original.copy()
-
-    for cnt in valid_lots:
+    for lote in valid_lots:
+        cnt = lote["contorno"]
         # Aproximar el polígono
         # Reducimos epsilon para que el contorno sea más fiel a la forma real y no corte esquinas
         # Usamos el parámetro epsilon_factor
-        epsilon = epsilon_factor * cv2.arcLength(cnt, True)
-        approx = cv2.approxPolyDP(cnt, epsilon, True)
-        
-        # 4. Extracción precisa
-        # Crear una máscara para este lote específico
-        x, y, w_rect, h_rect = cv2.boundingRect(approx)
-        
-        # Margen de seguridad para el recorte rectangular (ROI)
-        # Aumentamos el margen en base a la dilatación para no cortar lo que expandimos
-        margin = 10 + (dilation_iter * 2)
-        x_start = max(0, x - margin)
-        y_start = max(0, y - margin)
-        x_end = min(w_img, x + w_rect + margin)
-        y_end = min(h_img, y + h_rect + margin)
-
-        # Recorte del área de interés
-        roi = original[y_start:y_end, x_start:x_end]
-        
-        # Crear máscara ajustada al ROI
-        mask = np.zeros((y_end - y_start, x_end - x_start), dtype=np.uint8)
-        
-        # Ajustar coordenadas del contorno al ROI
-        cnt_roi = cnt - [x_start, y_start]
-        
-        # Dibujar el contorno relleno en la máscara
-        cv2.drawContours(mask, [cnt_roi], -1, (255), thickness=cv2.FILLED)
-        
-        # CIERRE MORFOLÓGICO (IMPORTANTE):
-        # Si el texto estaba pegado a la pared, creó una "bahía" o hueco en la máscara blanca.
-        # Aplicamos Morphological Closing para cerrar esos huecos y recuperar el área del texto.
-        if closing_kernel_size > 0:
-            k_size = closing_kernel_size
-            kernel_close = cv2.getStructuringElement(cv2.MORPH_RECT, (k_size, k_size))
-            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel_close)
-            
-        # DILATACIÓN DE SEGURIDAD:
-        # Dilatamos ligeramente la máscara blanca para asegurar que incluimos los bordes internos
-        # y cualquier texto que pudiera estar tocando el borde.
-        if dilation_iter > 0:
-            kernel_dilate = np.ones((3,3), np.uint8)
-            mask = cv2.dilate(mask, kernel_dilate, iterations=dilation_iter)
-        
-        # Crear imagen final con fondo blanco
-        result = np.ones_like(roi) * 255
-        
-        # Copiar solo el contenido dentro de la máscara
-        result[mask == 255] = roi[mask == 255]
-        
-        # Guardar
-        lot_filename = os.path.join(output_dir, f"lote_{count+1:03d}.png")
-        cv2.imwrite(lot_filename, result)
-        
-        # Dibujar en imagen de debug
-        cv2.drawContours(debug_img, [cnt], -1, (0, 255, 0), 2)
+        lote["approx"] = cv2.approxPolyDP(cnt, epsilon_factor * cv2.arcLength(cnt, True), True)
+        lote["bbox_approx"] = cv2.boundingRect(lote["approx"])
+        lote["momentos"] = cv2.moments(cnt)
+
+    return valid_lots
+
+
+def segmentar_lotes(img, encode=None, min_area=1000, max_area_percent=0.5, dilation_iter=6, epsilon_factor=0.001, min_line_area=100, closing_kernel_size=40, reconnect_lines_iter=2, reconnect_kernel_size=1, batch_masks=False):
+    """
+    Segmenta un plano en memoria: sin leer ni escribir archivos.
+
+    Args:
+        img (ndarray): Plano en BGR o en escala de grises.
+        encode (str | None): Extensión para codificar cada recorte (por ejemplo ".png");
+            None deja solo el ndarray.
+        (el resto de los parámetros, como en process_cadastral_map)
+
+    Returns:
+        list[dict]: Un registro por lote, en orden:
+            {"filename", "bbox", "polygon", "crop" (ndarray), "data" (bytes, si encode),
+             "contorno", "momentos"}
+    """
+    valid_lots = detectar_lotes(img, min_area=min_area, max_area_percent=max_area_percent,
+                                epsilon_factor=epsilon_factor, min_line_area=min_line_area,
+                                reconnect_lines_iter=reconnect_lines_iter,
+                                reconnect_kernel_size=reconnect_kernel_size)
+    if not valid_lots:
+        return []
+
+    # 4. Extracción precisa (máscaras y recortes de todos los lotes)
+    crops = recortar_lotes(img, valid_lots, closing_kernel_size, dilation_iter, batch_masks=batch_masks)
+
+    lots = []
+    for count, (lote, crop) in enumerate(zip(valid_lots, crops)):
+        x, y, w_rect, h_rect = lote["bbox_approx"]
+        registro = {
+            "filename": f"lote_{count+1:03d}.png",
+            "bbox": [int(x), int(y), int(w_rect), int(h_rect)],
+            "polygon": lote["approx"].reshape(-1, 2).tolist(),
+            "crop": crop,
+            "contorno": lote["contorno"],
+            "momentos": lote["momentos"],
+        }
+        if encode:
+            ok, buffer = cv2.imencode(encode, crop)
+            registro["data"] = buffer.tobytes()
+        lots.append(registro)
+    return lots
+
+
+def dibujar_debug(img, lots):
+    """Plano con el contorno y el número de cada lote detectado."""
+    # Copia en color (el plano puede venir en escala de grises)
+    debug_img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img.copy()
+    for count, lote in enumerate(lots):
+        cv2.drawContours(debug_img, [lote["contorno"]], -1, (0, 255, 0), 2)
         # Centro para poner texto
-        M = cv2.moments(cnt)
+        M = lote["momentos"]
         if M["m00"] != 0:
             cX = int(M["m10"] / M["m00"])
             cY = int(M["m01"] / M["m00"])
             cv2.putText(debug_img, str(count+1), (cX, cY), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-        
-        count += 1
+    return debug_img
+
+
+def guardar_lotes(output_dir, lots, img=None):
+    """
+    Escribe los recortes de segmentar_lotes (y, con `img`, debug_detected_lots.jpg).
+    Usa los bytes ya codificados si están.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    for lote in lots:
+        path = os.path.join(output_dir, lote["filename"])
+        if lote.get("data") is not None:
+            with open(path, "wb") as f:
+                f.write(lote["data"])
+        else:
+            cv2.imwrite(path, lote["crop"])
+    if img is not None:
+        cv2.imwrite(os.path.join(output_dir, "debug_detected_lots.jpg"), dibujar_debug(img, lots))
+
+
+def process_cadastral_map(image_path, output_dir, min_area=1000, max_area_percent=0.5, dilation_iter=6, epsilon_factor=0.001, min_line_area=100, closing_kernel_size=40, reconnect_lines_iter=2, reconnect_kernel_size=1, batch_masks=False):
+    """
+    Procesa un plano catastral para extraer lotes individuales.
+    Lee la imagen, la segmenta con segmentar_lotes y guarda los recortes.
+    
+    Args:
+        image_path (str): Ruta a la imagen del plano.
+        output_dir (str): Directorio donde guardar los recortes.
+        min_area (int): Área mínima en píxeles para considerar un contorno como lote.
+        max_area_percent (float): Porcentaje máximo del área total de la imagen para un lote.
+        dilation_iter (int): Cantidad de dilatación de la máscara para incluir bordes/números.
+        epsilon_factor (float): Factor de aproximación poligonal (menor = más fiel al contorno original).
+        min_line_area (int): Área mínima para considerar un objeto blanco (línea) como pared. 
+        closing_kernel_size (int): Tamaño del kernel para la operación de cierre morfológico (rellenar huecos de texto).
+        reconnect_lines_iter (int): Iteraciones para reconectar líneas rotas al inicio.
+        reconnect_kernel_size (int): Tamaño del kernel para reconectar líneas.
+        batch_masks (bool): Construir las máscaras por capas de lotes (ver recortar_lotes).
+
+    Returns:
+        list[dict]: Un registro por lote guardado, en el mismo orden que los archivos:
+            {"filename": "lote_001.png", "bbox": [x, y, w, h], "polygon": [[x, y], ...]}
+            en coordenadas de la imagen de entrada.
+    """
+    
+    # 1. Cargar imagen
+    if not os.path.exists(image_path):
+        print(f"Error: No se encontró la imagen en {image_path}")
+        return []
+
+    img = cv2.imread(image_path)
+    if img is None:
+        print(f"Error: No se pudo leer la imagen. Verifique el formato.")
+        return []
+
+    lots = segmentar_lotes(img, min_area=min_area, max_area_percent=max_area_percent, dilation_iter=dilation_iter,
+                           epsilon_factor=epsilon_factor, min_line_area=min_line_area,
+                           closing_kernel_size=closing_kernel_size, reconnect_lines_iter=reconnect_lines_iter,
+                           reconnect_kernel_size=reconnect_kernel_size, batch_masks=batch_masks)
+    if not lots:
+        return []
 
-    # Guardar imagen de debug
-    cv2.imwrite(os.path.join(output_dir, "debug_detected_lots.jpg"), debug_img)
-    print(f"Procesamiento completado. Se extrajeron {count} lotes en '{output_dir}'.")
+    # Guardar recortes e imagen de debug
+    guardar_lotes(output_dir, lots, img)
+    print(f"Procesamiento completado. Se extrajeron {len(lots)} lotes en '{output_dir}'.")
     print(f"Revise 'debug_detected_lots.jpg' para ver qué se detectó.")
+    return [{"filename": l["filename"], "bbox": l["bbox"], "polygon": l["polygon"]} for l in lots]
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extractor de lotes catastrales")
@@ -229,7 +381,8 @@ if __name__ == "__main__":
     parser.add_argument("--closing_kernel", type=int, default=25, help="Tamaño del kernel para cerrar huecos (texto pegado a paredes)")
     parser.add_argument("--reconnect_iter", type=int, default=2, help="Iteraciones para reconectar líneas rotas")
     parser.add_argument("--reconnect_kernel", type=int, default=3, help="Tamaño kernel para reconectar líneas rotas")
+    parser.add_argument("--batch_masks", action="store_true", help="Construir las máscaras por capas de lotes")
     
     args = parser.parse_args()
     
-    process_cadastral_map(args.imagen, args.out, min_area=args.min_area, dilation_iter=args.dilation, epsilon_factor=args.epsilon, min_line_area=args.min_line_area, closing_kernel_size=args.closing_kernel, reconnect_lines_iter=args.reconnect_iter, reconnect_kernel_size=args.reconnect_kernel)
+    process_cadastral_map(args.imagen, args.out, min_area=args.min_area, dilation_iter=args.dilation, epsilon_factor=args.epsilon, min_line_area=args.min_line_area, closing_kernel_size=args.closing_kernel, reconnect_lines_iter=args.reconnect_iter, reconnect_kernel_size=args.reconnect_kernel, batch_masks=args.batch_masks)
@@ -0,0 +1,283 @@
+import cv2
+import numpy as np
+import os
+import re
+import argparse
+import fitz  # PyMuPDF
+
+
+# Expresiones para clasificar el texto de cada lote
+RE_LOTE = re.compile(r"^\d{1,4}$")
+RE_MEDIDA = re.compile(r"^\d+[.,]\d+$")
+RE_PH = re.compile(r"P\.?\s*H\.?\s*\d+", re.IGNORECASE)
+RE_MANZANA = re.compile(r"manzana|\bmz\b|secci[oó]n|\bsecc?\b", re.IGNORECASE)
+
+SUPERINDICES = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
+
+
+def extraer_segmentos(page, curve_steps=8):
+    """
+    Devuelve los trazos del plano como lista de segmentos ((x1, y1), (x2, y2))
+    en coordenadas PDF, a partir de page.get_drawings().
+    """
+    segmentos = []
+    for path in page.get_drawings():
+        for item in path.get("items", []):
+            op = item[0]
+            if op == "l":
+                p1, p2 = item[1], item[2]
+                segmentos.append(((p1.x, p1.y), (p2.x, p2.y)))
+            elif op == "re":
+                r = item[1]
+                esquinas = [(r.x0, r.y0), (r.x1, r.y0), (r.x1, r.y1), (r.x0, r.y1)]
+                segmentos.extend(zip(esquinas, esquinas[1:] + esquinas[:1]))
+            elif op == "qu":
+                q = item[1]
+                esquinas = [(q.ul.x, q.ul.y), (q.ur.x, q.ur.y), (q.lr.x, q.lr.y), (q.ll.x, q.ll.y)]
+                segmentos.extend(zip(esquinas, esquinas[1:] + esquinas[:1]))
+            elif op == "c":
+                # Bézier cúbica: se aproxima con una poligonal
+                p0, c1, c2, p3 = item[1], item[2], item[3], item[4]
+                puntos = []
+                for k in range(curve_steps + 1):
+                    t = k / curve_steps
+                    a, b, c, d = (1 - t) ** 3, 3 * (1 - t) ** 2 * t, 3 * (1 - t) * t ** 2, t ** 3
+                    puntos.append((a * p0.x + b * c1.x + c * c2.x + d * p3.x,
+                                   a * p0.y + b * c1.y + c * c2.y + d * p3.y))
+                segmentos.extend(zip(puntos, puntos[1:]))
+    return segmentos
+
+
+def reconstruir_poligonos(segmentos, width, height, zoom=3, min_area=1000, max_area_percent=0.5, epsilon_factor=0.001):
+    """
+    Reconstruye los polígonos de los lotes a partir de los segmentos.
+
+    Los segmentos se trazan (solo líneas, sin texto ni ruido) sobre un lienzo a
+    escala `zoom`, y cada cara cerrada del dibujo resultante es un candidato a
+    lote. Devuelve polígonos en píxeles de la imagen renderizada a esa escala,
+    ordenados como en el extractor raster (fila de 100 px, luego X).
+    """
+    w_img, h_img = int(round(width * zoom)), int(round(height * zoom))
+    lineas = np.zeros((h_img, w_img), dtype=np.uint8)
+    for (x1, y1), (x2, y2) in segmentos:
+        cv2.line(lineas,
+                 (int(round(x1 * zoom)), int(round(y1 * zoom))),
+                 (int(round(x2 * zoom)), int(round(y2 * zoom))),
+                 255, thickness=2)
+    # Cerrar micro-huecos entre extremos que casi se tocan
+    lineas = cv2.morphologyEx(lineas, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+
+    # Las caras (espacios entre líneas) son los lotes
+    caras = cv2.bitwise_not(lineas)
+    contours, hierarchy = cv2.findContours(caras, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return []
+
+    max_area = w_img * h_img * max_area_percent
+    poligonos = []
+    for i, cnt in enumerate(contours):
+        # Solo contornos exteriores de zonas blancas
+        if hierarchy[0][i][3] != -1:
+            continue
+        area = cv2.contourArea(cnt)
+        if area < min_area or area > max_area:
+            continue
+        bx, by, bw, bh = cv2.boundingRect(cnt)
+        if bx <= 5 or by <= 5 or (bx + bw) >= (w_img - 5) or (by + bh) >= (h_img - 5):
+            continue
+        approx = cv2.approxPolyDP(cnt, epsilon_factor * cv2.arcLength(cnt, True), True)
+        poligonos.append((approx, (bx, by, bw, bh)))
+
+    poligonos.sort(key=lambda p: (p[1][1] // 100, p[1][0]))
+    return poligonos
+
+
+def extraer_textos(page, zoom=3):
+    """Spans de texto del plano con su centro en píxeles de la imagen renderizada."""
+    textos = []
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                texto = span.get("text", "").strip()
+                if not texto:
+                    continue
+                x0, y0, x1, y1 = span["bbox"]
+                textos.append({
+                    "text": texto,
+                    "size": span.get("size", 0),
+                    "bbox": [x0 * zoom, y0 * zoom, x1 * zoom, y1 * zoom],
+                    "center": ((x0 + x1) / 2 * zoom, (y0 + y1) / 2 * zoom),
+                })
+    return textos
+
+
+def clasificar_textos(textos):
+    """Arma el esquema de lots_data (lot_number, dimensions, ph_info, other_text) con los textos de un lote."""
+    numeros = [t for t in textos if RE_LOTE.match(t["text"])]
+    principal = max(numeros, key=lambda t: t["size"]) if numeros else None
+
+    lot_number = None
+    usados = set()
+    if principal:
+        lot_number = principal["text"]
+        usados.add(id(principal))
+        # Un número chico pegado al principal es un superíndice (17 con un 1 chico -> 17¹)
+        x0, y0, x1, y1 = principal["bbox"]
+        alto = y1 - y0
+        for t in numeros:
+            if t is principal or t["size"] >= principal["size"] * 0.75:
+                continue
+            cx, cy = t["center"]
+            if x0 - alto <= cx <= x1 + alto and y0 - alto <= cy <= y1 + alto:
+                lot_number += t["text"].translate(SUPERINDICES)
+                usados.add(id(t))
+
+    dimensions = [t["text"].replace(",", ".") for t in textos if RE_MEDIDA.match(t["text"])]
+    usados.update(id(t) for t in textos if RE_MEDIDA.match(t["text"]))
+
+    ph = [RE_PH.search(t["text"]).group(0) for t in textos if RE_PH.search(t["text"])]
+    usados.update(id(t) for t in textos if RE_PH.search(t["text"]))
+
+    otros = [t["text"] for t in textos if id(t) not in usados]
+    return {
+        "lot_number": lot_number,
+        "dimensions": dimensions,
+        "ph_info": ", ".join(ph) if ph else None,
+        "other_text": " ".join(otros) if otros else None,
+    }
+
+
+def armar_info_global(textos):
+    """Calles, manzana/sección y encabezados a partir del texto que queda fuera de los lotes."""
+    streets, headers, block_info = [], [], []
+    for t in textos:
+        texto = t["text"]
+        if RE_MANZANA.search(texto):
+            block_info.append(texto)
+        elif re.fullmatch(r"[A-ZÁÉÍÓÚÑÜ .'\-]{4,}", texto):
+            streets.append(texto)
+        elif not RE_MEDIDA.match(texto) and not RE_LOTE.match(texto):
+            headers.append(texto)
+    return {
+        "streets": list(dict.fromkeys(streets)),
+        "block_info": " ".join(dict.fromkeys(block_info)),
+        "headers": list(dict.fromkeys(headers)),
+    }
+
+
+def recortar_lote(image, polygon, margin=10, dilation=6):
+    """Recorte del lote sobre fondo blanco, igual que el extractor raster."""
+    h_img, w_img = image.shape[:2]
+    x, y, w, h = cv2.boundingRect(polygon)
+    margin = margin + dilation * 2
+    x_start, y_start = max(0, x - margin), max(0, y - margin)
+    x_end, y_end = min(w_img, x + w + margin), min(h_img, y + h + margin)
+
+    roi = image[y_start:y_end, x_start:x_end]
+    mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [polygon - [x_start, y_start]], 255)
+    if dilation > 0:
+        k = 2 * dilation + 1
+        mask = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+
+    result = np.full_like(roi, 255)
+    cv2.copyTo(roi, mask, result)
+    return result
+
+
+def extraer_lotes_vectoriales(pdf_path, zoom=3, min_segments=8, tolerancia=6, **kwargs):
+    """
+    Extrae los lotes de un Registro Gráfico vectorial sin rasterizar el plano ni usar LLM.
+
+    Args:
+        pdf_path (str): Ruta al PDF.
+        zoom (float): Escala de la imagen renderizada a la que se refieren los polígonos.
+        min_segments (int): Mínimo de trazos para considerar el PDF vectorial (si no, es un escaneo).
+        tolerancia (float): Distancia máxima (px) fuera del polígono para asignarle un texto
+            (las medidas suelen estar sobre la línea del borde).
+
+    Returns:
+        dict | None: {"lots": [{"filename", "bbox", "polygon", "data"}], "global_info": {...}},
+            o None si el PDF no tiene dibujo vectorial utilizable.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        if doc.page_count < 1:
+            return None
+        page = doc[0]
+        segmentos = extraer_segmentos(page)
+        if len(segmentos) < min_segments:
+            print(f"PDF sin dibujo vectorial suficiente ({len(segmentos)} trazos), se usa el extractor raster.")
+            return None
+        poligonos = reconstruir_poligonos(segmentos, page.rect.width, page.rect.height, zoom=zoom, **kwargs)
+        textos = extraer_textos(page, zoom=zoom)
+    finally:
+        doc.close()
+
+    if not poligonos:
+        return None
+
+    # Asignar cada texto al polígono que lo contiene (o al más cercano dentro de la tolerancia)
+    por_lote = [[] for _ in poligonos]
+    fuera = []
+    for t in textos:
+        mejor, mejor_dist = None, -tolerancia
+        for idx, (poly, (bx, by, bw, bh)) in enumerate(poligonos):
+            cx, cy = t["center"]
+            if not (bx - tolerancia <= cx <= bx + bw + tolerancia and by - tolerancia <= cy <= by + bh + tolerancia):
+                continue
+            dist = cv2.pointPolygonTest(poly, (float(cx), float(cy)), True)
+            if dist >= mejor_dist:
+                mejor, mejor_dist = idx, dist
+        if mejor is None:
+            fuera.append(t)
+        else:
+            por_lote[mejor].append(t)
+
+    lots = []
+    for count, ((poly, bbox), textos_lote) in enumerate(zip(poligonos, por_lote)):
+        filename = f"lote_{count+1:03d}.png"
+        data = clasificar_textos(textos_lote)
+        data["filename"] = filename
+        data["source"] = "vector"
+        lots.append({
+            "filename": filename,
+            "bbox": [int(v) for v in bbox],
+            "polygon": poly.reshape(-1, 2).tolist(),
+            "data": data,
+        })
+
+    return {"lots": lots, "global_info": armar_info_global(fuera)}
+
+
+def guardar_recortes(image, lots, output_dir):
+    """Guarda lote_XXX.png para cada lote sobre la imagen renderizada."""
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    for lot in lots:
+        polygon = np.array(lot["polygon"], dtype=np.int32)
+        cv2.imwrite(os.path.join(output_dir, lot["filename"]), recortar_lote(image, polygon))
+
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description="Extractor vectorial de lotes catastrales")
+    parser.add_argument("pdf", help="Ruta al PDF del Registro Gráfico")
+    parser.add_argument("--out", default=None, help="Directorio donde guardar los recortes (opcional)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultado = extraer_lotes_vectoriales(args.pdf)
+    print(f"Extracción vectorial: {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    if resultado is None:
+        print("El PDF no es vectorial.")
+    else:
+        if args.out:
+            doc = fitz.open(args.pdf)
+            pix = doc[0].get_pixmap(matrix=fitz.Matrix(3, 3))
+            img = cv2.cvtColor(np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width, pix.n), cv2.COLOR_RGB2BGR)
+            guardar_recortes(img, resultado["lots"], args.out)
+        print(json.dumps({"global_info": resultado["global_info"],
+                          "lots": [l["data"] for l in resultado["lots"]]}, indent=2, ensure_ascii=False))
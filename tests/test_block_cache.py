@@ -0,0 +1,30 @@
+import os
+import time
+from app.block_cache import BlockCache
+
+def put_block(cache, key, size, tmp_path):
+    debug_dir = tmp_path / f"{key}_debug"
+    (debug_dir / "lots").mkdir(parents=True)
+    (debug_dir / "full_map.jpg").write_bytes(b"x" * size)
+    cache.put(key, {}, [], {}, debug_dir=str(debug_dir))
+
+def test_least_recently_used_blocks_are_evicted(tmp_path):
+    cache = BlockCache(str(tmp_path / "blocks"), max_bytes=2500)
+    put_block(cache, "a", 1000, tmp_path)
+    time.sleep(0.01)
+    put_block(cache, "b", 1000, tmp_path)
+    time.sleep(0.01)
+    assert cache.get("a") is not None
+    put_block(cache, "c", 1000, tmp_path)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    assert not os.path.exists(tmp_path / "blocks" / "b")
+
+    # Entries on disk are picked up by a new instance
+    assert BlockCache(str(tmp_path / "blocks"), max_bytes=2500).get("c") is not None
+
+def test_key_depends_on_version():
+    assert BlockCache.key_for(b"pdf", "v1") != BlockCache.key_for(b"pdf", "v2")
+    assert BlockCache.key_for(b"pdf", "v1").startswith(BlockCache.key_for(b"pdf"))
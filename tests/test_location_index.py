@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+from app import locations
+from app.location_index import LocationIndex, build_index, feature_label, label_matches
+from app.singleflight import normalize_address
+
+LABELS = ["Córdoba 10", "CORDOBA 100", "CORDOBA 1050", "CORDOBA 1100", "BV CORDOBA 1050",
+          "BV CORDOBA 510", "PJE CORDOBA 12", "SAN MARTIN 1000", "CORDOBESA 10"]
+
+def make_feature(label):
+    return {"type": "Feature", "properties": {"descripcion": label}, "geometry": None}
+
+def write_dump(path, labels):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": [make_feature(l) for l in labels]}, f)
+
+def build(tmp_path, labels, complete=True):
+    dump = str(tmp_path / "dump.geojson")
+    index_path = str(tmp_path / "index.tsv")
+    write_dump(dump, labels)
+    build_index([dump], index_path, complete=complete)
+    return dump, index_path
+
+def labels_of(result):
+    return [feature_label(f) for f in (result or {}).get("features", [])]
+
+def test_search_only_reads_what_load_loaded(tmp_path):
+    dump, index_path = build(tmp_path, ["Córdoba 10", "CORDOBA 100", "CORDOBA 1100"])
+    index = LocationIndex(index_path, limit=20)
+
+    # Not loaded yet: a miss, without touching the file
+    assert index.search("cordoba 10") is None
+
+    index.load()
+    assert index.complete
+    assert labels_of(index.search("cordoba 10")) == ["Córdoba 10", "CORDOBA 100"]
+
+    # A rebuild is only picked up by the next load()
+    write_dump(dump, ["CORDOBA 1000"])
+    build_index([dump], index_path)
+    os.utime(index_path, (1, 1))
+    assert labels_of(index.search("cordoba 10")) == ["Córdoba 10", "CORDOBA 100"]
+    index.load()
+    assert labels_of(index.search("cordoba 10")) == ["CORDOBA 1000"]
+    assert not index.complete
+
+def test_index_matches_like_the_remote_api(tmp_path, monkeypatch):
+    _, index_path = build(tmp_path, LABELS)
+    index = LocationIndex(index_path, limit=20)
+    index.load()
+
+    async def remote(query):
+        tokens = normalize_address(query).split()
+        return {"type": "FeatureCollection",
+                "features": [make_feature(l) for l in LABELS if label_matches(normalize_address(l), tokens)]}
+    monkeypatch.setattr(locations, "_fetch_locations", remote)
+
+    for query in ["CORDOBA 10", "cordoba", "BV CORDOBA 5", "CORDOBA 1", "10", "MARTIN SAN"]:
+        monkeypatch.setattr(locations, "location_index", LocationIndex(str(tmp_path / "none.tsv")))
+        monkeypatch.setattr(locations, "location_cache", locations.LocationCache(10, 60))
+        from_remote = asyncio.run(locations.search_locations(query))
+        monkeypatch.setattr(locations, "location_index", index)
+        from_index = asyncio.run(locations.search_locations(query))
+        assert sorted(labels_of(from_index)) == sorted(labels_of(from_remote)), query
+
+    assert "BV CORDOBA 1050" in labels_of(index.search("CORDOBA 10"))
+
+def test_partial_index_does_not_cut_remote_results_short(tmp_path, monkeypatch):
+    _, index_path = build(tmp_path, ["CORDOBA 100"], complete=False)
+    index = LocationIndex(index_path, limit=20)
+    index.load()
+    monkeypatch.setattr(locations, "location_index", index)
+    monkeypatch.setattr(locations, "location_cache", locations.LocationCache(10, 60))
+
+    async def remote(query):
+        return {"type": "FeatureCollection", "features": [make_feature("CORDOBA 100"), make_feature("CORDOBA 1000")]}
+    monkeypatch.setattr(locations, "_fetch_locations", remote)
+    assert labels_of(asyncio.run(locations.search_locations("CORDOBA 10"))) == ["CORDOBA 100", "CORDOBA 1000"]
+
+    async def down(query):
+        return {"features": [], "error": "Upstream API error: 503"}
+    monkeypatch.setattr(locations, "_fetch_locations", down)
+    assert labels_of(asyncio.run(locations.search_locations("CORDOBA 1"))) == ["CORDOBA 100"]
@@ -0,0 +1,42 @@
+from app.locations import LocationCache
+
+def feature(label):
+    return {"type": "Feature", "properties": {"descripcion": label}, "geometry": None}
+
+def collection(labels):
+    return {"type": "FeatureCollection", "features": [feature(label) for label in labels]}
+
+def labels(result):
+    return [f["properties"]["descripcion"] for f in result["features"]]
+
+def cache_with_capped_result():
+    cache = LocationCache(max_entries=10, ttl=60)
+    # A capped upstream result: anything smaller is complete
+    cache.put("SAN", collection([f"SAN MARTIN {i}" for i in range(20)]))
+    return cache
+
+def test_prefix_reuse_keeps_only_extensions_of_the_query():
+    cache = cache_with_capped_result()
+    cache.put("CORDOBA", collection(
+        ["CORDOBA 1", "CORDOBA 10", "CORDOBA 100", "CORDOBA 1000", "CORDOBA 1100",
+         "CORDOBA 1210", "BV CORDOBA 510", "BV CORDOBA 1050", "PJE CORDOBA 12", "CORDOBESA 10"]
+    ))
+
+    result = cache.get("CORDOBA 10")
+
+    assert labels(result) == ["CORDOBA 10", "CORDOBA 100", "CORDOBA 1000", "BV CORDOBA 1050"]
+    assert cache.prefix_hits == 1
+
+def test_prefix_ending_mid_word_is_not_reused():
+    cache = cache_with_capped_result()
+    cache.put("CORDOBA 1", collection(["CORDOBA 1", "CORDOBA 10", "CORDOBA 100"]))
+
+    assert cache.get("CORDOBA 10") is None
+    assert cache.misses == 1
+
+def test_result_as_large_as_any_seen_is_not_taken_as_complete():
+    cache = LocationCache(max_entries=10, ttl=60)
+    cache.put("CORDOBA", collection(["CORDOBA 10", "CORDOBA 11"]))
+
+    assert cache.get("CORDOBA 10") is None
+    assert cache.misses == 1
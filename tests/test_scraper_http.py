@@ -0,0 +1,35 @@
+import os
+from app.scraper_http import parse_feature_info, lonlat_to_utm
+from app.singleflight import catastral_key
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def test_parses_geoserver_header_and_value_rows():
+    # GeoServer's default text/html GetFeatureInfo output (content.ftl)
+    with open(os.path.join(FIXTURES, "getfeatureinfo_parcelas.html"), encoding="utf-8") as f:
+        metadata, href = parse_feature_info(f.read())
+
+    assert metadata["Sección"] == "8"
+    assert metadata["Manzana"] == "123"
+    assert metadata["lote"] == "12"
+    assert catastral_key(metadata) == "cat:8-123-12-0"
+    assert href == "/registro-grafico/pdf?seccion=8&manzana=123&grafico=12"
+
+def test_parses_infomapa_key_value_rows():
+    html = """
+    <table class="featureInfo">
+      <tr><td>Sección:</td><td>8</td></tr>
+      <tr><td>Manzana:</td><td>123</td></tr>
+      <tr><td>Gráfico:</td><td>12</td></tr>
+    </table>
+    <a href="/informes/registro?id=1">Registro Gráfico</a>
+    """
+    metadata, href = parse_feature_info(html)
+
+    assert metadata == {"Sección": "8", "Manzana": "123", "Gráfico": "12", "lote": "12"}
+    assert href == "/informes/registro?id=1"
+
+def test_utm_zone_23s():
+    assert lonlat_to_utm(-45, 0) == (500000.0, 10000000.0)
+    easting, northing = lonlat_to_utm(-44, -33)
+    assert abs(easting - 593417.778) < 0.01 and abs(northing - 6348269.026) < 0.01
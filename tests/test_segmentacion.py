@@ -0,0 +1,31 @@
+import cv2
+import numpy as np
+import pytest
+
+from segmentacion.benchmark_segmentacion import recortes_por_lote
+from segmentacion.create_test_image import create_test_image
+from segmentacion.extractor_lotes import detectar_lotes, recortar_lotes
+
+# Fracción de píxeles distintos admitida frente a la implementación original
+TOLERANCIA = 0.0
+
+@pytest.fixture(scope="module")
+def plano(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plano") / "test_map.png")
+    create_test_image(path)
+    img = cv2.imread(path)
+    lotes = detectar_lotes(img)
+    assert lotes, "el plano de prueba debería tener lotes"
+    return img, lotes
+
+@pytest.mark.parametrize("batch_masks", [False, True])
+def test_recortar_lotes_igual_a_la_referencia(plano, batch_masks):
+    img, lotes = plano
+    referencia = recortes_por_lote(img, lotes)
+    recortes = recortar_lotes(img, lotes, batch_masks=batch_masks)
+
+    assert len(recortes) == len(referencia)
+    for recorte, esperado in zip(recortes, referencia):
+        assert recorte.shape == esperado.shape
+        distintos = np.count_nonzero(np.any(recorte != esperado, axis=-1))
+        assert distintos <= TOLERANCIA * esperado.shape[0] * esperado.shape[1]